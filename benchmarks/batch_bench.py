@@ -0,0 +1,41 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import time
+
+from pyrstar import rtree
+from pyrstar import rectangle as rct
+
+#------------------Per-query loops vs batched queries--------------------------#
+
+# Usage: python benchmarks/batch_bench.py [n_points] [n_queries]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+rng = random.Random(0)
+
+pts = [(i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)]) for i in range(n_points)]
+cursor = rtree.RTCursor.bulk_load(pts)
+
+windows = []
+for _ in range(n_queries):
+    x, y = rng.uniform(-64, 64), rng.uniform(-64, 64)
+    windows.append(rct.Rectangle([x, y], [x + 4, y + 4]))
+probes = [[rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)] for _ in range(n_queries)]
+
+
+def timed(label, f):
+    start = time.perf_counter()
+    f()
+    seconds = time.perf_counter() - start
+    print(f"{label:<28} {seconds:8.3f}s  {n_queries / seconds:10.0f} queries/s")
+
+
+print(f"{n_points} points, {n_queries} queries")
+timed("search (loop)", lambda: [cursor.search(w) for w in windows])
+timed("search_many", lambda: cursor.search_many(windows))
+timed("nearest k=10 (loop)", lambda: [cursor.nearest(P, 10) for P in probes])
+timed("nearest_many k=10", lambda: cursor.nearest_many(probes, 10))
@@ -0,0 +1,71 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import time
+
+from pyrstar import rtree
+from pyrstar import rectangle as rct
+
+#------------------Build time: insertion policies vs bulk loading--------------#
+
+# Usage: python benchmarks/build_bench.py [n_incremental] [n_bulk]
+
+n_incremental = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+n_bulk = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+rng = random.Random(0)
+
+
+def random_points(n, d=2):
+    return [(i, [rng.gauss(0.0, 32.0) for _ in range(d)]) for i in range(n)]
+
+
+def leaf_utilization(rt):
+    leaves = []
+    stack = [rt]
+    while stack:
+        t = stack.pop()
+        if t.is_leaf:
+            leaves.append(t.get_point_count())
+        else:
+            stack.extend(t.children)
+    return sum(leaves) / (len(leaves) * rtree.M)
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+def report(label, cursor, seconds, n):
+    print(f"{label:<24} n={n:<8} build {seconds:8.3f}s  "
+    f"{n / seconds:10.0f} pts/s  height {rtree.node_height(cursor.root)}  "
+    f"leaf fill {leaf_utilization(cursor.root):.1%}")
+
+
+def query_cost(cursor, n_queries=200):
+    windows = []
+    for _ in range(n_queries):
+        x, y = rng.uniform(-64, 64), rng.uniform(-64, 64)
+        windows.append(rct.Rectangle([x, y], [x + 8, y + 8]))
+    start = time.perf_counter()
+    for w in windows:
+        cursor.count(w)
+    return (time.perf_counter() - start) / n_queries
+
+
+pts = random_points(n_incremental)
+for policy in rtree.SPLIT_POLICIES:
+    cursor, seconds = timed(lambda: rtree.create_tree_from_pts(pts, policy=policy))
+    report(f"incremental({policy})", cursor, seconds, n_incremental)
+    print(f"{'':<24} window query {query_cost(cursor) * 1e6:8.1f} us")
+
+for method in rtree.BULK_LOAD_METHODS:
+    for n in (n_incremental, n_bulk):
+        pts = random_points(n)
+        cursor, seconds = timed(rtree.RTCursor.bulk_load, pts, method)
+        report(f"bulk_load({method})", cursor, seconds, n)
+        print(f"{'':<24} window query {query_cost(cursor) * 1e6:8.1f} us")
@@ -0,0 +1,61 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import threading
+import time
+
+from pyrstar import concurrency
+from pyrstar import rectangle as rct
+
+#------------------Mixed load: reader threads querying while one thread inserts#
+
+# Usage: python benchmarks/concurrency_bench.py [n_points] [seconds]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+
+rng = random.Random(0)
+pts = [(i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)]) for i in range(n_points)]
+extra = [(n_points + i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)])
+for i in range(100000)]
+
+
+def run(n_readers, writing):
+    cursor = concurrency.ConcurrentRTCursor.bulk_load(pts)
+    stop = threading.Event()
+    counts = [0] * (n_readers + 1)
+
+    def read(k):
+        rng = random.Random(k)
+        while not stop.is_set():
+            x, y = rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)
+            cursor.search(rct.Rectangle([x - 2, y - 2], [x + 2, y + 2]))
+            counts[k] += 1
+
+    def write():
+        for pt in extra:
+            if stop.is_set():
+                break
+            cursor.insert(pt)
+            counts[n_readers] += 1
+
+    threads = [threading.Thread(target=read, args=(k,)) for k in range(n_readers)]
+    if writing:
+        threads.append(threading.Thread(target=write))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(counts[:n_readers]) / seconds, counts[n_readers] / seconds
+
+
+print(f"{n_points} points, {seconds}s per run")
+for n_readers, writing in [(1, False), (4, False), (0, True), (1, True),
+(4, True), (8, True)]:
+    queries, inserts = run(n_readers, writing)
+    print(f"{n_readers} readers{' + writer' if writing else '         '}  "
+    f"{queries:10.0f} queries/s  {inserts:8.0f} inserts/s")
@@ -0,0 +1,57 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import time
+
+from pyrstar import rtree
+
+#------------------Copy-on-write: insert cost while snapshots are alive--------#
+
+# Usage: python benchmarks/cow_bench.py [n_points] [n_inserts]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+n_inserts = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+rng = random.Random(0)
+pts = [(i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)]) for i in range(n_points)]
+extra = [(n_points + i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)])
+for i in range(n_inserts)]
+
+
+def count_nodes(rt):
+    stack, seen = [rt], set()
+    while stack:
+        t = stack.pop()
+        if id(t) not in seen:
+            seen.add(id(t))
+            stack.extend(t.children)
+    return seen
+
+
+def run(snapshot_every):
+    """
+    Inserts extra, taking a snapshot every snapshot_every inserts (never if
+    None) and keeping them all. Returns the elapsed time and the number of
+    nodes created for the snapshots.
+    """
+    cursor = rtree.RTCursor.bulk_load(pts)
+    snaps = [cursor.snapshot()] if snapshot_every else []
+    start = time.perf_counter()
+    for k, pt in enumerate(extra, 1):
+        cursor.insert(pt)
+        if snapshot_every and k % snapshot_every == 0:
+            snaps.append(cursor.snapshot())
+    elapsed = time.perf_counter() - start
+    live = count_nodes(cursor.root)
+    kept = set().union(*(count_nodes(snap.root) for snap in snaps)) - live
+    return elapsed, len(live), len(kept)
+
+
+print(f"{n_points} points, {n_inserts} inserts")
+for every in [None, n_inserts, 1000, 100, 10]:
+    elapsed, live, kept = run(every)
+    label = "no snapshot" if every is None else f"snapshot every {every}"
+    print(f"{label:22s} {n_inserts / elapsed:9.0f} inserts/s  "
+    f"{live:7d} live nodes  {kept:7d} kept for snapshots")
@@ -0,0 +1,50 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import time
+
+from pyrstar import rtree
+from pyrstar import rectangle as rct
+
+#------------------Insert throughput and query cost across fanouts-------------#
+
+# Usage: python benchmarks/fanout_bench.py [n_points] [fanouts...]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+fanouts = [int(x) for x in sys.argv[2:]] or [8, 16, 32, 64, 128]
+
+rng = random.Random(0)
+pts = [(i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)]) for i in range(n_points)]
+
+windows = []
+for _ in range(500):
+    x, y = rng.uniform(-64, 64), rng.uniform(-64, 64)
+    windows.append(rct.Rectangle([x, y], [x + 8, y + 8]))
+probes = [[rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)] for _ in range(500)]
+
+
+def per_call(f, args):
+    start = time.perf_counter()
+    for a in args:
+        f(a)
+    return (time.perf_counter() - start) / len(args)
+
+
+print(f"{n_points} points")
+print(f"{'M':>5} {'insert pts/s':>13} {'height':>7} {'window us':>10} "
+f"{'10-NN us':>9} {'bulk window us':>15}")
+for M in fanouts:
+    start = time.perf_counter()
+    cursor = rtree.create_tree_from_pts(pts, M=M)
+    insert_rate = n_points / (time.perf_counter() - start)
+
+    window_cost = per_call(cursor.count, windows)
+    knn_cost = per_call(lambda P: cursor.nearest(P, 10), probes)
+
+    packed = rtree.RTCursor.bulk_load(pts, M=M)
+    packed_cost = per_call(packed.count, windows)
+
+    print(f"{M:>5} {insert_rate:>13.0f} {cursor.root.height:>7} "
+    f"{window_cost * 1e6:>10.1f} {knn_cost * 1e6:>9.1f} {packed_cost * 1e6:>15.1f}")
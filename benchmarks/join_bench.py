@@ -0,0 +1,46 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import time
+
+from pyrstar import rectangle as rct
+from pyrstar import rtree
+
+#------------------Distance join: synchronized traversal vs a query per point--#
+
+# Usage: python benchmarks/join_bench.py [n_a] [n_b]
+
+n_a = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+n_b = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+rng = random.Random(0)
+pts_a = [(i, [rng.uniform(0.0, 1000.0), rng.uniform(0.0, 1000.0)]) for i in range(n_a)]
+pts_b = [(i, [rng.uniform(0.0, 1000.0), rng.uniform(0.0, 1000.0)]) for i in range(n_b)]
+cursor_a = rtree.RTCursor.bulk_load(pts_a)
+cursor_b = rtree.RTCursor.bulk_load(pts_b)
+
+
+def query_per_point(eps):
+    pairs = []
+    for a, P in pts_a:
+        window = rct.Rectangle([x - eps for x in P], [x + eps for x in P])
+        pairs.extend((a, b) for b, Q in cursor_b.search(window)
+        if rtree.point_distance_squared(P, Q) <= eps * eps)
+    return pairs
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+print(f"{n_a} x {n_b} points")
+for eps in [0.5, 2.0, 5.0]:
+    joined, join_time = timed(rtree.spatial_join, cursor_a, cursor_b, "within", eps)
+    queried, query_time = timed(query_per_point, eps)
+    assert sorted(joined) == sorted(queried)
+    print(f"eps {eps:4.1f}  {len(joined):7d} pairs  spatial_join {join_time:6.2f}s  "
+    f"query per point {query_time:6.2f}s")
@@ -0,0 +1,58 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import tempfile
+import time
+
+from pyrstar import pagefile
+from pyrstar import rectangle as rct
+from pyrstar import rtree
+
+#------------------Process start: rebuild from points vs open a page file------#
+
+# Usage: python benchmarks/pagefile_bench.py [n_points]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+rng = random.Random(0)
+pts = [(i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)]) for i in range(n_points)]
+window = rct.Rectangle([-4.0, -4.0], [4.0, 4.0])
+
+start = time.perf_counter()
+cursor = rtree.RTCursor.bulk_load(pts)
+build = time.perf_counter() - start
+expected = cursor.count(window)
+
+with tempfile.TemporaryDirectory() as tmpdir:
+    path = os.path.join(tmpdir, "tree.pages")
+    start = time.perf_counter()
+    pages = pagefile.write_tree(cursor, path)
+    write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    paged = pagefile.PagedTree(path)
+    opened = time.perf_counter() - start
+    start = time.perf_counter()
+    found = paged.count(window)
+    first_query = time.perf_counter() - start
+    assert found == expected
+
+    start = time.perf_counter()
+    for _ in range(100):
+        paged.count(window)
+    paged_query = (time.perf_counter() - start) / 100
+    start = time.perf_counter()
+    for _ in range(100):
+        cursor.count(window)
+    memory_query = (time.perf_counter() - start) / 100
+    paged.close()
+
+print(f"{n_points} points, {pages} pages of {pagefile.PAGE_SIZE} bytes")
+print(f"bulk load        {build * 1e3:10.1f}ms")
+print(f"write page file  {write * 1e3:10.1f}ms")
+print(f"open page file   {opened * 1e3:10.3f}ms")
+print(f"first query      {first_query * 1e3:10.3f}ms  ({found} points)")
+print(f"query, paged     {paged_query * 1e6:10.1f}us")
+print(f"query, in memory {memory_query * 1e6:10.1f}us")
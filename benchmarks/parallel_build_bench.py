@@ -0,0 +1,45 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import time
+
+from pyrstar import parallel
+from pyrstar import rectangle as rct
+from pyrstar import rtree
+
+#------------------Bulk loading: one process vs a pool of workers--------------#
+
+# Usage: python benchmarks/parallel_build_bench.py [n_points] [max_workers ...]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+worker_counts = [int(a) for a in sys.argv[2:]] or [2, 4, 8]
+
+rng = random.Random(0)
+pts = [(i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)]) for i in range(n_points)]
+windows = []
+for _ in range(2000):
+    x, y = rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)
+    windows.append(rct.Rectangle([x - 2, y - 2], [x + 2, y + 2]))
+
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    result = f(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def query_time(cursor):
+    _, elapsed = timed(lambda: [cursor.search(w) for w in windows])
+    return elapsed
+
+
+print(f"{n_points} points, {os.cpu_count()} processors")
+cursor, build = timed(rtree.RTCursor.bulk_load, pts)
+print(f"bulk_load             build {build:7.2f}s  {len(windows)} queries "
+f"{query_time(cursor):6.2f}s")
+for workers in worker_counts:
+    cursor, build = timed(parallel.parallel_bulk_load, pts, max_workers=workers)
+    print(f"parallel, {workers:2d} workers  build {build:7.2f}s  {len(windows)} queries "
+    f"{query_time(cursor):6.2f}s")
@@ -0,0 +1,51 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import time
+
+from pyrstar import parallel
+from pyrstar import rectangle as rct
+from pyrstar import rtree
+
+#------------------Window queries: one process vs a pool of workers------------#
+
+# Usage: python benchmarks/parallel_search_bench.py [n_points] [max_workers]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+rng = random.Random(0)
+pts = [(i, [rng.uniform(0.0, 100.0), rng.uniform(0.0, 100.0)]) for i in range(n_points)]
+cursor = rtree.RTCursor.bulk_load(pts)
+
+# large, thin and small windows
+windows = [rct.Rectangle([10, 10], [80, 80]), rct.Rectangle([10, 0], [10.5, 100]),
+rct.Rectangle([40, 40], [42, 42])]
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+print(f"{n_points} points, {os.cpu_count()} processors, {max_workers} workers")
+with parallel.ParallelSearcher(cursor, max_workers, threshold=0) as searcher:
+    # starts the workers
+    searcher.search_arrays(windows[0])
+    for window in windows:
+        (leaves, partial), _ = timed(searcher.plan, window)
+        result, memory = timed(cursor.search, window)
+        _, paged = timed(searcher.tree.search, window)
+        searcher.threshold = float("inf")
+        _, local = timed(searcher.search_arrays, window)
+        _, local_pairs = timed(searcher.search, window)
+        searcher.threshold = 0
+        _, split = timed(searcher.search_arrays, window)
+        _, split_pairs = timed(searcher.search, window)
+        print(f"{len(result):7d} results, {partial:6d} tested one by one")
+        print(f"  RTCursor.search {memory * 1e3:8.1f}ms  PagedTree.search {paged * 1e3:8.1f}ms")
+        print(f"  in process      arrays {local * 1e3:8.1f}ms  pairs {local_pairs * 1e3:8.1f}ms")
+        print(f"  split           arrays {split * 1e3:8.1f}ms  pairs {split_pairs * 1e3:8.1f}ms")
@@ -0,0 +1,36 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import pickle
+import random
+import time
+
+from pyrstar import rtree
+
+#------------------Snapshots: flat arrays vs object-by-object pickling---------#
+
+# Usage: python benchmarks/snapshot_bench.py [n_points]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+rng = random.Random(0)
+pts = [(i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)]) for i in range(n_points)]
+cursor = rtree.RTCursor.bulk_load(pts)
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+print(f"{n_points} points")
+data, dump = timed(cursor.to_bytes)
+_, load = timed(rtree.RTCursor.from_bytes, data)
+print(f"to_bytes   {len(data) / 1e6:8.2f}MB  dump {dump * 1e3:8.1f}ms  "
+f"load {load * 1e3:8.1f}ms")
+data, dump = timed(pickle.dumps, cursor, pickle.HIGHEST_PROTOCOL)
+_, load = timed(pickle.loads, data)
+print(f"pickle     {len(data) / 1e6:8.2f}MB  dump {dump * 1e3:8.1f}ms  "
+f"load {load * 1e3:8.1f}ms")
@@ -0,0 +1,79 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import time
+import tracemalloc
+
+from pyrstar import rectangle as rct
+from pyrstar import rtree
+from pyrstar import storage
+
+#------------------Disk-backed trees: buffer pool size vs hit rate-------------#
+
+# Usage: python benchmarks/storage_bench.py [n_points] [n_queries]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+def make_points():
+    rng = random.Random(0)
+    return [(i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)]) for i in range(n_points)]
+
+
+rng = random.Random(1)
+queries = [[rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)] for _ in range(n_queries)]
+windows = [rct.Rectangle([x - 2, y - 2], [x + 2, y + 2]) for x, y in queries]
+extra = [(n_points + i, q) for i, q in enumerate(queries)]
+
+
+def workload(cursor):
+    """
+    Runs the window queries, inserts extra and deletes it again. Returns the
+    mean times of a query, an insert and a delete.
+    """
+    times = []
+    for op, args in [(cursor.search, [(w,) for w in windows]),
+    (cursor.insert, [(pt,) for pt in extra]), (cursor.delete, extra)]:
+        start = time.perf_counter()
+        for a in args:
+            op(*a)
+        times.append((time.perf_counter() - start) / n_queries)
+    return times
+
+
+def run(build):
+    """
+    Returns the memory held after build() and the workload, traced in a run
+    of its own, and the mean times of the workload's operations
+    """
+    tracemalloc.start()
+    cursor = build()
+    workload(cursor)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del cursor
+    return (memory,) + tuple(workload(build()))
+
+
+print(f"{n_points} points, {n_queries} window queries, inserts and deletes")
+memory, query, insert, delete = run(lambda: rtree.RTCursor.bulk_load(make_points()))
+print(f"{'in memory':<12} {memory / 1e6:8.1f}MB  query {query * 1e6:8.1f}us  "
+f"insert {insert * 1e6:8.1f}us  delete {delete * 1e6:8.1f}us")
+
+for size in (64, 512, 4096):
+    stores = []
+
+    def build():
+        stores.append(storage.NodeStore(pool_size=size))
+        return stores[-1].bulk_load(make_points())
+
+    memory, query, insert, delete = run(build)
+    pool = stores[-1].pool
+    hit_rate = pool.hits / (pool.hits + pool.misses)
+    print(f"pool {size:<7} {memory / 1e6:8.1f}MB  query {query * 1e6:8.1f}us  "
+    f"insert {insert * 1e6:8.1f}us  delete {delete * 1e6:8.1f}us  "
+    f"hit rate {hit_rate:6.1%}  writes {pool.writes}")
+    for store in stores:
+        store.close()
@@ -0,0 +1,37 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import time
+
+from pyrstar import rtree
+
+#------------------Moving objects: move (delete + insert) vs update------------#
+
+# Usage: python benchmarks/update_bench.py [n_points] [n_updates] [step]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+n_updates = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+step = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+
+rng = random.Random(0)
+pts = [(i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)]) for i in range(n_points)]
+
+print(f"{n_points} points, {n_updates} updates of up to {step} per axis")
+for method in ("move", "update"):
+    cursor = rtree.RTCursor.bulk_load(pts)
+    current = dict(pts)
+    steps = random.Random(1)
+    in_place = 0
+
+    start = time.perf_counter()
+    for _ in range(n_updates):
+        i = steps.randrange(n_points)
+        P = [x + steps.uniform(-step, step) for x in current[i]]
+        in_place += bool(getattr(cursor, method)(i, P))
+        current[i] = P
+    seconds = time.perf_counter() - start
+
+    print(f"{method:<8} {seconds:8.3f}s  {n_updates / seconds:10.0f} updates/s  "
+    f"in place {in_place}")
@@ -0,0 +1,47 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import tempfile
+import time
+
+from pyrstar import wal
+
+#------------------Write-ahead log: group commit size and recovery time--------#
+
+# Usage: python benchmarks/wal_bench.py [n_points] [tail]
+
+n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+tail = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+rng = random.Random(0)
+pts = [(i, [rng.gauss(0.0, 32.0), rng.gauss(0.0, 32.0)]) for i in range(n_points)]
+
+for size in (1, 64, 1024):
+    # one fsync per insert is slow on real disks; keep that run short
+    n = min(n_points, 2000) if size == 1 else n_points
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with wal.DurableIndex(tmpdir, batch_size=size) as index:
+            start = time.perf_counter()
+            for pt in pts[:n]:
+                index.insert(pt)
+            index.commit()
+            seconds = time.perf_counter() - start
+        print(f"batch {size:<6} {n / seconds:10.0f} inserts/s  {index.log.syncs} fsyncs")
+
+for checkpoint in (False, True):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with wal.DurableIndex(tmpdir, batch_size=1024) as index:
+            for pt in pts[:n_points - tail]:
+                index.insert(pt)
+            if checkpoint:
+                index.checkpoint()
+            for pt in pts[n_points - tail:]:
+                index.insert(pt)
+        start = time.perf_counter()
+        with wal.DurableIndex(tmpdir) as index:
+            seconds = time.perf_counter() - start
+            label = "snapshot + tail" if checkpoint else "full log"
+            print(f"recover {label:<16} {seconds * 1e3:8.1f}ms  "
+            f"{index.replayed} records replayed")
@@ -0,0 +1,194 @@
+"""
+Concurrent access to an R*-tree: any number of threads querying while one
+thread at a time changes the tree.
+
+ConcurrentRTCursor is an RTCursor whose queries hold the read side of a
+ReadWriteLock and whose changes hold the write side, so a query never sees a
+split, reinsertion or root change half done. The lock is phase-fair: a
+waiting writer goes ahead of readers arriving after it, and the readers
+already waiting when a writer finishes go ahead of the next writer, so
+neither a stream of queries nor a stream of inserts starves the other.
+"""
+import contextlib
+import itertools
+import threading
+
+from pyrstar import rtree as rtr
+
+
+class ReadWriteLock:
+    def __init__(self):
+        """
+        Lock shared by readers and exclusive to a single writer
+        -------------------------------------------------------
+        Both sides are reentrant, and the writer may also take the read side.
+        A reader may not take the write side: acquire_write raises
+        RuntimeError rather than deadlock.
+        """
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._waiting_readers = 0
+        # readers let in ahead of waiting writers when a writer finished
+        self._admitted = 0
+        # read depth of the current thread
+        self._local = threading.local()
+
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        depth = getattr(self._local, "depth", 0)
+        if depth:
+            self._local.depth = depth + 1
+            return
+        with self._cond:
+            self._waiting_readers += 1
+            try:
+                while self._writer is not None or (self._waiting_writers
+                and not self._admitted):
+                    self._cond.wait()
+            finally:
+                self._waiting_readers -= 1
+            if self._admitted:
+                self._admitted -= 1
+            self._readers += 1
+        self._local.depth = 1
+
+
+    def release_read(self):
+        if self._writer == threading.get_ident():
+            self._write_depth -= 1
+            return
+        self._local.depth -= 1
+        if self._local.depth:
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        if getattr(self._local, "depth", 0):
+            raise RuntimeError("cannot take the write lock while holding the read lock")
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers or self._admitted:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+
+
+    def release_write(self):
+        self._write_depth -= 1
+        if self._write_depth:
+            return
+        with self._cond:
+            self._writer = None
+            self._admitted = self._waiting_readers
+            self._cond.notify_all()
+
+
+    @contextlib.contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+
+    @contextlib.contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def _reading(method):
+    def locked(self, *args, **kwargs):
+        with self.lock.read_locked():
+            return method(self, *args, **kwargs)
+    locked.__name__ = method.__name__
+    locked.__doc__ = method.__doc__
+    return locked
+
+
+def _writing(method):
+    def locked(self, *args, **kwargs):
+        with self.lock.write_locked():
+            return method(self, *args, **kwargs)
+    locked.__name__ = method.__name__
+    locked.__doc__ = method.__doc__
+    return locked
+
+
+class ConcurrentRTCursor(rtr.RTCursor):
+    """
+    RTCursor safe to share between threads: queries run concurrently under
+    the read side of lock, changes one at a time under its write side.
+    Parameters are as for RTCursor. Hold lock.read_locked() around several
+    queries that must see the same tree, or query a snapshot(), which needs
+    no lock and holds up no writer.
+    """
+    def __init__(self, *args, **kwargs):
+        self.lock = ReadWriteLock()
+        # snapshots are taken under the read lock, one at a time
+        self._snapshot_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+
+    insert = _writing(rtr.RTCursor.insert)
+    delete = _writing(rtr.RTCursor.delete)
+    move = _writing(rtr.RTCursor.move)
+    update = _writing(rtr.RTCursor.update)
+    reorganize = _writing(rtr.RTCursor.reorganize)
+
+    locate = _reading(rtr.RTCursor.locate)
+    search = _reading(rtr.RTCursor.search)
+    count = _reading(rtr.RTCursor.count)
+    search_many = _reading(rtr.RTCursor.search_many)
+    nearest_many = _reading(rtr.RTCursor.nearest_many)
+    to_bytes = _reading(rtr.RTCursor.to_bytes)
+
+
+    def nearest(self, point, k=1):
+        """
+        RTCursor.nearest, under the read lock
+        """
+        with self.lock.read_locked():
+            if k <= 0:
+                return []
+            return list(itertools.islice(rtr.RTCursor.iter_nearest(self, point), k))
+
+
+    def snapshot(self):
+        """
+        RTCursor.snapshot, under the read lock: taking a snapshot changes no
+        node, so it need not wait for queries to finish
+        """
+        with self.lock.read_locked(), self._snapshot_lock:
+            return rtr.RTCursor.snapshot(self)
+
+
+    def iter_nearest(self, point):
+        """
+        RTCursor.iter_nearest over a snapshot taken when it is called. The
+        iterator holds no lock, so it may be consumed, closed or dropped on
+        any thread while writers go on; it does not see their changes.
+        """
+        return self.snapshot().iter_nearest(point)
@@ -0,0 +1,83 @@
+"""
+Space-filling curve keys for points in d dimensions. Coordinates are first
+quantized onto a grid of 2**bits cells per axis.
+"""
+
+
+def quantize(point, lower, upper, bits):
+    """
+    Map point into integer grid coordinates
+    ---------------------------------------
+    Parameters:
+    -----------
+    point: coordinates to map
+    lower, upper: bounds of the region being gridded
+    bits: grid resolution, 2**bits cells per axis
+
+    Returns:
+    --------
+    cell: list of ints in [0, 2**bits - 1]
+    """
+    top = (1 << bits) - 1
+    cell = []
+    for i in range(0, len(point)):
+        extent = upper[i] - lower[i]
+        if extent <= 0:
+            cell.append(0)
+        else:
+            c = int((point[i] - lower[i]) / extent * top)
+            cell.append(min(max(c, 0), top))
+    return cell
+
+
+def morton_index(cell, bits):
+    """
+    Z-order (Morton) index of a grid cell: the bits of its coordinates
+    interleaved, most significant first.
+    """
+    h = 0
+    for b in range(bits - 1, -1, -1):
+        for x in cell:
+            h = (h << 1) | ((x >> b) & 1)
+    return h
+
+
+def hilbert_index(cell, bits):
+    """
+    Hilbert index of a grid cell in any dimension. Consecutive indices are
+    adjacent cells.
+
+    Follows Skilling, "Programming the Hilbert curve" (AIP Conf. Proc. 707,
+    2004): the coordinates are transformed in place into the transposed
+    Hilbert index, whose bits are then interleaved.
+    """
+    X = list(cell)
+    n = len(X)
+    top_bit = 1 << (bits - 1)
+
+    # inverse undo excess work
+    Q = top_bit
+    while Q > 1:
+        P = Q - 1
+        for i in range(0, n):
+            if X[i] & Q:
+                X[0] ^= P
+            else:
+                t = (X[0] ^ X[i]) & P
+                X[0] ^= t
+                X[i] ^= t
+        Q >>= 1
+
+    # Gray encode
+    for i in range(1, n):
+        X[i] ^= X[i-1]
+    t = 0
+    Q = top_bit
+    while Q > 1:
+        if X[n-1] & Q:
+            t ^= Q - 1
+        Q >>= 1
+    for i in range(0, n):
+        X[i] ^= t
+
+    return morton_index(X, bits)
@@ -0,0 +1,372 @@
+"""
+On-disk page format for R*-trees. write_tree stores the tree held by an
+RTCursor in a file of fixed-size pages, one node per page; PagedTree opens
+such a file through a read-only memory map and decodes nodes only when a query
+reaches them. Opening costs a single header read whatever the size of the
+index, and processes opening the same file share its pages through the OS
+page cache.
+
+Layout (all values little-endian):
+
+page 0: file header (HEADER)
+page i >= 1: one node, the root at page 1 and the rest in breadth-first order
+so that the upper levels sit together at the start of the file.
+
+A node page holds NODE_HEADER (is_leaf, entry count n, height) followed by
+- leaf: n*d float64 point coordinates, then n int64 point ids
+- inner node: n*d float64 key minima, n*d float64 key maxima, then n int64
+  child page numbers
+
+Point ids must be integers representable in 64 bits.
+"""
+import heapq
+import itertools
+import mmap
+import os
+import struct
+
+from pyrstar import rectangle as rct
+from pyrstar import rtree as rtr
+
+
+MAGIC = b"PYRSTAR\x00"
+VERSION = 1
+
+# magic, version, page size, dimension, M, m, p, policy, root page, page
+# count, point count. The root key follows as 2*d float64 (minima, maxima).
+HEADER = struct.Struct("<8sIIIIII16sQQQ")
+
+# is_leaf, entry count, height
+NODE_HEADER = struct.Struct("<BxHI")
+
+# Default page size; larger nodes get the next multiple that fits them
+PAGE_SIZE = 4096
+
+
+def node_page_bytes(n, d, is_leaf):
+    """
+    Bytes needed by a node page holding n entries in d dimensions
+    """
+    per_entry = 8 * d + 8 if is_leaf else 16 * d + 8
+    return NODE_HEADER.size + n * per_entry
+
+
+def write_tree(cursor, path, page_size=None):
+    """
+    Store a tree in a page file
+    ---------------------------
+    Parameters:
+    -----------
+    cursor: RTCursor holding the tree. Its parameters and policy are stored
+    alongside, so that PagedTree.load gives back an equivalent cursor.
+    path: file to write. It is replaced atomically once fully written.
+    page_size: bytes per page. Defaults to PAGE_SIZE, or the smallest
+    multiple of it that holds the fullest node of the tree.
+
+    Returns:
+    --------
+    page_count: number of pages written, header page included
+    """
+    root = cursor.root
+    nodes = [] if root.is_null else [root]
+    for t in nodes:
+        if not t.is_leaf:
+            nodes.extend(t.children)
+    d = root.key.dimension if nodes else 0
+
+    needed = max([node_page_bytes(t.get_child_count() if not t.is_leaf
+    else t.get_point_count(), d, t.is_leaf) for t in nodes]
+    + [HEADER.size + 16 * d])
+    if page_size is None:
+        page_size = -(-needed // PAGE_SIZE) * PAGE_SIZE
+    elif page_size < needed:
+        raise ValueError(f"page size {page_size} cannot hold a node of {needed} bytes")
+
+    page_of = {id(t): i for i, t in enumerate(nodes, 1)}
+    policy = cursor.policy.encode("ascii")
+
+    tmp_path = os.fspath(path) + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            # the header, which holds the point count, is written last
+            f.seek(page_size)
+            point_count = 0
+            for t in nodes:
+                page = bytearray(page_size)
+                if t.is_leaf:
+                    pack_leaf(page, t.points, t.height, d)
+                    point_count += t.get_point_count()
+                else:
+                    pack_node(page, t.get_child_rectangles(),
+                    [page_of[id(ch)] for ch in t.children], t.height, d)
+                f.write(page)
+
+            page = bytearray(page_size)
+            HEADER.pack_into(page, 0, MAGIC, VERSION, page_size, d, cursor.M,
+            cursor.m, cursor.p, policy, 1 if nodes else 0, len(nodes) + 1,
+            point_count)
+            if nodes:
+                struct.pack_into(f"<{2 * d}d", page, HEADER.size,
+                *root.key.minima, *root.key.maxima)
+            f.seek(0)
+            f.write(page)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return len(nodes) + 1
+
+
+def pack_leaf(page, points, height, d):
+    """
+    Write a leaf holding points, a dict of point ids to coordinates, into the
+    bytearray page
+    """
+    n = len(points)
+    NODE_HEADER.pack_into(page, 0, 1, n, height)
+    offset = NODE_HEADER.size
+    coords = [x for P in points.values() for x in P]
+    struct.pack_into(f"<{n * d}d", page, offset, *coords)
+    try:
+        struct.pack_into(f"<{n}q", page, offset + 8 * n * d, *points)
+    except struct.error:
+        raise ValueError("page files need 64-bit integer point ids") from None
+
+
+def pack_node(page, keys, pages, height, d):
+    """
+    Write an inner node with child keys and child page numbers pages into the
+    bytearray page
+    """
+    n = len(keys)
+    NODE_HEADER.pack_into(page, 0, 0, n, height)
+    offset = NODE_HEADER.size
+    lower = [x for key in keys for x in key.minima]
+    upper = [x for key in keys for x in key.maxima]
+    struct.pack_into(f"<{n * d}d", page, offset, *lower)
+    struct.pack_into(f"<{n * d}d", page, offset + 8 * n * d, *upper)
+    struct.pack_into(f"<{n}q", page, offset + 16 * n * d, *pages)
+
+
+def unpack_node(buf, offset, d):
+    """
+    Decode the node page starting at offset in buf
+
+    Returns:
+    --------
+    t: a PageNode. Its page is left as None.
+    """
+    is_leaf, n, height = NODE_HEADER.unpack_from(buf, offset)
+    offset += NODE_HEADER.size
+
+    t = PageNode()
+    t.page = None
+    t.is_leaf = bool(is_leaf)
+    t.height = height
+    if is_leaf:
+        coords = struct.unpack_from(f"<{n * d}d", buf, offset)
+        ids = struct.unpack_from(f"<{n}q", buf, offset + 8 * n * d)
+        t.points = [(ids[i], list(coords[i * d:(i + 1) * d])) for i in range(n)]
+        t.keys = t.children = None
+    else:
+        bounds = struct.unpack_from(f"<{2 * n * d}d", buf, offset)
+        upper = n * d
+        t.keys = [rct.Rectangle._from_bounds(list(bounds[i * d:(i + 1) * d]),
+        list(bounds[upper + i * d:upper + (i + 1) * d])) for i in range(n)]
+        t.children = list(struct.unpack_from(f"<{n}q", buf, offset + 16 * n * d))
+        t.points = None
+    return t
+
+
+class PageNode:
+    """
+    A node decoded from its page. Leaves have points, a list of (point id,
+    point) tuples; inner nodes have keys, the child keys as Rectangles, and
+    children, the matching child page numbers.
+    """
+    __slots__ = ("page", "is_leaf", "height", "points", "keys", "children")
+
+
+class PagedTree:
+    def __init__(self, path):
+        """
+        Read-only R*-tree over a page file written by write_tree
+        --------------------------------------------------------
+        Parameters:
+        -----------
+        path: the page file. It is memory mapped, and nodes are decoded from
+        the map as queries reach them; nothing is decoded up front.
+
+        Raises ValueError if path is not a page file of this version.
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC or len(self._map) < HEADER.size:
+            self._map.close()
+            raise ValueError(f"{path} is not a page file")
+        (magic, version, self.page_size, self.dimension, self.M, self.m,
+        self.p, policy, self.root_page, self.page_count,
+        self.point_count) = HEADER.unpack_from(self._map, 0)
+        if version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} has page format version {version}, "
+            f"expected {VERSION}")
+        self.policy = policy.rstrip(b"\x00").decode("ascii")
+
+        d = self.dimension
+        if self.root_page:
+            bounds = struct.unpack_from(f"<{2 * d}d", self._map, HEADER.size)
+            self.key = rct.Rectangle._from_bounds(list(bounds[:d]), list(bounds[d:]))
+        else:
+            self.key = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def close(self):
+        self._map.close()
+
+
+    def __len__(self):
+        return self.point_count
+
+
+    def node(self, page):
+        """
+        Decode the node stored at page
+        """
+        t = unpack_node(self._map, page * self.page_size, self.dimension)
+        t.page = page
+        return t
+
+
+    def entry_count(self, page):
+        """
+        Number of entries of the node at page, read from its header alone
+        """
+        return NODE_HEADER.unpack_from(self._map, page * self.page_size)[1]
+
+
+    def search(self, rect):
+        """
+        Window query, as RTCursor.search
+        """
+        result = []
+        for page, covered in self._leaves_in_window(rect):
+            points = self.node(page).points
+            if covered:
+                result.extend(points)
+            else:
+                result.extend(pt for pt in points if rect.is_element(pt[1]))
+        return result
+
+
+    def count(self, rect):
+        """
+        Number of points lying in rect, as RTCursor.count. Leaves lying
+        entirely within rect are counted from their page headers without
+        being decoded.
+        """
+        d = self.dimension
+        result = 0
+        for page, covered in self._leaves_in_window(rect):
+            if covered:
+                result += self.entry_count(page)
+                continue
+            n = self.entry_count(page)
+            coords = struct.unpack_from(f"<{n * d}d", self._map,
+            page * self.page_size + NODE_HEADER.size)
+            result += sum(1 for i in range(0, n * d, d)
+            if rect.is_element(coords[i:i + d]))
+        return result
+
+
+    def nearest(self, point, k=1):
+        """
+        Best-first k-nearest-neighbor query, as RTCursor.nearest
+        """
+        if k <= 0:
+            return []
+        return list(itertools.islice(self.iter_nearest(point), k))
+
+
+    def iter_nearest(self, point):
+        """
+        Incremental nearest-neighbor query, as RTCursor.iter_nearest. Nodes
+        are decoded when popped, so pages whose bound is never reached are
+        never read.
+        """
+        if not self.root_page:
+            return
+
+        tiebreak = itertools.count()
+        heap = [(rct.point_to_rectangle_distance_squared(point, self.key),
+        next(tiebreak), self.root_page, None)]
+        while heap:
+            dist, _, page, pt = heapq.heappop(heap)
+            if page is None:
+                yield pt
+                continue
+            t = self.node(page)
+            if t.is_leaf:
+                for pt in t.points:
+                    d = rtr.point_distance_squared(point, pt[1])
+                    heapq.heappush(heap, (d, next(tiebreak), None, pt))
+            else:
+                for key, ch in zip(t.keys, t.children):
+                    d = rct.point_to_rectangle_distance_squared(point, key)
+                    heapq.heappush(heap, (d, next(tiebreak), ch, None))
+
+
+    def load(self):
+        """
+        Decode the whole file into an in-memory tree
+
+        Returns:
+        --------
+        cursor: an RTCursor with the stored tree, parameters and policy
+        """
+        if not self.root_page:
+            return rtr.RTCursor(rtr.RStarTree(), self.M, self.m, self.p, self.policy)
+
+        def build(page):
+            t = self.node(page)
+            if t.is_leaf:
+                return rtr.RStarTree(children=[], point_data=dict(t.points))
+            return rtr.RStarTree(children=[build(ch) for ch in t.children])
+
+        return rtr.RTCursor(build(self.root_page), self.M, self.m, self.p,
+        self.policy)
+
+
+    def _leaves_in_window(self, rect):
+        """
+        Yields (leaf page, covered) as RTCursor._leaves_in_window. Only the
+        inner nodes whose keys intersect rect are decoded; leaves are left to
+        the caller.
+        """
+        if not self.root_page or not self.key.intersects(rect):
+            return
+        root_is_leaf = bool(NODE_HEADER.unpack_from(self._map,
+        self.root_page * self.page_size)[0])
+        stack = [(self.root_page, root_is_leaf, rect.is_proper_superset(self.key))]
+        while stack:
+            page, is_leaf, covered = stack.pop()
+            if is_leaf:
+                yield page, covered
+                continue
+            t = self.node(page)
+            children_are_leaves = t.height == 1
+            if covered:
+                stack.extend((ch, children_are_leaves, True) for ch in t.children)
+            else:
+                for key, ch in zip(t.keys, t.children):
+                    if key.intersects(rect):
+                        stack.append((ch, children_are_leaves,
+                        rect.is_proper_superset(key)))
@@ -0,0 +1,361 @@
+"""
+Building and querying R*-trees on several cores.
+
+parallel_bulk_load cuts the points into slabs of about equal size along one
+axis, chosen as choose_split_axis_leaf chooses the axis of a leaf split: the
+one whose slabs have the smallest sum of bounding box margins. Each slab is
+bulk loaded in a worker process up to a common height, and the nodes of that
+height are sent back as flat arrays (see rtree.flatten_tree) and packed under
+common parents as RTCursor.bulk_load packs the nodes of a level.
+
+Cutting the points into slabs and rebuilding the nodes sent back as Python
+objects is left to the calling process, which bounds the speedup.
+
+ParallelSearcher answers window queries on a page file (see pyrstar.pagefile)
+with a pool of processes that open the file themselves and so share its
+pages through the OS page cache. The calling process finds the leaves in the
+window, which only takes decoding inner nodes, and hands runs of them to the
+workers, which send back the matching points as id and coordinate arrays.
+"""
+import bisect
+import concurrent.futures
+import contextlib
+import gc
+import itertools
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from pyrstar import pagefile
+from pyrstar import rectangle as rct
+from pyrstar import rtree as rtr
+
+
+# Default number of points sampled to choose the slabs
+sample_size = 10000
+
+# Slabs per worker process. With more than one, the nodes of the first slabs
+# are rebuilt while the workers still build the others.
+slabs_per_worker = 2
+
+# Default number of points in leaves partly inside a window from which
+# ParallelSearcher splits the query between its workers. Those points are
+# tested one by one, while leaves inside the window are copied whole.
+parallel_threshold = 10000
+
+# Runs of leaves a split query is cut into per worker
+tasks_per_worker = 4
+
+
+def parallel_bulk_load(pts_tuples, method="str", M=None, m=None, p=None,
+policy="rstar", max_workers=None):
+    """
+    RTCursor.bulk_load using a pool of processes
+    --------------------------------------------
+    Parameters:
+    -----------
+    pts_tuples: list of pts as (key,value) tuples
+    method, M, m, p, policy: as for RTCursor.bulk_load
+    max_workers: number of worker processes, each given slabs_per_worker
+    slabs of points. Defaults to the number of processors. Inputs too small
+    to give every slab M leaves are loaded in this process.
+
+    Returns:
+    --------
+    retv: an RTCursor to the instantiated tree
+    """
+    if method not in rtr.BULK_LOAD_METHODS:
+        raise ValueError(f"unknown bulk loading method: {method}")
+    retv = rtr.RTCursor(rtr.RStarTree(), M, m, p, policy)
+    M, m = retv.M, retv.m
+    workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+    parts = workers * slabs_per_worker
+    if workers < 2 or len(pts_tuples) < parts * M * M:
+        return rtr.RTCursor.bulk_load(pts_tuples, method, M, m, p, policy)
+
+    with _gc_paused():
+        axis, cuts = choose_slabs(pts_tuples, parts)
+        slabs = _cut_slabs(pts_tuples, axis, cuts)
+        # many equal coordinates may leave slabs short
+        smallest = min(len(ids) for ids, _ in slabs)
+        if smallest < M * M:
+            return rtr.RTCursor.bulk_load(pts_tuples, method, M, m, p, policy)
+
+        # height of the nodes the workers send back: the highest at which
+        # every slab still fills M nodes
+        height = 0
+        while M ** (height + 3) <= smallest:
+            height += 1
+
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_build_slab, ids, coords, method, M, m, height)
+            for ids, coords in slabs]
+            del slabs
+            level = []
+            for future in futures:
+                level.extend(rtr.build_tree(*future.result()).children)
+
+        order = rtr.BULK_LOAD_METHODS[method]
+        while len(level) > 1:
+            entries = order(level, lambda t: t.key.center(), M)
+            level = [rtr.RStarTree(children=group)
+            for group in rtr.pack_groups(entries, M, m)]
+    level[0].parent = None
+    return rtr.RTCursor(level[0], retv.M, retv.m, retv.p, retv.policy)
+
+
+def choose_slabs(pts_tuples, parts):
+    """
+    Where to cut points into slabs
+    ------------------------------
+    Parameters:
+    -----------
+    pts_tuples: list of pts as (key,value) tuples
+    parts: number of slabs
+
+    Returns:
+    --------
+    axis: the axis minimizing the sum of the margins of the slabs' bounding
+    boxes, the margin criterion of choose_split_axis_leaf
+    cuts: the parts - 1 coordinates along axis separating the slabs, slab k
+    holding the points from cuts[k - 1] (inclusive) to cuts[k]
+
+    Both are estimated on at most sample_size of the points.
+    """
+    step = max(1, len(pts_tuples) // sample_size)
+    sample = [pt[1] for pt in pts_tuples[::step]]
+    d = len(sample[0])
+    bounds = [len(sample) * k // parts for k in range(0, parts + 1)]
+
+    margins = []
+    for i in range(0,d):
+        sorted_by_i = sorted(sample, key = lambda P: P[i])
+        S_i = 0.0
+        for start, end in zip(bounds, bounds[1:]):
+            bb = rct.bounding_box_points(sorted_by_i[start:end])
+            S_i += rct.rectangle_perimeter(bb)
+        cuts = [sorted_by_i[start][i] for start in bounds[1:-1]]
+        margins.append((S_i, i, cuts))
+
+    _, axis, cuts = min(margins)
+    return axis, cuts
+
+
+def _cut_slabs(pts_tuples, axis, cuts):
+    """
+    Returns the ids and coordinates of the points of each non-empty slab as
+    arrays, which pickle far more compactly than the tuples. Ids are an
+    int64 array if they all fit one and a list otherwise.
+    """
+    ids = [[] for _ in range(0, len(cuts) + 1)]
+    points = [[] for _ in range(0, len(cuts) + 1)]
+    for pt in pts_tuples:
+        k = bisect.bisect_right(cuts, pt[1][axis])
+        ids[k].append(pt[0])
+        points[k].append(pt[1])
+
+    slabs = []
+    for slab_ids, slab_points in zip(ids, points):
+        if not slab_ids:
+            continue
+        if all(type(k) is int for k in slab_ids):
+            try:
+                slab_ids = array("q", slab_ids)
+            except OverflowError:
+                pass
+        slabs.append((slab_ids, array("d", itertools.chain.from_iterable(slab_points))))
+    return slabs
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    # building a tree allocates objects by the hundred thousand, none of them
+    # garbage, and collections meanwhile would only rescan them over and
+    # over, doubling the build time
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _build_slab(ids, coords, method, M, m, height):
+    """
+    Worker: bulk load a slab of points up to the nodes of the given height,
+    returned with their keys as the flattened tree of a node holding them
+    all
+    """
+    with _gc_paused():
+        d = len(coords) // len(ids)
+        coords = coords.tolist()
+        if isinstance(ids, array):
+            ids = ids.tolist()
+        entries = list(zip(ids, [coords[j:j + d] for j in range(0, len(coords), d)]))
+
+        order = rtr.BULK_LOAD_METHODS[method]
+        entries = order(entries, lambda pt: pt[1], M)
+        level = [rtr.RStarTree(children=[], point_data=dict(group))
+        for group in rtr.pack_groups(entries, M, m)]
+        for _ in range(0, height):
+            entries = order(level, lambda t: t.key.center(), M)
+            level = [rtr.RStarTree(children=group)
+            for group in rtr.pack_groups(entries, M, m)]
+        return rtr.flatten_tree(rtr.RStarTree(children=level), bounds=True)
+
+
+class ParallelSearcher:
+    def __init__(self, tree, max_workers=None, threshold=None):
+        """
+        Window queries split between worker processes
+        ---------------------------------------------
+        Parameters:
+        -----------
+        tree: path of a page file, or an RTCursor, which is written to a
+        temporary page file for the life of the searcher. Later changes to
+        the cursor are not seen.
+        max_workers: number of worker processes. Defaults to the number of
+        processors.
+        threshold: number of points in leaves partly inside a window from
+        which a query is split between the workers rather than run in this
+        process. Defaults to the module-level parallel_threshold.
+        """
+        if threshold is None:
+            threshold = globals()["parallel_threshold"]
+        self.threshold = threshold
+        self._tmp_path = None
+        if isinstance(tree, rtr.RTCursor):
+            fd, self._tmp_path = tempfile.mkstemp(suffix=".pages")
+            os.close(fd)
+            try:
+                pagefile.write_tree(tree, self._tmp_path)
+            except BaseException:
+                os.remove(self._tmp_path)
+                raise
+            tree = self._tmp_path
+        self.tree = pagefile.PagedTree(tree)
+        self.workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers,
+        initializer=_open_worker_tree, initargs=(tree,))
+        # number of queries split between the workers
+        self.split_queries = 0
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def close(self):
+        self.pool.shutdown()
+        self.tree.close()
+        if self._tmp_path is not None:
+            os.remove(self._tmp_path)
+            self._tmp_path = None
+
+
+    def search(self, rect):
+        """
+        Window query, as RTCursor.search
+        """
+        ids, coords = self.search_arrays(rect)
+        if not ids:
+            return []
+        d = self.tree.dimension
+        with _gc_paused():
+            coords = coords.tolist()
+            return list(zip(ids.tolist(), [coords[j:j + d]
+            for j in range(0, len(coords), d)]))
+
+
+    def search_arrays(self, rect):
+        """
+        Window query returning arrays rather than (id, point) pairs
+        -----------------------------------------------------------
+        Returns:
+        --------
+        ids: int64 array of the ids of the points lying in rect
+        coords: float64 array of their coordinates, point after point. Much
+        cheaper to build than the pairs of search for large results.
+        """
+        leaves, partial = self.plan(rect)
+        if not leaves or partial < self.threshold or self.workers < 2:
+            return _scan_leaves(self.tree, leaves, rect)
+
+        self.split_queries += 1
+        runs = self.workers * tasks_per_worker
+        bounds = [len(leaves) * k // runs for k in range(0, runs + 1)]
+        futures = [self.pool.submit(_scan_task, leaves[start:end], rect)
+        for start, end in zip(bounds, bounds[1:]) if start < end]
+        ids = array("q")
+        coords = array("d")
+        for future in futures:
+            run_ids, run_coords = future.result()
+            ids.extend(run_ids)
+            coords.extend(run_coords)
+        return ids, coords
+
+
+    def plan(self, rect):
+        """
+        Returns the (leaf page, covered) pairs of the leaves intersecting
+        rect, in page order, and the number of points in those only partly
+        inside rect, which the search tests one by one
+        """
+        leaves = sorted(self.tree._leaves_in_window(rect))
+        partial = sum(self.tree.entry_count(page) for page, covered in leaves
+        if not covered)
+        return leaves, partial
+
+
+# page file opened by each worker process of a ParallelSearcher
+_worker_tree = None
+
+
+def _open_worker_tree(path):
+    global _worker_tree
+    _worker_tree = pagefile.PagedTree(path)
+
+
+def _scan_task(leaves, rect):
+    return _scan_leaves(_worker_tree, leaves, rect)
+
+
+def _scan_leaves(tree, leaves, rect):
+    """
+    Returns the ids and coordinates of the points lying in rect in the
+    (page, covered) leaves of tree, as int64 and float64 arrays. Covered
+    leaves are copied from the page bytes without being decoded.
+    """
+    d = tree.dimension
+    buf = tree._map
+    # pages are little-endian; elsewhere every leaf goes through struct
+    copy_pages = sys.byteorder == "little"
+    ids = array("q")
+    coords = array("d")
+    for page, covered in leaves:
+        offset = page * tree.page_size
+        n = pagefile.NODE_HEADER.unpack_from(buf, offset)[1]
+        offset += pagefile.NODE_HEADER.size
+        if covered and copy_pages:
+            coords.frombytes(buf[offset:offset + 8 * n * d])
+            ids.frombytes(buf[offset + 8 * n * d:offset + 8 * n * (d + 1)])
+            continue
+        leaf_coords = struct.unpack_from(f"<{n * d}d", buf, offset)
+        leaf_ids = struct.unpack_from(f"<{n}q", buf, offset + 8 * n * d)
+        if covered:
+            ids.extend(leaf_ids)
+            coords.extend(leaf_coords)
+            continue
+        for i in range(0, n):
+            P = leaf_coords[i * d:(i + 1) * d]
+            if rect.is_element(P):
+                ids.append(leaf_ids[i])
+                coords.extend(P)
+    return ids, coords
@@ -2,6 +2,10 @@
 
 
 class Rectangle:
+    # Rectangles are created by the million during insertion; slots keep
+    # them small and attribute access fast.
+    __slots__ = ("dimension", "minima", "maxima", "is_point")
+
     def __init__(self, minarray, maxarray):
         self.dimension = len(minarray)
         self.minima = minarray
@@ -13,6 +17,20 @@ class Rectangle:
             raise ValueError
 
 
+    @classmethod
+    def _from_bounds(cls, minarray, maxarray):
+        """
+        Unchecked constructor for bounds computed internally. The rectangle
+        takes ownership of both lists, which must be distinct objects.
+        Degenerate (flat) bounds are allowed.
+        """
+        rect = object.__new__(cls)
+        rect.dimension = len(minarray)
+        rect.minima = minarray
+        rect.maxima = maxarray
+        rect.is_point = minarray == maxarray
+        return rect
+
 
     def __eq__(self, other):
         return self.minima == other.minima and self.maxima == other.maxima
@@ -31,6 +49,14 @@ class Rectangle:
             self.is_point = False
 
 
+    def copy(self):
+        """
+        Returns a rectangle with the same bounds that owns its bound lists,
+        and so may be enlarged in place.
+        """
+        return Rectangle._from_bounds(list(self.minima), list(self.maxima))
+
+
     def volume(self):
         if self.is_point:
             return 0.0
@@ -52,19 +78,77 @@ class Rectangle:
         if not are_bounds_rectangular(intersection_minima, intersection_maxima):
             return EmptyRectangle(1)
 
-        return Rectangle(intersection_minima,intersection_maxima)
+        return Rectangle._from_bounds(intersection_minima,intersection_maxima)
 
 
     def intersection_volume(self, other):
-        return (self.intersect(other)).volume()
+        """
+        Volume of intersect(other), computed without building the intersection
+        """
+        vol = 1.0
+        for i in range(0,self.dimension):
+            extent = (min(self.maxima[i],other.maxima[i])
+            - max(self.minima[i],other.minima[i]))
+            if extent <= 0:
+                return 0.0
+            vol *= extent
+        return vol
+
+
+    def union_volume(self, other):
+        """
+        Volume of union(other), computed without building the union
+        """
+        vol = 1.0
+        for i in range(0,self.dimension):
+            vol *= (max(self.maxima[i],other.maxima[i])
+            - min(self.minima[i],other.minima[i]))
+        return vol
+
+
+    def intersects(self, other):
+        """
+        Returns whether self and other share at least one point. Unlike
+        intersect, rectangles that only touch along a boundary count.
+        """
+        for i in range(0,self.dimension):
+            if self.minima[i] > other.maxima[i] or other.minima[i] > self.maxima[i]:
+                return False
+        return True
 
 
     def is_element(self, point):
         """
         Returns whether the point is an element of self
         """
-        return all((self.minima[i] <= point[i] and point[i] <= self.maxima[i])
-        for i in range(0,self.dimension))
+        for i in range(0,self.dimension):
+            if point[i] < self.minima[i] or self.maxima[i] < point[i]:
+                return False
+        return True
+
+
+    def is_on_boundary(self, point):
+        """
+        Returns whether point lies on a bounding hyperplane of self, i.e.
+        whether removing it from a set of points bounded by self may shrink
+        the bounding box
+        """
+        for i in range(0,self.dimension):
+            if point[i] == self.minima[i] or point[i] == self.maxima[i]:
+                return True
+        return False
+
+
+    def shares_boundary(self, other):
+        """
+        Returns whether other reaches a bounding hyperplane of self, i.e.
+        whether removing it from a set of rectangles bounded by self may
+        shrink the bounding box
+        """
+        for i in range(0,self.dimension):
+            if other.minima[i] == self.minima[i] or other.maxima[i] == self.maxima[i]:
+                return True
+        return False
 
 
     def is_proper_superset(self, other):
@@ -75,27 +159,47 @@ class Rectangle:
 
 
     def union(self, other):
-        lower = []
-        upper = []
-        for i in range(0, self.dimension):
-            li = min(self.minima[i],other.minima[i])
-            ui = max(self.maxima[i],other.maxima[i])
-            lower.append(li)
-            upper.append(ui)
-
-        return Rectangle(lower,upper)
+        rect = self.copy()
+        rect.expand(other)
+        return rect
 
 
     def union_with_point(self, point):
-        lower = []
-        upper = []
+        rect = self.copy()
+        rect.expand_with_point(point)
+        return rect
+
+
+    def expand(self, other):
+        """
+        Enlarge self in place to cover other. self must own its bound lists
+        (see copy).
+        """
+        lower = self.minima
+        upper = self.maxima
         for i in range(0, self.dimension):
-            li = min(self.minima[i], point[i])
-            ui = max(self.maxima[i], point[i])
-            lower.append(li)
-            upper.append(ui)
+            if other.minima[i] < lower[i]:
+                lower[i] = other.minima[i]
+            if other.maxima[i] > upper[i]:
+                upper[i] = other.maxima[i]
+        if self.is_point:
+            self.is_point = lower == upper
 
-        return Rectangle(lower,upper)
+
+    def expand_with_point(self, point):
+        """
+        Enlarge self in place to cover point. self must own its bound lists
+        (see copy).
+        """
+        lower = self.minima
+        upper = self.maxima
+        for i in range(0, self.dimension):
+            if point[i] < lower[i]:
+                lower[i] = point[i]
+            elif point[i] > upper[i]:
+                upper[i] = point[i]
+        if self.is_point:
+            self.is_point = lower == upper
 
 
     def center(self):
@@ -127,18 +231,32 @@ def point_to_center_distance_squared(p, rect):
     return s
 
 
+def point_to_rectangle_distance_squared(p, rect):
+    """
+    Squared distance from p to the nearest point of rect (MINDIST). Zero if
+    p lies in rect.
+    """
+    s = 0.0
+    for i in range(0,len(p)):
+        if p[i] < rect.minima[i]:
+            s += (rect.minima[i]-p[i])**2
+        elif p[i] > rect.maxima[i]:
+            s += (p[i]-rect.maxima[i])**2
+    return s
+
+
 def bounding_box(rects):
-    u = rects[0]
+    u = rects[0].copy()
     for i in range(1, len(rects)):
-        u = u.union(rects[i])
+        u.expand(rects[i])
     return u
 
 
 def bounding_box_points(points):
     r_bound = points[0]
-    rect = Rectangle(r_bound, r_bound)
+    rect = Rectangle._from_bounds(list(r_bound), list(r_bound))
     for i in range(1, len(points)):
-        rect = rect.union_with_point(points[i])
+        rect.expand_with_point(points[i])
     return rect
 
 
@@ -1,6 +1,18 @@
+import heapq
+import itertools
+import pickle
+import struct
+import sys
+import weakref
+from array import array
+
+from pyrstar import curves
 from pyrstar import rectangle as rct
+from pyrstar import vectorized as vct
 
 
+# Defaults for the per-tree parameters of RTCursor
+
 # maximum number of children
 M = 32
 
@@ -13,9 +25,18 @@ m = 12
 # Parameter controlling how overflow is treated. try p = floor(0.3*M)
 p = 9
 
+# Number of children, those needing the least volume enlargement, scored for
+# overlap enlargement in choose_subtree, as the R* paper suggests for large
+# nodes. Kept well below M so that the pruning applies to full nodes; window
+# queries visit as many leaves as when every child is scored.
+overlap_candidates = 8
+
 
 class RStarTree:
-    def __init__(self, children=[], point_data={}):
+    # version of the tree the node was created in, see RTCursor.snapshot
+    epoch = 0
+
+    def __init__(self, children=None, point_data=None):
         """
         Spatially index point data
         ---------------------------------
@@ -26,6 +47,10 @@ class RStarTree:
         point_data: a dictionary where keys are point ids, values are lists of
         point coordinates.
         """
+        if children is None:
+            children = []
+        if point_data is None:
+            point_data = {}
 
         if point_data:
             if children:
@@ -44,9 +69,39 @@ class RStarTree:
         self.children = children
         self.points = point_data
 
+        # the node whose children include this one, None for a root
+        self.parent = None
+        for ch in children:
+            ch.parent = self
+
+        # number of levels below this node; leaves have height 0
+        if children:
+            self.height = children[0].height + 1
+        else:
+            self.height = 0
+
         self.update_bounding_rectangle()
 
 
+    @classmethod
+    def _with_key(cls, children, point_data, key):
+        """
+        Unchecked constructor for a non-null node whose key is already known,
+        e.g. from a flattened tree. The node takes ownership of key.
+        """
+        t = object.__new__(cls)
+        t.is_leaf = not children
+        t.is_null = False
+        t.children = children
+        t.points = point_data
+        t.parent = None
+        for ch in children:
+            ch.parent = t
+        t.height = children[0].height + 1 if children else 0
+        t.key = key
+        return t
+
+
     def __eq__(self, other):
         # check that children/point data is the same?
         return self.key == other.key and self.is_leaf == other.is_leaf
@@ -80,7 +135,10 @@ class RStarTree:
     def update_bounding_rectangle(self):
         if self.is_leaf:
             P = self.get_points()
-            new_key = rct.bounding_box_points(P)
+            if P:
+                new_key = rct.bounding_box_points(P)
+            else:
+                new_key = rct.EmptyRectangle(1)
         elif self.is_null:
             new_key = rct.EmptyRectangle(1)
         else:
@@ -95,26 +153,73 @@ class RStarTree:
     def add_point_data(self,point_key,point_value):
         if self.is_leaf:
             self.points[point_key]=point_value
-            self.update_bounding_rectangle()
+            if len(self.points) == 1:
+                self.update_bounding_rectangle()
+            else:
+                self.key.expand_with_point(point_value)
+            self._propagate_growth()
         else:
             pass
 
     def remove_point_data(self,point_key):
         if self.is_leaf:
-            del self.points[point_key]
-            self.update_bounding_rectangle()
+            point_value = self.points.pop(point_key)
+            if self.key.is_on_boundary(point_value):
+                self.update_bounding_rectangle()
+                # an emptied leaf is left for its owner to detach; its old
+                # key still covers nothing the ancestors do not
+                if self.points:
+                    tighten_ancestors(self)
         else:
             pass
 
 
     def add_child(self,rt):
         self.children.append(rt)
-        self.update_bounding_rectangle()
+        rt.parent = self
+        if len(self.children) == 1:
+            self.update_bounding_rectangle()
+        else:
+            self.key.expand(rt.key)
+        self._propagate_growth()
 
 
     def remove_child(self,rt):
-        self.children.remove(rt)
-        self.update_bounding_rectangle()
+        # by identity: siblings may have equal keys
+        idx = next(i for i, ch in enumerate(self.children) if ch is rt)
+        del self.children[idx]
+        rt.parent = None
+        # an emptied child no longer shows where its entries were
+        emptied = not (rt.points or rt.children)
+        if emptied or self.key.shares_boundary(rt.key):
+            self.update_bounding_rectangle()
+            if self.children:
+                tighten_ancestors(self)
+
+
+    def _propagate_growth(self):
+        """
+        Enlarge the keys of the ancestors of self to cover the key of self,
+        stopping at the first that already does
+        """
+        pred = self.parent
+        while pred is not None and not pred.key.is_proper_superset(self.key):
+            pred.key.expand(self.key)
+            pred = pred.parent
+
+
+    def release(self):
+        """
+        Called by RTCursor on a node it has dropped from the tree. Nodes kept
+        in a NodeStore (see pyrstar.storage) give back their page; plain
+        nodes need nothing.
+        """
+
+
+    def __reduce__(self):
+        # pickle the subtree as flat arrays rather than node by node; the
+        # unpickled copy is a root (its parent is not carried along)
+        return (build_tree, flatten_tree(self))
 
 
 NullRT = RStarTree()
@@ -123,7 +228,8 @@ NullRT = RStarTree()
 
 def overlap_enlargement_required(rt, candidate, entry):
     """
-
+    Increase in the total volume by which candidate's key intersects the
+    keys of its siblings in rt, if candidate were enlarged to cover entry
     """
     rects = rt.get_child_rectangles()
     rects.remove(candidate.key)
@@ -132,6 +238,7 @@ def overlap_enlargement_required(rt, candidate, entry):
     result = 0.0
     for r in rects:
         result += enlarged_rect.intersection_volume(r)
+        result -= candidate.key.intersection_volume(r)
     return result
 
 
@@ -139,33 +246,23 @@ def volume_enlargement_required(candidate, entry):
     """
     """
     rect = candidate.key
-    vol0 = rect.volume()
-    rect = rect.union(entry)
-    vol1 = rect.volume()
-    return vol1 - vol0
+    return rect.union_volume(entry) - rect.volume()
 
 
 def is_descendant(rt,rtq):
     """
     Discern whether rtq descends from rt.
     -------------------------------------
+    Follows parent pointers up from rtq, so costs O(height).
     """
-    if rt == rtq:
-        return True
-
-    R = rt.key
-    RQ = rtq.key
-    if (not R.is_proper_superset(RQ)) or rt.is_leaf:
-        return False
+    while rtq is not None:
+        if rtq is rt:
+            return True
+        rtq = rtq.parent
+    return False
 
-    candidates = [ch for ch in rt.children if ch.key.is_proper_superset(RQ)]
-    if not candidates:
-        return False
-    else:
-        return any(is_descendant(ch, rtq) for ch in candidates)
 
-
-def path_to_subtree(rt_from, rt_to, path=[]):
+def path_to_subtree(rt_from, rt_to, path=None):
     """
     Get path from tree rt_from to subtree rt_to:
     --------------------------------------------
@@ -177,24 +274,32 @@ def path_to_subtree(rt_from, rt_to, path=[]):
 
     Returns:
     --------
-    updated_path: [rt_from, ..., rt_to]
+    updated_path: [rt_from, ..., rt_to], or [] if rt_to does not descend from
+    rt_from
     """
-    updated_path = path + [rt_from]
-
-    if rt_from == rt_to:
-        return updated_path
-
-    R = rt_to.key
-    candidates = [ch for ch in rt_from.children if ch.key.is_proper_superset(R)]
-    if not candidates:
-        #TODO: raise error?
-        return []
-    else:
-        t = next(ch for ch in candidates if is_descendant(ch, rt_to))
-        return path_to_subtree(t, rt_to, updated_path)
+    if path is None:
+        path = []
+
+    # walk up the parent pointers of rt_to, then reverse
+    reverse_path = []
+    t = rt_to
+    while t is not None:
+        reverse_path.append(t)
+        if t is rt_from:
+            reverse_path.reverse()
+            return path + reverse_path
+        t = t.parent
+    return []
+
+
+def node_height(rt):
+    """
+    Number of levels below rt. Leaves and the null tree have height 0.
+    """
+    return rt.height
 
 
-def choose_subtree(rt, lvl, entry):
+def choose_subtree(rt, lvl, entry, stop_lvl=None, candidates=None):
     """
     Chooses subtree in rt for inserting entry
     -----------------------------------------
@@ -203,19 +308,35 @@ def choose_subtree(rt, lvl, entry):
     rt: R*-tree in which entry will be inserted
     lvl: level of node rt. 0 means root level.
     entry: rectangle to be inserted. may be a point rectangle.
+    stop_lvl: level at which to stop descending, used when entry is the key
+    of a node rather than a point. None means descend to a leaf.
+    candidates: if given, only this many children needing the least volume
+    enlargement are scored for overlap enlargement, as the R* paper
+    suggests for large fanouts. None scores every child.
 
     Returns:
     --------
     rt: the chosen subtree
     lvl: the level of the chosen subtree
     """
-    if rt.is_leaf:
+    if rt.is_leaf or lvl == stop_lvl:
         return rt, lvl
     if rt.does_point_to_leaves():
-        keyfunc = lambda child: (overlap_enlargement_required(rt, child, entry),
-        volume_enlargement_required(child,entry), child.key.volume())
-
-        t = min(rt.children, key = keyfunc)
+        children = rt.children
+        if candidates is not None and candidates < len(children):
+            keyfunc = lambda child: (volume_enlargement_required(child,entry),
+            child.key.volume())
+            children = sorted(children, key = keyfunc)[0:candidates]
+
+        if vct.enabled:
+            overlaps = vct.overlap_enlargements(rt, children, entry)
+            keyfunc = lambda i: (overlaps[i],
+            volume_enlargement_required(children[i],entry), children[i].key.volume())
+            t = children[min(range(0, len(children)), key = keyfunc)]
+        else:
+            keyfunc = lambda child: (overlap_enlargement_required(rt, child, entry),
+            volume_enlargement_required(child,entry), child.key.volume())
+            t = min(children, key = keyfunc)
         # should resolve ties by choosing candidate whose volume needs to be
         # enlarged the least. resolve those ties by choosing the rectangle of
         # smallest volume.
@@ -226,105 +347,788 @@ def choose_subtree(rt, lvl, entry):
         child.key.volume())
 
         t = min(rt.children, key = keyfunc)
-    return choose_subtree(t, lvl + 1, entry)
+    return choose_subtree(t, lvl + 1, entry, stop_lvl, candidates)
+
+
+def choose_subtree_least_enlargement(rt, lvl, entry, stop_lvl=None):
+    """
+    Guttman's ChooseLeaf: same as choose_subtree, but always picks the child
+    whose volume needs the least enlargement, resolving ties by smallest
+    volume. Skips the overlap computation at the level above the leaves.
+    """
+    while not (rt.is_leaf or lvl == stop_lvl):
+        keyfunc = lambda child: (volume_enlargement_required(child,entry),
+        child.key.volume())
+        rt = min(rt.children, key = keyfunc)
+        lvl += 1
+    return rt, lvl
 
 
 class RTCursor:
-    def __init__(self,rt):
-        # level: overflow_was_treated
-        self.level_actions = {0:False}
+    def __init__(self, rt, M=None, m=None, p=None, policy="rstar",
+    overlap_candidates=None, node_factory=None, index_ids=True):
+        """
+        Operate on an R*-tree
+        ---------------------
+        Parameters:
+        -----------
+        rt: root of the tree
+        M: maximum number of entries per node
+        m: minimum number of entries per node, at most M // 2
+        p: number of entries removed for forced reinsertion, 1 <= p < M
+        policy: insertion policy, a key of SPLIT_POLICIES. "rstar" is the R*
+        algorithm. "quadratic" and "linear" are Guttman's splits with
+        least-enlargement subtree choice and no forced reinsertion: much
+        faster inserts for worse query performance, which reorganize can
+        recover later. May be changed at any time.
+        overlap_candidates: number of children scored for overlap
+        enlargement when choosing a leaf under the R* policy (see
+        choose_subtree). Defaults to the module-level value.
+        node_factory: called like RStarTree to create every node the cursor
+        adds to the tree, e.g. NodeStore.new_node to keep them on disk.
+        Defaults to RStarTree.
+        index_ids: whether to keep leaf_of, the map of point ids to leaves.
+        Without it the cursor holds nothing per point, as a storage.NodeStore
+        needs, but locate, delete, move and update need the point's
+        coordinates and insert does not check that ids are unique.
+
+        Parameters left as None take the module-level defaults, except that
+        when only M is given, m and p default to floor(0.4*M) and
+        floor(0.3*M) as recommended for R*-trees.
+        """
+        if M is None:
+            self.M = globals()["M"]
+            self.m = globals()["m"] if m is None else m
+            self.p = globals()["p"] if p is None else p
+        else:
+            self.M = M
+            self.m = max(1, int(0.4 * M)) if m is None else m
+            self.p = max(1, int(0.3 * M)) if p is None else p
+        if not 2 <= 2 * self.m <= self.M:
+            raise ValueError(f"need 1 <= m <= M // 2, got M={self.M}, m={self.m}")
+        if not 1 <= self.p < self.M:
+            raise ValueError(f"need 1 <= p < M, got M={self.M}, p={self.p}")
+        if policy not in SPLIT_POLICIES:
+            raise ValueError(f"unknown insertion policy: {policy}")
+        self.policy = policy
+        if overlap_candidates is None:
+            overlap_candidates = globals()["overlap_candidates"]
+        self.overlap_candidates = overlap_candidates
+        self.node_factory = RStarTree if node_factory is None else node_factory
+        self.index_ids = index_ids
+
+        # height: overflow_was_treated. Keyed by height above the leaves
+        # rather than depth, so that a root split during reinsertion does not
+        # shift the levels already treated.
+        self.level_actions = {}
         self.root = rt
 
+        # Copy-on-write state, see snapshot. Nodes with an epoch up to
+        # frozen_epoch may be shared with a snapshot and are copied before
+        # being changed; -1 while no snapshot is alive.
+        self.epoch = 0
+        self.frozen_epoch = -1
+        self._snapshots = weakref.WeakSet()
+        # size of _snapshots when frozen_epoch was last worked out
+        self._snapshot_count = 0
+
+        # point id: leaf holding the point, see leaf_of
+        self._leaf_of = None
+        # number of points, see __len__; None until counted
+        self._point_count = None
+
+
+    def __len__(self):
+        """
+        Number of points in the tree, counted over the leaves the first time
+        it is asked for and kept up to date from then on
+        """
+        if self._point_count is None:
+            count = 0
+            stack = [self.root]
+            while stack:
+                t = stack.pop()
+                if t.is_leaf:
+                    count += t.get_point_count()
+                else:
+                    stack.extend(t.children)
+            self._point_count = count
+        return self._point_count
+
+
+    @property
+    def leaf_of(self):
+        """
+        Map of point id to the leaf holding the point, built from the leaves
+        the first time a point is looked up by id. Opening a tree and
+        querying it so reads no leaf. None if the cursor does not index ids.
+        """
+        if self._leaf_of is None and self.index_ids:
+            leaf_of = {}
+            stack = [self.root]
+            while stack:
+                t = stack.pop()
+                if t.is_leaf:
+                    leaf_of.update((k, t) for k in t.points)
+                else:
+                    stack.extend(t.children)
+            self._leaf_of = leaf_of
+        return self._leaf_of
+
+
+    @leaf_of.setter
+    def leaf_of(self, leaf_of):
+        self._leaf_of = leaf_of
+
 
     def insert(self, point_data):
         """
-        We will only be indexing points.
+        We will only be indexing points. Point ids must be unique within the
+        tree; inserting an id already present raises ValueError.
         """
+        leaf_of = self.leaf_of
+        if leaf_of is not None and point_data[0] in leaf_of:
+            raise ValueError(f"point id {point_data[0]!r} is already in the tree")
+        self._insert(point_data)
+        if self._point_count is not None:
+            self._point_count += 1
+
+
+    def _insert(self, point_data):
+        P_id, P = point_data
+        if self.root.is_null:
+            self.root = self._new_node(children=[], point_data={P_id: P})
+            if self.leaf_of is not None:
+                self.leaf_of[P_id] = self.root
+            return
         self._insert_point(self.root, 0, point_data)
-        self.level_actions = {0:False}
+        self.level_actions = {}
+
+
+    @classmethod
+    def bulk_load(cls, pts_tuples, method="str", M=None, m=None, p=None,
+    policy="rstar", node_factory=None, index_ids=True):
+        """
+        Build a packed tree from a batch of points
+        ------------------------------------------
+        Parameters:
+        -----------
+        pts_tuples: list of pts as (key,value) tuples
+        method: packing order, a key of BULK_LOAD_METHODS. "str" is
+        Sort-Tile-Recursive, "hilbert" and "morton" pack along space-filling
+        curves.
+        M, m, p, policy, node_factory, index_ids: as for RTCursor
+
+        Returns:
+        --------
+        retv: an RTCursor to the instantiated tree
+        """
+        if method not in BULK_LOAD_METHODS:
+            raise ValueError(f"unknown bulk loading method: {method}")
+        order = BULK_LOAD_METHODS[method]
+
+        # validates the parameters before any work is done
+        retv = cls(RStarTree(), M, m, p, policy, node_factory=node_factory,
+        index_ids=index_ids)
+        if not pts_tuples:
+            return retv
+        new_node = retv.node_factory
+
+        # pack the points into leaves, then the nodes of each level into
+        # parents, until a single node is left
+        M, m = retv.M, retv.m
+        entries = order(list(pts_tuples), lambda pt: pt[1], M)
+        level = [new_node(children=[], point_data=dict(group))
+        for group in pack_groups(entries, M, m)]
+        while len(level) > 1:
+            entries = order(level, lambda t: t.key.center(), M)
+            level = [new_node(children=group) for group in pack_groups(entries, M, m)]
+
+        return cls(level[0], retv.M, retv.m, retv.p, retv.policy,
+        node_factory=node_factory, index_ids=index_ids)
+
+
+    def reorganize(self, method="str"):
+        """
+        Rebuild the tree by bulk loading all its points, e.g. after ingesting
+        with a fast insertion policy. Tree parameters and policy are kept.
+        """
+        packed = RTCursor.bulk_load(all_points(self.root), method, self.M,
+        self.m, self.p, self.policy, self._new_node)
+        self._release_tree(self.root)
+        self.root = packed.root
+        # rebuilt when next needed
+        self.leaf_of = None
+        self.level_actions = {}
+
+
+    def snapshot(self):
+        """
+        Read-only view of the tree as it is now
+        ---------------------------------------
+        Taking a snapshot copies nothing. Afterwards, changes copy each node
+        shared with a snapshot before altering it, along with the path to it
+        from the root (path copying), so the snapshot keeps seeing its own
+        version while untouched subtrees stay shared. Once no snapshot is
+        referenced, nodes are changed in place again and the versions only
+        snapshots used are reclaimed by the garbage collector.
+
+        Queries on a snapshot need no lock, even while another thread
+        changes the tree through this cursor.
+
+        Returns:
+        --------
+        snap: an RTSnapshot
+        """
+        snap = RTSnapshot(self.root, self.epoch)
+        self._snapshots.add(snap)
+        self._snapshot_count = len(self._snapshots)
+        self.frozen_epoch = self.epoch
+        self.epoch += 1
+        return snap
+
+
+    def to_bytes(self):
+        """
+        Compact snapshot of the tree and its parameters, see flatten_tree.
+        RTCursor.from_bytes restores it; pickling a cursor goes through the
+        same format.
+        """
+        kinds, counts, coords, ids = flatten_tree(self.root)
+        int_ids = isinstance(ids, array)
+        id_bytes = ids.tobytes() if int_ids else pickle.dumps(ids,
+        pickle.HIGHEST_PROTOCOL)
+        d = len(coords) // len(ids) if ids else 0
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+        sys.byteorder == "little", int_ids, self.policy.encode("ascii"),
+        d, self.M, self.m, self.p, self.overlap_candidates, len(kinds), len(ids))
+        return b"".join([header, kinds.tobytes(), counts.tobytes(),
+        coords.tobytes(), id_bytes])
+
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Restore a cursor from a snapshot made by to_bytes. Raises ValueError
+        if data is not such a snapshot.
+        """
+        data = memoryview(data)
+        if len(data) < SNAPSHOT_HEADER.size:
+            raise ValueError("not an R*-tree snapshot")
+        (magic, version, little_endian, int_ids, policy, d, M_, m_, p_,
+        candidates, node_count, point_count) = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("not an R*-tree snapshot of this version")
+
+        sizes = [("b", node_count), ("q", node_count), ("d", point_count * d),
+        ("q", point_count if int_ids else 0)]
+        needed = SNAPSHOT_HEADER.size + sum(n * array(typecode).itemsize
+        for typecode, n in sizes)
+        if len(data) < needed or (int_ids and len(data) != needed) or \
+        (point_count and not d):
+            raise ValueError("truncated or corrupt R*-tree snapshot")
+
+        offset = SNAPSHOT_HEADER.size
+        arrays = []
+        for typecode, n in sizes:
+            a = array(typecode)
+            a.frombytes(data[offset:offset + n * a.itemsize])
+            offset += n * a.itemsize
+            if little_endian != (sys.byteorder == "little"):
+                a.byteswap()
+            arrays.append(a)
+        kinds, counts, coords, ids = arrays
+        if not int_ids:
+            try:
+                ids = pickle.loads(data[offset:])
+            except Exception:
+                raise ValueError("truncated or corrupt R*-tree snapshot")
+
+        # every node but the root is some inner node's child, listed after it
+        child_count = 0
+        leaf_point_count = 0
+        for i, (is_leaf, n) in enumerate(zip(kinds, counts)):
+            if n < 0 or is_leaf not in (0, 1) or \
+            (not is_leaf and child_count + 1 <= i):
+                raise ValueError("truncated or corrupt R*-tree snapshot")
+            if is_leaf:
+                leaf_point_count += n
+            else:
+                child_count += n
+        if (node_count and child_count != node_count - 1) or \
+        leaf_point_count != point_count or len(ids) != point_count:
+            raise ValueError("truncated or corrupt R*-tree snapshot")
+
+        return cls(build_tree(kinds, counts, coords, ids), M_, m_, p_,
+        policy.rstrip(b"\x00").decode("ascii"), candidates)
+
+
+    def __reduce__(self):
+        return (type(self).from_bytes, (self.to_bytes(),))
+
+
+    def locate(self, point_id, point=None):
+        """
+        Returns the leaf holding point_id, looked up in leaf_of, or found by
+        a spatial search for point on a cursor that does not index ids.
+        Raises KeyError if the tree holds no such point, and ValueError if
+        point is needed but not given.
+        """
+        leaf_of = self.leaf_of
+        if leaf_of is not None:
+            leaf = leaf_of.get(point_id)
+            if leaf is not None and point is not None and \
+            list(leaf.points[point_id]) != list(point):
+                leaf = None
+        elif point is None:
+            raise ValueError("the cursor does not index point ids: "
+            "give the point's coordinates")
+        else:
+            leaf = self._find_leaf(point_id, point)
+        if leaf is None:
+            raise KeyError(point_id)
+        return leaf
+
+
+    def delete(self, point_id, point=None):
+        """
+        Remove a point from the tree
+        ----------------------------
+        Parameters:
+        -----------
+        point_id: id the point was inserted with
+        point: its coordinates, needed if the cursor does not index ids.
+        If given, they must match the stored ones.
+
+        Raises KeyError if the tree holds no such point.
+        """
+        leaf = self._own(self.locate(point_id, point))
+        if self.leaf_of is not None:
+            del self.leaf_of[point_id]
+        leaf.remove_point_data(point_id)
+        if self._point_count is not None:
+            self._point_count -= 1
+        self._condense_tree(leaf)
+
+
+    def move(self, point_id, new_point, point=None):
+        """
+        Give point_id new coordinates: delete it and insert it again. point
+        is as for delete.
+        """
+        self.delete(point_id, point)
+        self.insert((point_id, new_point))
+
+
+    def update(self, point_id, new_point, point=None):
+        """
+        Give point_id new coordinates, bottom-up where possible
+        -------------------------------------------------------
+        If new_point lies in the key of the point's leaf, or in the key of
+        the leaf's parent (so the leaf may grow without its ancestors having
+        to), the point is changed in place and only the keys from the leaf
+        upward are adjusted. Otherwise it falls back to move. point is the
+        point's current coordinates, as for delete.
+
+        Returns:
+        --------
+        in_place: whether the point was updated without reinsertion
+        """
+        leaf = self.locate(point_id, point)
+        pred = leaf.parent
+        if not (leaf.key.is_element(new_point) or pred is None
+        or pred.key.is_element(new_point)):
+            self.move(point_id, new_point, point)
+            return False
+
+        # new_point lies in pred's key, so add_point_data grows no further
+        # than the leaf
+        leaf = self._own(leaf)
+        leaf.add_point_data(point_id, new_point)
+        leaf.update_bounding_rectangle()
+        tighten_ancestors(leaf)
+        return True
+
+
+    def _condense_tree(self, leaf):
+        """
+        CondenseTree: walking up from leaf, which just lost an entry, remove
+        the nodes left with fewer than m entries. Removals tighten the keys
+        of the remaining ancestors as they go. Entries of removed nodes are then reinserted at their own level
+        and the root is shrunk while it has a single child.
+        """
+        eliminated = []
+        t = leaf
+        while t.parent is not None:
+            pred = t.parent
+            count = t.get_point_count() if t.is_leaf else t.get_child_count()
+            if count < self.m:
+                pred.remove_child(t)
+                eliminated.append(t)
+            t = pred
+
+        if not self.root.is_leaf and not self.root.children:
+            # everything left hangs off eliminated nodes
+            self._release(self.root)
+            self.root = RStarTree()
+
+        # higher nodes first, so that the levels they go back to still exist
+        eliminated.sort(key = lambda t: t.height, reverse = True)
+        for t in eliminated:
+            if t.is_leaf:
+                for pt in list(t.points.items()):
+                    self._insert(pt)
+                self._release(t)
+            elif not t.children:
+                # with m = 1, a node whose only child was eliminated below
+                self._release(t)
+            elif self.root.is_null or self.root.height <= t.children[0].height:
+                for pt in all_points(t):
+                    self._insert(pt)
+                self._release_tree(t)
+            else:
+                for ch in list(t.children):
+                    t.remove_child(ch)
+                    self._insert_node(self.root, 0, ch)
+                    self.level_actions = {}
+                self._release(t)
+
+        # shrink the root
+        while not self.root.is_leaf and self.root.get_child_count() == 1:
+            old_root = self.root
+            self.root = self.root.children[0]
+            self.root.parent = None
+            self._release(old_root)
+        if self.root.is_leaf and not self.root.points:
+            self._release(self.root)
+            self.root = RStarTree()
+
+
+    def search(self, rect):
+        """
+        Window query
+        ------------
+        Parameters:
+        -----------
+        rect: the query window. Points on its boundary are included.
+
+        Returns:
+        --------
+        result: list of (point id, point) tuples lying in rect
+        """
+        result = []
+        for leaf, covered in self._leaves_in_window(rect):
+            if covered:
+                result.extend(leaf.points.items())
+            else:
+                result.extend((k, v) for k, v in leaf.points.items()
+                if rect.is_element(v))
+        return result
+
+
+    def count(self, rect):
+        """
+        Number of points lying in rect. Same semantics as search, without
+        building the result list.
+        """
+        result = 0
+        for leaf, covered in self._leaves_in_window(rect):
+            if covered:
+                result += leaf.get_point_count()
+            else:
+                result += sum(1 for v in leaf.points.values()
+                if rect.is_element(v))
+        return result
+
+
+    def nearest(self, point, k=1):
+        """
+        Best-first k-nearest-neighbor query
+        -----------------------------------
+        Parameters:
+        -----------
+        point: the query point
+        k: number of neighbors wanted
+
+        Returns:
+        --------
+        result: list of up to k (point id, point) tuples, nearest first
+        """
+        if k <= 0:
+            return []
+        return list(itertools.islice(self.iter_nearest(point), k))
+
+
+    def iter_nearest(self, point):
+        """
+        Incremental nearest-neighbor query (distance browsing). Yields
+        (point id, point) tuples in increasing distance from point; the
+        priority queue is kept between calls to next(), so stopping early
+        costs nothing further.
+        """
+        if self.root.is_null:
+            return
+
+        # Nodes are keyed by the minimum distance from point to their key,
+        # which bounds the distance to anything stored below them. Points
+        # share the heap, so a point popped before every remaining node bound
+        # is known to be the next nearest.
+        tiebreak = itertools.count()
+        heap = [(rct.point_to_rectangle_distance_squared(point, self.root.key),
+        next(tiebreak), self.root, None)]
+        while heap:
+            dist, _, t, pt = heapq.heappop(heap)
+            if t is None:
+                yield pt
+            elif t.is_leaf:
+                for pt in t.points.items():
+                    d = point_distance_squared(point, pt[1])
+                    heapq.heappush(heap, (d, next(tiebreak), None, pt))
+            else:
+                for ch in t.children:
+                    d = rct.point_to_rectangle_distance_squared(point, ch.key)
+                    heapq.heappush(heap, (d, next(tiebreak), ch, None))
+
+
+    def search_many(self, rects):
+        """
+        Batched window query (requires numpy)
+        -------------------------------------
+        Parameters:
+        -----------
+        rects: list of query windows
+
+        Returns:
+        --------
+        offsets, ids, coords: the results of rects[i] are the points with ids
+        ids[offsets[i]:offsets[i+1]] and coordinates
+        coords[offsets[i]:offsets[i+1]]
+        """
+        if vct.np is None:
+            raise ImportError("search_many requires numpy")
+        d = self.root.key.dimension if not rects else rects[0].dimension
+        lower = vct.np.array([r.minima for r in rects], dtype=float).reshape(-1, d)
+        upper = vct.np.array([r.maxima for r in rects], dtype=float).reshape(-1, d)
+        return vct.search_many(self.root, lower, upper)
+
+
+    def nearest_many(self, points, k=1):
+        """
+        Batched k-nearest-neighbor query (requires numpy)
+        -------------------------------------------------
+        Parameters:
+        -----------
+        points: list of query points, or a (q, d) array
+        k: number of neighbors wanted per query
+
+        Returns:
+        --------
+        ids, coords: row i holds the ids and coordinates of the neighbors of
+        points[i], nearest first
+        """
+        if vct.np is None:
+            raise ImportError("nearest_many requires numpy")
+        d = self.root.key.dimension if not len(points) else -1
+        P = vct.np.array(points, dtype=float).reshape(len(points), d)
+        return vct.nearest_many(self.root, P, k)
+
+
+    def _find_leaf(self, point_id, point):
+        """
+        FindLeaf: the leaf holding point_id at point, found by descending
+        every child whose key contains point, or None
+        """
+        point = list(point)
+        if self.root.is_null or not self.root.key.is_element(point):
+            return None
+        stack = [self.root]
+        while stack:
+            t = stack.pop()
+            if t.is_leaf:
+                P = t.points.get(point_id)
+                if P is not None and list(P) == point:
+                    return t
+            else:
+                stack.extend(ch for ch in t.children if ch.key.is_element(point))
+        return None
+
+
+    def _leaves_in_window(self, rect):
+        """
+        Yields (leaf, covered) for every leaf whose key intersects rect, where
+        covered tells whether the leaf's key lies entirely within rect. Only
+        children whose keys intersect rect are descended into.
+        """
+        if self.root.is_null or not self.root.key.intersects(rect):
+            return
+        stack = [(self.root, rect.is_proper_superset(self.root.key))]
+        while stack:
+            t, covered = stack.pop()
+            if t.is_leaf:
+                yield t, covered
+            elif covered:
+                stack.extend((ch, True) for ch in t.children)
+            else:
+                for ch in t.children:
+                    if ch.key.intersects(rect):
+                        stack.append((ch, rect.is_proper_superset(ch.key)))
+
+
+    def _new_node(self, children=None, point_data=None):
+        t = self.node_factory(children=children, point_data=point_data)
+        t.epoch = self.epoch
+        return t
+
+
+    def _is_frozen(self, t):
+        if t.epoch > self.frozen_epoch:
+            return False
+        if len(self._snapshots) < self._snapshot_count:
+            # snapshots were dropped, perhaps the latest ones
+            self._snapshot_count = len(self._snapshots)
+            self.frozen_epoch = max((snap.epoch for snap in self._snapshots),
+            default=-1)
+        return t.epoch <= self.frozen_epoch
+
+
+    def _own(self, t):
+        """
+        Returns a version of t that may be changed in place: t itself unless
+        t or one of its ancestors is shared with a snapshot, in which case
+        those nodes are replaced in the tree by copies (path copying).
+        """
+        if self.frozen_epoch < 0:
+            return t
+        path = [t]
+        while path[-1].parent is not None:
+            path.append(path[-1].parent)
+        if not any(self._is_frozen(x) for x in path):
+            return t
+
+        pred = None
+        for x in reversed(path):
+            if self._is_frozen(x):
+                # the copy adopts x's children; x keeps its own list for the
+                # snapshots
+                if x.is_leaf:
+                    copy = self._new_node(children=[], point_data=dict(x.points))
+                    if self.leaf_of is not None:
+                        self.leaf_of.update((k, copy) for k in copy.points)
+                else:
+                    copy = self._new_node(children=list(x.children))
+                if pred is None:
+                    self.root = copy
+                else:
+                    # assigned rather than changed in place, see
+                    # storage.StoredRStarTree
+                    pred.children = [copy if ch is x else ch for ch in pred.children]
+                    copy.parent = pred
+                x = copy
+            pred = x
+        return pred
+
+
+    def _release(self, t):
+        # nodes shared with a snapshot stay with it
+        if not self._is_frozen(t):
+            t.release()
+
+
+    def _release_tree(self, rt):
+        """
+        Release the nodes below rt not shared with a snapshot; the subtrees
+        of a shared node are shared too
+        """
+        stack = [rt]
+        while stack:
+            t = stack.pop()
+            if self._is_frozen(t):
+                continue
+            if not t.is_leaf:
+                stack.extend(t.children)
+            t.release()
 
 
     def _insert_point(self, rt, rt_lvl, point_data):
         P_id, P = point_data
         E = rct.Rectangle(P,P)
 
-        st, lvl = choose_subtree(rt, rt_lvl, E)
+        st, lvl = self._choose_subtree(rt, rt_lvl, E)
+        st = self._own(st)
+        rt = self.root
 
+        # add_point_data enlarges the covering rectangles in the insertion
+        # path as far as needed
         path = path_to_subtree(rt,st)
-        point_count = st.get_point_count()
-        if point_count < M:
-            st.add_point_data(P_id, P)
-        elif lvl != 0:
-            # overflow not at root
-
-            # set predecessor to next to last element of path
-            st_pred = path[-2]
-
-            # add the point and then treat the overflow
-            st.add_point_data(P_id, P)
-            caused_split = self.overflow_treatment(st,lvl,st_pred)
-            if caused_split and st_pred.get_child_count() > M:
-                # Propagate overflow treatment up the insertion path
-                _ = self.propagate_overflow_treatment(lvl - 1, path)
-        else:
-            # overflow at root
-            st.add_point_data(P_id, P)
-            _ = self.overflow_treatment(st, lvl, NullRT)
-
+        st.add_point_data(P_id, P)
+        if self.leaf_of is not None:
+            self.leaf_of[P_id] = st
 
-        # Make sure all covering rectangles in insertion path are adjusted
-        # to be minimum bounding rectangles
+        if st.get_point_count() > self.M:
+            _ = self.propagate_overflow_treatment(lvl, path)
 
 
     def _insert_node(self, rt, rt_lvl, t):
         E = t.key
-        st, lvl = choose_subtree(rt, rt_lvl, E)
 
+        # t goes back to the level its former parent was on
+        target_lvl = rt_lvl + rt.height - t.height - 1
+        st, lvl = self._choose_subtree(rt, rt_lvl, E, target_lvl)
+        st = self._own(st)
+        rt = self.root
+
+        # add_child enlarges the covering rectangles in the insertion path as
+        # far as needed
         path = path_to_subtree(rt, st)
-        child_count = st.get_child_count()
-        if child_count < M:
-            st.add_child(t)
-        elif lvl != 0:
-            # overflow not at root
-
-            # set predecessor to next to last element of path
-            st_pred = path[-2]
-
-            # add node and then treat overflow
-            st.add_child(t)
-            caused_split = self.overflow_treatment(st, lvl, st_pred)
-            if caused_split and st_pred.get_child_count() > M:
-                # Propagate overflow_treatment up the insertion path
-                _ = self.propagate_overflow_treatment(lvl - 1, path)
-        else:
-            # overflow at root
-            # add node to root and treat overflow
-            st.add_child(t)
-            _ = self.overflow_treatment(st, lvl, NullRT)
+        st.add_child(t)
 
-        # Make sure all covering rectangles in insertion path are adjusted
-        # to be minimum bounding rectangles
+        if st.get_child_count() > self.M:
+            _ = self.propagate_overflow_treatment(lvl, path)
+
+
+    def _choose_subtree(self, rt, lvl, entry, stop_lvl=None):
+        if self.policy == "rstar":
+            return choose_subtree(rt, lvl, entry, stop_lvl, self.overlap_candidates)
+        return choose_subtree_least_enlargement(rt, lvl, entry, stop_lvl)
 
 
     def split_leaf(self, t, pred):
+        M, m = self.M, self.m
         count = t.get_point_count()
         assert count == M + 1
-        ax = choose_split_axis_leaf(t)
-        idx = choose_split_index_leaf(t, ax)
+        if self.policy != "rstar":
+            keys = list(t.points)
+            rects = [rct.Rectangle(t.points[k], t.points[k]) for k in keys]
+            idx_1, idx_2 = SPLIT_POLICIES[self.policy](rects, m)
+            sorted_along_axis = [keys[i] for i in idx_1 + idx_2]
+            idx = len(idx_1)
+        elif vct.enabled:
+            # build the leaf's arrays once for both choices and the sort
+            ids, coords = vct.leaf_arrays(t)
+            ax = vct.choose_split_axis_leaf(coords, m, M)
+            idx = vct.choose_split_index_leaf(coords, ax, m, M)
+            sorted_along_axis = ids[vct.np.argsort(coords[:, ax], kind="stable")]
+        else:
+            ax = choose_split_axis_leaf(t, M, m)
+            idx = choose_split_index_leaf(t, ax, M, m)
 
-        kf = lambda k: (t.points[k])[ax]
-        sorted_along_axis = sorted(list(t.points), key = kf)
+            kf = lambda k: (t.points[k])[ax]
+            sorted_along_axis = sorted(list(t.points), key = kf)
 
         # point data for the two new leaves
         group_1 = {x: t.points[x] for x in sorted_along_axis[0:idx]}
         group_2 = {x: t.points[x] for x in sorted_along_axis[idx:]}
 
         # instantiate the new leaves
-        new_leaf_1 = RStarTree(children=[],is_leaf=True,point_data=group_1)
-        new_leaf_2 = RStarTree(children=[],is_leaf=True,point_data=group_2)
-
-        if pred == NullRT:
-            new_root = RStarTree(children = [new_leaf_1, new_leaf_2], is_leaf=False)
+        new_leaf_1 = self._new_node(children=[], point_data=group_1)
+        new_leaf_2 = self._new_node(children=[], point_data=group_2)
+        leaf_of = self.leaf_of
+        if leaf_of is not None:
+            leaf_of.update((k, new_leaf_1) for k in group_1)
+            leaf_of.update((k, new_leaf_2) for k in group_2)
+
+        if pred is NullRT:
+            new_root = self._new_node(children = [new_leaf_1, new_leaf_2])
             self.root = new_root
         else:
             # delete original leaf
@@ -333,29 +1137,38 @@ class RTCursor:
             # add the new leaves to the predecessor
             pred.add_child(new_leaf_1)
             pred.add_child(new_leaf_2)
+        self._release(t)
 
 
 
     def split_node(self, t, pred):
         count = t.get_child_count()
-        assert count == M + 1
-        ax = choose_split_axis(t)
-        idx, islower = choose_split_index(t, ax)
+        assert count == self.M + 1
+        if self.policy != "rstar":
+            rects = t.get_child_rectangles()
+            idx_1, idx_2 = SPLIT_POLICIES[self.policy](rects, self.m)
+            sorted_along_axis = [t.children[i] for i in idx_1 + idx_2]
+            idx = len(idx_1)
+        else:
+            ax = choose_split_axis(t, self.M, self.m)
+            idx, islower = choose_split_index(t, ax, self.M, self.m)
 
-        kf = lambda ch: ch.key.minima[ax]
-        sorted_along_axis = sorted(t.children, key = kf)
+            if islower:
+                kf = lambda ch: ch.key.minima[ax]
+            else:
+                kf = lambda ch: ch.key.maxima[ax]
+            sorted_along_axis = sorted(t.children, key = kf)
 
         # children for two new nodes
         group_1 = sorted_along_axis[0:idx]
         group_2 = sorted_along_axis[idx:]
 
         # instantiate new nodes
-        node_1 = RStarTree(children=group_1, is_leaf=False)
-        node_2 = RStarTree(children=group_2, is_leaf=False)
+        node_1 = self._new_node(children=group_1)
+        node_2 = self._new_node(children=group_2)
 
-        if pred == NullRT:
-            # make new root?
-            new_root = RStarTree(children = [node_1, node_2], is_leaf=False)
+        if pred is NullRT:
+            new_root = self._new_node(children = [node_1, node_2])
             self.root = new_root
         else:
             # delete original node
@@ -364,17 +1177,20 @@ class RTCursor:
             # add back nodes
             pred.add_child(node_1)
             pred.add_child(node_2)
+        self._release(t)
 
 
     def overflow_treatment(self, rt, lvl, pred):
         split_performed = False
 
-        if lvl not in self.level_actions:
-            self.level_actions[lvl] = False
+        if rt.height not in self.level_actions:
+            self.level_actions[rt.height] = False
 
-        # if not the root and not already called at this level
-        if (lvl != 0) and (not self.level_actions[lvl]):
-            self.level_actions[lvl] = True
+        # if not the root and not already called at this level. Only the R*
+        # policy reinserts.
+        if (self.policy == "rstar" and pred is not NullRT
+        and not self.level_actions[rt.height]):
+            self.level_actions[rt.height] = True
             split_performed = False
             if rt.is_leaf:
                 self.leaf_re_insert(rt, lvl)
@@ -400,7 +1216,7 @@ class RTCursor:
         pts_by_dist = sorted(list(rt.points), key=keyfunc, reverse=True)
 
         # Slate the p points most distant from the center to be removed from rt
-        to_remove = pts_by_dist[0:p]
+        to_remove = pts_by_dist[0:self.p]
 
         # Prepare (key, value) pairs to be reinserted
         to_re_insert = [(k, rt.points[k]) for k in to_remove]
@@ -413,9 +1229,9 @@ class RTCursor:
         # inserting pts closer to the center first performs differently
         to_re_insert.reverse()
 
-        # Iteratively reinsert entries
+        # Iteratively reinsert entries, starting from the root
         for pt in to_re_insert:
-            self._insert_point(rt, lvl, pt)
+            self._insert_point(self.root, 0, pt)
 
 
     def node_re_insert(self, rt, lvl):
@@ -425,39 +1241,238 @@ class RTCursor:
         # Get a list of children sorted by their centers' distances from the
         # center of the node's rectangle, descending.
         node_rect = rt.key
-        keyfunc = lambda cr: node_rect.center_distance_squared(cr)
-        children_by_dist = sorted(children, key=keyfunc, reverse=True)
+        keyfunc = lambda ch: node_rect.center_distance_squared(ch.key)
+        children_by_dist = sorted(rt.children, key=keyfunc, reverse=True)
 
-        # Slate first p points to be removed and reinserted
-        to_remove = children_by_dist[0:p]
-        # close reinsert
-        to_re_insert = to_remove.reverse()
+        # Slate first p children to be removed and reinserted
+        to_remove = children_by_dist[0:self.p]
 
         # Remove them, updating node's bounding rectangle
         for c in to_remove:
             rt.remove_child(c)
 
-        # Iteratively reinsert, passing level of rt as a parameter
+        # close reinsert
+        to_re_insert = list(reversed(to_remove))
+
+        # Iteratively reinsert, starting from the root. _insert_node places
+        # each child back on the level of rt.
         for c in to_re_insert:
-            self._insert_node(rt,lvl,c)
+            self._insert_node(self.root, 0, c)
 
 
     def propagate_overflow_treatment(self, lvl, node_list):
+        """
+        Treat overflow of the last node in node_list, then of its ancestors
+        for as long as splits keep overflowing them.
+        -----------------------------------------------------------------
+        Parameters:
+        -----------
+        lvl: level of the last node in node_list
+        node_list: insertion path [rt, ..., overflowing node]
+
+        Returns:
+        --------
+        was_root_split: whether the first node of node_list was split
+        """
         was_root_split = False
-        for i,t in reversed(list(enumerate(node_list))):
-            count = t.get_child_count()
-            if count > M:
-                if i >= 1:
-                    pred = node_list[i-1]
-                    _ = self.overflow_treatment(t, lvl, pred)
-                else:
-                    pred = NullRT
-                    was_root_split = self.overflow_treatment(t, lvl, pred)
+        for i in reversed(range(len(node_list))):
+            t = node_list[i]
+            if t.is_leaf:
+                count = t.get_point_count()
+            else:
+                count = t.get_child_count()
+            if count <= self.M:
+                break
+
+            if i >= 1:
+                pred = node_list[i-1]
+                split_performed = self.overflow_treatment(t, lvl, pred)
+            else:
+                pred = NullRT
+                split_performed = self.overflow_treatment(t, lvl, pred)
+                was_root_split = split_performed
+
+            # reinsertion went through the root on its own paths; nothing left
+            # to treat on this one
+            if not split_performed:
+                break
             lvl -= 1
         return was_root_split
 
 
-def choose_split_axis_leaf(t):
+def all_points(rt):
+    """
+    (point id, point) tuples of every point stored below rt
+    """
+    result = []
+    stack = [rt]
+    while stack:
+        t = stack.pop()
+        if t.is_leaf:
+            result.extend(t.points.items())
+        else:
+            stack.extend(t.children)
+    return result
+
+
+def tighten_ancestors(t):
+    """
+    Recompute the keys of t's ancestors after t's key changed, stopping at
+    the first one left unchanged.
+    """
+    pred = t.parent
+    while pred is not None:
+        old_key = pred.key
+        pred.update_bounding_rectangle()
+        if pred.key == old_key:
+            break
+        pred = pred.parent
+
+
+def point_distance_squared(p, q):
+    s = 0.0
+    for i in range(0,len(p)):
+        s += (p[i]-q[i])**2
+    return s
+
+
+def spatial_join(cursor_a, cursor_b, predicate="within", eps=0.0):
+    """
+    Pairs of points of two trees lying near each other
+    --------------------------------------------------
+    Both trees are descended together. Pairs of nodes whose keys are more
+    than eps apart along some axis are pruned, and the children of two nodes
+    (the points of two leaves) are paired up by a plane sweep along the
+    first axis rather than by testing every pair.
+
+    Parameters:
+    -----------
+    cursor_a, cursor_b: RTCursors or snapshots of the trees to join; the
+    same one for a self-join, whose result holds (a, a) and both (a, b) and
+    (b, a). Cursors are joined through a snapshot, so that changes made
+    meanwhile by other threads, e.g. through a ConcurrentRTCursor, are not
+    seen half done.
+    predicate: "within" pairs points at most eps apart. "box" pairs points at
+    most eps apart along every axis, i.e. b lying in the square of
+    half-width eps around a. Otherwise, a function of two points returning
+    whether they pair up; it is only given points at most eps apart along
+    every axis.
+    eps: distance bound, 0 to pair equal points
+
+    Returns:
+    --------
+    pairs: list of (point id in a, point id in b) tuples
+    """
+    if eps < 0:
+        raise ValueError(f"need a non-negative distance bound, got {eps}")
+    if predicate == "within":
+        eps_squared = eps * eps
+        test = lambda P, Q: point_distance_squared(P, Q) <= eps_squared
+    elif predicate == "box":
+        test = lambda P, Q: _points_near(P, Q, eps)
+    elif callable(predicate):
+        test = lambda P, Q: _points_near(P, Q, eps) and predicate(P, Q)
+    else:
+        raise ValueError(f"unknown join predicate: {predicate}")
+
+    # the snapshots keep their versions of the trees while the join runs
+    snap_a = cursor_a.snapshot() if hasattr(cursor_a, "snapshot") else cursor_a
+    snap_b = snap_a if cursor_b is cursor_a else (cursor_b.snapshot()
+    if hasattr(cursor_b, "snapshot") else cursor_b)
+
+    result = []
+    rt_a, rt_b = snap_a.root, snap_b.root
+    if rt_a.is_null or rt_b.is_null or not _keys_near(rt_a.key, rt_b.key, eps):
+        return result
+    stack = [(rt_a, rt_b)]
+    while stack:
+        a, b = stack.pop()
+        if a.is_leaf and b.is_leaf:
+            # only points near the other leaf can pair up
+            A = sorted(((pt[1][0], pt[1][0], pt) for pt in a.points.items()
+            if _point_near_key(pt[1], b.key, eps)), key = lambda e: e[0])
+            B = sorted(((pt[1][0], pt[1][0], pt) for pt in b.points.items()
+            if _point_near_key(pt[1], a.key, eps)), key = lambda e: e[0])
+            result.extend((x[0], y[0]) for x, y in _sweep(A, B, eps)
+            if test(x[1], y[1]))
+        elif a.height > b.height:
+            # trees of different heights: descend the taller one until both
+            # sides are at the same level
+            stack.extend((ch, b) for ch in a.children if _keys_near(ch.key, b.key, eps))
+        elif b.height > a.height:
+            stack.extend((a, ch) for ch in b.children if _keys_near(a.key, ch.key, eps))
+        else:
+            # only children near the other node can pair up
+            A = sorted(((ch.key.minima[0], ch.key.maxima[0], ch) for ch in a.children
+            if _keys_near(ch.key, b.key, eps)), key = lambda e: e[0])
+            B = sorted(((ch.key.minima[0], ch.key.maxima[0], ch) for ch in b.children
+            if _keys_near(a.key, ch.key, eps)), key = lambda e: e[0])
+            stack.extend((x, y) for x, y in _sweep(A, B, eps)
+            if _keys_near(x.key, y.key, eps))
+    return result
+
+
+def _keys_near(r, s, eps):
+    # whether r and s are at most eps apart along every axis; intersects
+    # for eps = 0
+    for i in range(0, r.dimension):
+        if r.minima[i] > s.maxima[i] + eps or s.minima[i] > r.maxima[i] + eps:
+            return False
+    return True
+
+
+def _point_near_key(P, r, eps):
+    for i in range(0, len(P)):
+        if P[i] < r.minima[i] - eps or r.maxima[i] + eps < P[i]:
+            return False
+    return True
+
+
+def _points_near(P, Q, eps):
+    for i in range(0, len(P)):
+        if abs(P[i] - Q[i]) > eps:
+            return False
+    return True
+
+
+def _sweep(A, B, eps):
+    """
+    Plane sweep: yields the pairs (x, y) of items of A and B, lists of
+    (lower, upper, item) sorted by lower, whose [lower, upper] intervals are
+    at most eps apart. Each list is scanned ahead only while its lower
+    bounds stay within eps of the current interval.
+    """
+    i = j = 0
+    while i < len(A) and j < len(B):
+        if A[i][0] <= B[j][0]:
+            bound, x = A[i][1] + eps, A[i][2]
+            k = j
+            while k < len(B) and B[k][0] <= bound:
+                yield x, B[k][2]
+                k += 1
+            i += 1
+        else:
+            bound, y = B[j][1] + eps, B[j][2]
+            k = i
+            while k < len(A) and A[k][0] <= bound:
+                yield A[k][2], y
+                k += 1
+            j += 1
+
+
+def _capacity(M_, m_):
+    """
+    Node capacity and minimum fill, defaulting to the module-level values
+    """
+    return (M if M_ is None else M_), (m if m_ is None else m_)
+
+
+def choose_split_axis_leaf(t, M=None, m=None):
+    M, m = _capacity(M, m)
+    if vct.enabled:
+        _, coords = vct.leaf_arrays(t)
+        return vct.choose_split_axis_leaf(coords, m, M)
+
     d = t.key.dimension
     margins = []
     for i in range(0,d):
@@ -478,7 +1493,12 @@ def choose_split_axis_leaf(t):
     return (min(margins))[1]
 
 
-def choose_split_index_leaf(t,axis):
+def choose_split_index_leaf(t, axis, M=None, m=None):
+    M, m = _capacity(M, m)
+    if vct.enabled:
+        _, coords = vct.leaf_arrays(t)
+        return vct.choose_split_index_leaf(coords, axis, m, M)
+
     kf = lambda k: (t.points[k])[axis]
     sorted_along_axis = sorted(list(t.points), key = kf)
 
@@ -498,7 +1518,12 @@ def choose_split_index_leaf(t,axis):
     return (min(scores))[2]
 
 
-def choose_split_axis(t):
+def choose_split_axis(t, M=None, m=None):
+    M, m = _capacity(M, m)
+    if vct.enabled:
+        lower, upper = vct.node_arrays(t)
+        return vct.choose_split_axis(lower, upper, m, M)
+
     d = t.key.dimension
     child_rects = t.get_child_rectangles()
 
@@ -527,7 +1552,12 @@ def choose_split_axis(t):
     return (min(margins))[1]
 
 
-def choose_split_index(t,axis):
+def choose_split_index(t, axis, M=None, m=None):
+    M, m = _capacity(M, m)
+    if vct.enabled:
+        lower, upper = vct.node_arrays(t)
+        return vct.choose_split_index(lower, upper, axis, m, M)
+
     child_rects = t.get_child_rectangles()
 
     lower_kf = lambda ch: ch.minima[axis]
@@ -558,22 +1588,373 @@ def choose_split_index(t,axis):
     return best[2], best[3]
 
 
-def create_tree_from_pts(pts_tuples):
+def quadratic_split(rects, m):
+    """
+    Guttman's quadratic split
+    -------------------------
+    Parameters:
+    -----------
+    rects: keys of the entries of an overflowing node
+    m: minimum number of entries per group
+
+    Returns:
+    --------
+    group_1, group_2: lists of indices into rects
+    """
+    # PickSeeds: the pair that would waste the most volume together
+    n = len(rects)
+    vols = [r.volume() for r in rects]
+    worst = None
+    for i in range(0, n):
+        for j in range(i + 1, n):
+            waste = rects[i].union_volume(rects[j]) - vols[i] - vols[j]
+            if worst is None or waste > worst[0]:
+                worst = (waste, i, j)
+    _, s1, s2 = worst
+
+    def pick_next(remaining, bb_1, bb_2):
+        # the entry with the greatest preference for one group
+        def preference(i):
+            d1 = bb_1.union_volume(rects[i]) - bb_1.volume()
+            d2 = bb_2.union_volume(rects[i]) - bb_2.volume()
+            return abs(d1 - d2)
+        return max(remaining, key = preference)
+
+    return _distribute(rects, m, s1, s2, pick_next)
+
+
+def linear_split(rects, m):
+    """
+    Guttman's linear split. Same parameters and result as quadratic_split.
+    """
+    # LinearPickSeeds: along each axis, the entries with the highest lower
+    # side and the lowest upper side, separated by the most relative to the
+    # extent of all entries along that axis
+    n = len(rects)
+    d = rects[0].dimension
+    best = None
+    for ax in range(0, d):
+        high_low = max(range(0, n), key = lambda i: rects[i].minima[ax])
+        low_high = min(range(0, n), key = lambda i: rects[i].maxima[ax])
+        if high_low == low_high:
+            continue
+        width = (max(r.maxima[ax] for r in rects)
+        - min(r.minima[ax] for r in rects))
+        separation = rects[high_low].minima[ax] - rects[low_high].maxima[ax]
+        if width > 0:
+            separation /= width
+        if best is None or separation > best[0]:
+            best = (separation, low_high, high_low)
+    if best is None:
+        best = (0.0, 0, 1)
+    _, s1, s2 = best
+
+    # entries are then taken in any order
+    pick_next = lambda remaining, bb_1, bb_2: remaining[0]
+    return _distribute(rects, m, s1, s2, pick_next)
+
+
+def _distribute(rects, m, s1, s2, pick_next):
+    """
+    Grow two groups from seeds s1 and s2, adding the entry chosen by
+    pick_next to the group needing the least enlargement for it, until one
+    group needs all remaining entries to reach m.
+    """
+    group_1, group_2 = [s1], [s2]
+    bb_1, bb_2 = rects[s1].copy(), rects[s2].copy()
+    remaining = [i for i in range(0, len(rects)) if i != s1 and i != s2]
+    while remaining:
+        if len(group_1) + len(remaining) == m:
+            group_1.extend(remaining)
+            break
+        if len(group_2) + len(remaining) == m:
+            group_2.extend(remaining)
+            break
+
+        i = pick_next(remaining, bb_1, bb_2)
+        remaining.remove(i)
+        d1 = bb_1.union_volume(rects[i]) - bb_1.volume()
+        d2 = bb_2.union_volume(rects[i]) - bb_2.volume()
+        key_1 = (d1, bb_1.volume(), len(group_1))
+        key_2 = (d2, bb_2.volume(), len(group_2))
+        if key_1 <= key_2:
+            group_1.append(i)
+            bb_1.expand(rects[i])
+        else:
+            group_2.append(i)
+            bb_2.expand(rects[i])
+    return group_1, group_2
+
+
+def create_tree_from_pts(pts_tuples, method=None, M=None, m=None, p=None,
+policy="rstar"):
     """
     Parameters
     ----------
     pts_tuples: list of pts as (key,value) tuples
+    method: None to insert the points one by one, otherwise a bulk loading
+    method passed on to RTCursor.bulk_load
+    M, m, p, policy: tree parameters, as for RTCursor
 
     Returns
     -------
     retv: an RTCursor to the instantiated tree
     """
+    if method is not None:
+        return RTCursor.bulk_load(pts_tuples, method, M, m, p, policy)
+
+    M, _ = _capacity(M, None)
     pt_dict = {k : v for k,v in pts_tuples[0:M-1]}
     starting_node = RStarTree(children = [], point_data = pt_dict)
 
-    retv = RTCursor(starting_node)
+    retv = RTCursor(starting_node, M, m, p, policy)
 
     for pt in pts_tuples[M-1:]:
         retv.insert(pt)
 
     return retv
+
+
+def pack_groups(entries, M=None, m=None):
+    """
+    Cut entries into consecutive groups of M. A short last group is evened
+    out with the one before it so that no group has fewer than m entries,
+    unless entries has fewer than m to begin with.
+    """
+    M, m = _capacity(M, m)
+    n = len(entries)
+    sizes = [M] * (n // M)
+    r = n % M
+    if r >= m or not sizes:
+        sizes.append(r)
+    elif r:
+        total = M + r
+        sizes[-1] = total - total // 2
+        sizes.append(total // 2)
+
+    groups = []
+    start = 0
+    for size in sizes:
+        if size:
+            groups.append(entries[start:start + size])
+        start += size
+    return groups
+
+
+def str_order(entries, center_of, M=None):
+    """
+    Sort-Tile-Recursive ordering of entries
+    ---------------------------------------
+    Parameters:
+    -----------
+    entries: list of entries to be packed into nodes of M
+    center_of: function giving the coordinates of an entry
+    M: node capacity the entries will be packed with
+
+    Returns:
+    --------
+    entries sorted into slabs along the first axis, each slab sorted into
+    slabs along the next axis and so on, so that consecutive groups of M
+    are tiles of the data. Slab sizes are multiples of M, hence groups
+    never straddle two slabs.
+    """
+    if not entries:
+        return entries
+    M, _ = _capacity(M, None)
+    d = len(center_of(entries[0]))
+    return _str_sort(entries, center_of, 0, d, M)
+
+
+def _str_sort(entries, center_of, axis, d, M):
+    entries = sorted(entries, key = lambda e: center_of(e)[axis])
+    if axis == d - 1 or len(entries) <= M:
+        return entries
+
+    # number of nodes to fill, and number of slabs along this axis: the
+    # smallest S with S**(d - axis) >= node_count
+    node_count = -(-len(entries) // M)
+    S = 1
+    while S ** (d - axis) < node_count:
+        S += 1
+    slab_size = -(-node_count // S) * M
+
+    result = []
+    for start in range(0, len(entries), slab_size):
+        slab = entries[start:start + slab_size]
+        result.extend(_str_sort(slab, center_of, axis + 1, d, M))
+    return result
+
+
+# Grid resolution per axis used by the space-filling curve orderings
+CURVE_BITS = 16
+
+
+def hilbert_order(entries, center_of, M=None):
+    """
+    Order entries along the Hilbert curve through their bounding box. Packing
+    in this order keeps overlap between nodes low.
+    """
+    return _curve_sort(entries, center_of, curves.hilbert_index)
+
+
+def morton_order(entries, center_of, M=None):
+    """
+    Order entries along the Z-order (Morton) curve through their bounding box.
+    Cheaper to compute than the Hilbert order, with somewhat worse locality.
+    """
+    return _curve_sort(entries, center_of, curves.morton_index)
+
+
+def _curve_sort(entries, center_of, index):
+    if not entries:
+        return entries
+    centers = [center_of(e) for e in entries]
+    d = len(centers[0])
+    lower = [min(c[i] for c in centers) for i in range(0,d)]
+    upper = [max(c[i] for c in centers) for i in range(0,d)]
+
+    keys = [index(curves.quantize(c, lower, upper, CURVE_BITS), CURVE_BITS)
+    for c in centers]
+    by_key = sorted(range(0, len(entries)), key = lambda i: keys[i])
+    return [entries[i] for i in by_key]
+
+
+class RTSnapshot:
+    """
+    Read-only version of a tree, made by RTCursor.snapshot. Offers the query
+    methods of RTCursor.
+    """
+    def __init__(self, root, epoch):
+        self.root = root
+        self.epoch = epoch
+
+
+    search = RTCursor.search
+    count = RTCursor.count
+    nearest = RTCursor.nearest
+    iter_nearest = RTCursor.iter_nearest
+    search_many = RTCursor.search_many
+    nearest_many = RTCursor.nearest_many
+    _leaves_in_window = RTCursor._leaves_in_window
+
+
+# magic, version, little-endian, integer ids, policy, dimension, M, m, p,
+# overlap_candidates, node count, point count. The arrays of flatten_tree
+# follow, the ids pickled unless they are integers.
+SNAPSHOT_HEADER = struct.Struct("<8sB??x16sIIIIIQQ")
+SNAPSHOT_MAGIC = b"PYRSTSNP"
+SNAPSHOT_VERSION = 1
+
+
+def flatten_tree(rt, bounds=False):
+    """
+    Flatten a tree into a few contiguous arrays
+    -------------------------------------------
+    Parameters:
+    -----------
+    rt: root of the tree, or of the subtree to flatten
+    bounds: whether to flatten the node keys too
+
+    Returns:
+    --------
+    kinds: array of 1 for leaves and 0 for inner nodes, one per node in
+    breadth-first order. Empty for a null tree.
+    counts: array of the entry count of each node, in the same order. The
+    children of a node are the nodes following those of the inner nodes
+    before it.
+    coords: array of the point coordinates of the leaves, point after point
+    and leaf after leaf
+    ids: the matching point ids, as an int64 array if they all fit one and as
+    a list otherwise
+    bounds: only if asked for, array of the minima then the maxima of each
+    node's key, in node order. Otherwise build_tree recomputes the keys.
+    """
+    nodes = [] if rt.is_null else [rt]
+    for t in nodes:
+        if not t.is_leaf:
+            nodes.extend(t.children)
+
+    kinds = array("b", [t.is_leaf for t in nodes])
+    counts = array("q", [len(t.points) if t.is_leaf else len(t.children)
+    for t in nodes])
+    leaves = [t for t in nodes if t.is_leaf]
+    coords = array("d", [x for t in leaves for P in t.points.values() for x in P])
+    ids = [k for t in leaves for k in t.points]
+
+    if all(type(k) is int for k in ids):
+        try:
+            ids = array("q", ids)
+        except OverflowError:
+            pass
+    if bounds:
+        bounds = array("d")
+        for t in nodes:
+            bounds.extend(t.key.minima)
+            bounds.extend(t.key.maxima)
+        return kinds, counts, coords, ids, bounds
+    return kinds, counts, coords, ids
+
+
+def build_tree(kinds, counts, coords, ids, bounds=None):
+    """
+    Rebuild a tree from the output of flatten_tree. Keys are taken from
+    bounds if given, and recomputed otherwise.
+
+    Returns:
+    --------
+    rt: root of the rebuilt tree
+    """
+    if not kinds:
+        return RStarTree()
+    d = len(coords) // len(ids) if len(ids) else 0
+    coords = coords.tolist()
+    points = [coords[j:j + d] for j in range(0, len(coords), d)]
+    if isinstance(ids, array):
+        ids = ids.tolist()
+
+    # offsets of each node's first child and first point
+    child_start = []
+    point_start = []
+    next_child = 1
+    next_point = 0
+    for is_leaf, n in zip(kinds, counts):
+        child_start.append(next_child)
+        point_start.append(next_point)
+        if is_leaf:
+            next_point += n
+        else:
+            next_child += n
+
+    # children follow their parents, so building back to front always finds
+    # a node's children built
+    nodes = [None] * len(kinds)
+    if bounds is not None:
+        bounds = bounds.tolist()
+        d = len(bounds) // (2 * len(kinds))
+    for i in range(len(kinds) - 1, -1, -1):
+        start, n = point_start[i], counts[i]
+        if kinds[i]:
+            entries = ([], dict(zip(ids[start:start + n], points[start:start + n])))
+        else:
+            start = child_start[i]
+            entries = (nodes[start:start + n], {})
+        if bounds is None:
+            nodes[i] = RStarTree(*entries)
+        else:
+            j = 2 * d * i
+            nodes[i] = RStarTree._with_key(*entries,
+            rct.Rectangle._from_bounds(bounds[j:j + d], bounds[j + d:j + 2 * d]))
+    return nodes[0]
+
+
+# Insertion policies of RTCursor, mapped to their split functions. "rstar" uses
+# the R* split methods of RTCursor.
+SPLIT_POLICIES = {"rstar": None, "quadratic": quadratic_split,
+"linear": linear_split}
+
+
+# Orderings available to RTCursor.bulk_load. Each takes a list of entries, a
+# function giving their coordinates and the node capacity, and returns the
+# entries in packing order.
+BULK_LOAD_METHODS = {"str": str_order, "hilbert": hilbert_order,
+"morton": morton_order}
@@ -0,0 +1,457 @@
+"""
+Disk-backed R*-trees for point sets too large to hold as Python objects.
+
+A NodeStore keeps every node of a tree as a small resident StoredRStarTree
+holding the node's key, height, parent and page number. The node's entries
+(the points of a leaf, the children of an inner node), which make up nearly
+all of a tree's memory, live in fixed-size pages of a file in the format of
+pyrstar.pagefile, and only the pages held by an LRU BufferPool are decoded in
+memory. Pages changed by inserts, deletes and splits are written back when
+evicted or on flush.
+
+An RTCursor made by NodeStore.cursor creates its nodes through the store, so
+insert and every query work on it unchanged. The cursor keeps no map of point
+ids to leaves, which would hold an entry per point in memory: delete, update
+and locate find a point's leaf by a spatial search and so take its current
+coordinates, and insert does not check that ids are unique. After flush the
+file is a complete page file: PagedTree can open it read-only, and NodeStore
+can reopen it for updates, which reads the pages of inner nodes only.
+
+Point ids must be integers representable in 64 bits.
+"""
+import collections
+import os
+import struct
+import tempfile
+
+from pyrstar import pagefile
+from pyrstar import rectangle as rct
+from pyrstar import rtree as rtr
+
+
+# Default number of node pages kept decoded in memory
+pool_size = 1024
+
+
+class BufferPool:
+    def __init__(self, capacity, load, write_back):
+        """
+        LRU cache of decoded pages
+        --------------------------
+        Parameters:
+        -----------
+        capacity: number of pages held at most
+        load: load(page) returns the decoded contents of page
+        write_back: write_back(page, contents) stores contents changed since
+        they were loaded, called on eviction and flush
+
+        hits and misses count the lookups served from memory and from disk,
+        evictions and writes the pages dropped and written back.
+        """
+        if capacity < 1:
+            raise ValueError(f"need a pool of at least one page, got {capacity}")
+        self.capacity = capacity
+        self.load = load
+        self.write_back = write_back
+
+        # page: [contents, dirty], least recently used first
+        self.frames = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+
+    def get(self, page):
+        """
+        Returns the contents of page, loading it if it is not held
+        """
+        frame = self.frames.get(page)
+        if frame is not None:
+            self.hits += 1
+            self.frames.move_to_end(page)
+            return frame[0]
+        self.misses += 1
+        contents = self.load(page)
+        self._admit(page, [contents, False])
+        return contents
+
+
+    def put(self, page, contents):
+        """
+        Hold new contents for page, to be written back
+        """
+        frame = self.frames.get(page)
+        if frame is not None:
+            frame[0] = contents
+            frame[1] = True
+            self.frames.move_to_end(page)
+        else:
+            self._admit(page, [contents, True])
+
+
+    def mark_dirty(self, page):
+        """
+        Flag page as about to change, loading it if needed. Call before
+        changing the contents returned by get: the changed contents are then
+        written back even if evicted straight away.
+        """
+        self.get(page)
+        self.frames[page][1] = True
+
+
+    def discard(self, page):
+        """
+        Drop page without writing it back
+        """
+        self.frames.pop(page, None)
+
+
+    def flush(self):
+        """
+        Write back every changed page, keeping them all held
+        """
+        for page, frame in self.frames.items():
+            if frame[1]:
+                self.write_back(page, frame[0])
+                self.writes += 1
+                frame[1] = False
+
+
+    def _admit(self, page, frame):
+        self.frames[page] = frame
+        while len(self.frames) > self.capacity:
+            old_page, (contents, dirty) = self.frames.popitem(last=False)
+            self.evictions += 1
+            if dirty:
+                self.write_back(old_page, contents)
+                self.writes += 1
+
+
+class StoredRStarTree(rtr.RStarTree):
+    """
+    An RStarTree node whose entries are kept in a NodeStore page. Use
+    NodeStore.new_node to create one. points and children read the entries
+    through the store's buffer pool; changes must go through the RStarTree
+    methods, which mark the page for write-back.
+    """
+    def __init__(self, store, children=None, point_data=None):
+        self.store = store
+        self.page = store.allocate(self)
+        super().__init__(children, point_data)
+
+
+    @classmethod
+    def _stub(cls, store, page, key, height, parent):
+        """
+        Resident part of a node already stored at page
+        """
+        t = object.__new__(cls)
+        t.store = store
+        t.page = page
+        t.key = key
+        t.height = height
+        t.is_leaf = height == 0
+        t.is_null = False
+        t.parent = parent
+        store.nodes[page] = t
+        return t
+
+
+    @property
+    def points(self):
+        if self.is_leaf:
+            return self.store.pool.get(self.page)
+        return {}
+
+
+    @points.setter
+    def points(self, point_data):
+        if self.is_leaf:
+            for k in point_data:
+                self.store.check_id(k)
+            self.store.pool.put(self.page, point_data)
+
+
+    @property
+    def children(self):
+        if self.is_leaf or self.is_null:
+            return []
+        return self.store.pool.get(self.page)
+
+
+    @children.setter
+    def children(self, children):
+        if not self.is_leaf and children:
+            self.store.pool.put(self.page, children)
+
+
+    def add_point_data(self, point_key, point_value):
+        self.store.check_id(point_key)
+        self.store.pool.mark_dirty(self.page)
+        super().add_point_data(point_key, point_value)
+
+
+    def remove_point_data(self, point_key):
+        self.store.pool.mark_dirty(self.page)
+        super().remove_point_data(point_key)
+
+
+    def add_child(self, rt):
+        self.store.pool.mark_dirty(self.page)
+        super().add_child(rt)
+
+
+    def remove_child(self, rt):
+        self.store.pool.mark_dirty(self.page)
+        super().remove_child(rt)
+
+
+    def release(self):
+        self.store.free(self)
+
+
+class NodeStore:
+    def __init__(self, path=None, pool_size=None):
+        """
+        Page file holding the nodes of one R*-tree
+        ------------------------------------------
+        Parameters:
+        -----------
+        path: the file. An existing page file is reopened; otherwise a new
+        tree is started in it. None uses an anonymous temporary file, for
+        trees that only need to outgrow memory.
+        pool_size: number of node pages kept decoded in memory. Defaults to
+        the module-level value.
+
+        Raises ValueError if path holds something other than a page file.
+        """
+        if pool_size is None:
+            pool_size = globals()["pool_size"]
+        self.pool = BufferPool(pool_size, self._read, self._write)
+        self.path = path
+
+        # page: resident node. Page 0 is the file header.
+        self.nodes = {}
+        self.free_pages = []
+        self.page_count = 1
+        self._cursor = None
+        self._header = None
+
+        if path is None:
+            self.file = tempfile.TemporaryFile()
+        elif os.path.exists(path) and os.path.getsize(path) > 0:
+            self.file = open(path, "r+b")
+            header = self.file.read(pagefile.HEADER.size)
+            if len(header) < pagefile.HEADER.size or not header.startswith(pagefile.MAGIC):
+                self.file.close()
+                raise ValueError(f"{path} is not a page file")
+            self._header = pagefile.HEADER.unpack(header)
+            if self._header[1] != pagefile.VERSION:
+                self.file.close()
+                raise ValueError(f"{path} has page format version "
+                f"{self._header[1]}, expected {pagefile.VERSION}")
+        else:
+            self.file = open(path, "w+b")
+
+        # set once the tree's node capacity and dimension are known
+        self.page_size = None
+        self.dimension = None
+        self.M = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def cursor(self, M=None, m=None, p=None, policy="rstar",
+    overlap_candidates=None):
+        """
+        Returns the RTCursor over the store's tree. For a new store the
+        parameters are as for RTCursor; a reopened store takes M, m, p and
+        policy from the file. A store has a single cursor: later calls return
+        it again.
+        """
+        if self._cursor is not None:
+            return self._cursor
+        if self._header is None:
+            self._cursor = rtr.RTCursor(rtr.RStarTree(), M, m, p, policy,
+            overlap_candidates, node_factory=self.new_node, index_ids=False)
+            self.M = self._cursor.M
+            return self._cursor
+
+        (_, _, self.page_size, self.dimension, M, m, p, policy, root_page,
+        self.page_count, point_count) = self._header
+        self.M = M
+        root = rtr.RStarTree()
+        if root_page:
+            root = self._open_tree(root_page)
+        self._cursor = rtr.RTCursor(root, M, m, p,
+        policy.rstrip(b"\x00").decode("ascii"), overlap_candidates,
+        node_factory=self.new_node, index_ids=False)
+        self._cursor._point_count = point_count
+        return self._cursor
+
+
+    def bulk_load(self, pts_tuples, method="str", M=None, m=None, p=None,
+    policy="rstar"):
+        """
+        Start the store's tree by bulk loading pts_tuples, as
+        RTCursor.bulk_load. Returns the store's cursor. Raises ValueError if
+        the store already holds a tree.
+        """
+        if self._cursor is not None or self._header is not None:
+            raise ValueError("the store already holds a tree")
+        # validates the parameters before any page is written
+        self.M = rtr.RTCursor(rtr.RStarTree(), M, m, p, policy).M
+        self._cursor = rtr.RTCursor.bulk_load(pts_tuples, method, M, m, p,
+        policy, node_factory=self.new_node, index_ids=False)
+        self._cursor._point_count = len(pts_tuples)
+        return self._cursor
+
+
+    def new_node(self, children=None, point_data=None):
+        """
+        Node factory for RTCursor: a StoredRStarTree, or a plain null node
+        when there are no entries
+        """
+        if not children and not point_data:
+            return rtr.RStarTree()
+        if self.page_size is None:
+            self._set_dimension(len(next(iter(point_data.values()))))
+        return StoredRStarTree(self, children, point_data)
+
+
+    def allocate(self, t):
+        """
+        Assign a page to the new node t
+        """
+        if self.free_pages:
+            page = self.free_pages.pop()
+        else:
+            page = self.page_count
+            self.page_count += 1
+        self.nodes[page] = t
+        return page
+
+
+    def free(self, t):
+        """
+        Take back the page of t, which has left the tree
+        """
+        if self.nodes.get(t.page) is t:
+            del self.nodes[t.page]
+            self.pool.discard(t.page)
+            self.free_pages.append(t.page)
+
+
+    def check_id(self, point_id):
+        if type(point_id) is not int or not -2**63 <= point_id < 2**63:
+            raise ValueError(f"stored trees need 64-bit integer point ids, "
+            f"got {point_id!r}")
+
+
+    def flush(self):
+        """
+        Write back every changed page, rewrite the inner nodes (whose pages
+        hold their children's keys) and the file header, leaving the file a
+        complete page file
+        """
+        self.pool.flush()
+        cursor = self._cursor
+        if cursor is None or self.page_size is None:
+            return
+        for t in list(self.nodes.values()):
+            if not t.is_leaf:
+                self._write(t.page, t.children)
+
+        root = cursor.root
+        d = self.dimension
+        page = bytearray(self.page_size)
+        pagefile.HEADER.pack_into(page, 0, pagefile.MAGIC, pagefile.VERSION,
+        self.page_size, d, cursor.M, cursor.m, cursor.p,
+        cursor.policy.encode("ascii"), 0 if root.is_null else root.page,
+        self.page_count, len(cursor))
+        if not root.is_null:
+            struct.pack_into(f"<{2 * d}d", page, pagefile.HEADER.size,
+            *root.key.minima, *root.key.maxima)
+        self.file.seek(0)
+        self.file.write(page)
+        self.file.flush()
+
+
+    def close(self):
+        """
+        Flush, then close the file
+        """
+        if self.file.closed:
+            return
+        if self.path is not None:
+            self.flush()
+        self.file.close()
+
+
+    def _set_dimension(self, d):
+        M = self.M if self.M is not None else rtr.M
+        # nodes hold M + 1 entries while their overflow is treated
+        needed = max(pagefile.node_page_bytes(M + 1, d, True),
+        pagefile.node_page_bytes(M + 1, d, False),
+        pagefile.HEADER.size + 16 * d)
+        self.page_size = -(-needed // pagefile.PAGE_SIZE) * pagefile.PAGE_SIZE
+        self.dimension = d
+
+
+    def _open_tree(self, root_page):
+        """
+        Create the resident nodes of a reopened file, reading the pages of
+        inner nodes only
+        """
+        d = self.dimension
+        self.file.seek(pagefile.HEADER.size)
+        bounds = struct.unpack(f"<{2 * d}d", self.file.read(16 * d))
+        key = rct.Rectangle._from_bounds(list(bounds[:d]), list(bounds[d:]))
+        height = pagefile.unpack_node(self._read_page(root_page), 0, d).height
+        root = StoredRStarTree._stub(self, root_page, key, height, None)
+
+        stack = [root]
+        while stack:
+            t = stack.pop()
+            if t.is_leaf:
+                continue
+            node = pagefile.unpack_node(self._read_page(t.page), 0, d)
+            for key, page in zip(node.keys, node.children):
+                stack.append(StoredRStarTree._stub(self, page, key,
+                t.height - 1, t))
+
+        in_use = set(self.nodes)
+        self.free_pages = [page for page in range(self.page_count - 1, 0, -1)
+        if page not in in_use]
+        return root
+
+
+    def _read_page(self, page):
+        self.file.seek(page * self.page_size)
+        return self.file.read(self.page_size)
+
+
+    def _read(self, page):
+        node = pagefile.unpack_node(self._read_page(page), 0, self.dimension)
+        if node.is_leaf:
+            return dict(node.points)
+        return [self.nodes[ch] for ch in node.children]
+
+
+    def _write(self, page, contents):
+        buf = bytearray(self.page_size)
+        t = self.nodes[page]
+        if t.is_leaf:
+            pagefile.pack_leaf(buf, contents, t.height, self.dimension)
+        else:
+            pagefile.pack_node(buf, [ch.key for ch in contents],
+            [ch.page for ch in contents], t.height, self.dimension)
+        self.file.seek(page * self.page_size)
+        self.file.write(buf)
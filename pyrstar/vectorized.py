@@ -0,0 +1,351 @@
+"""
+NumPy versions of the R*-tree split computations. NumPy is optional: when it
+cannot be imported, enabled is False and pyrstar.rtree keeps to its pure
+Python routines.
+
+Every split distribution puts the first k entries of a sorted order in one
+group and the rest in the other. Prefix and suffix running minima/maxima of
+the sorted bounds give the bounding boxes of both groups for every k at once,
+so each axis costs one sort and a few array passes instead of rebuilding
+bounding boxes per distribution.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Set to False to force the pure Python split routines
+enabled = np is not None
+
+
+def leaf_arrays(t):
+    """
+    Returns (ids, coords): the point ids of leaf t as an object array and
+    their coordinates as an (n, d) float matrix, in the same order.
+    """
+    ids = np.array(list(t.points), dtype=object)
+    coords = np.array(list(t.points.values()), dtype=float)
+    return ids, coords
+
+
+def node_arrays(t):
+    """
+    Returns (lower, upper): (n, d) matrices of the minima and maxima of the
+    keys of t's children, in the order of t.children.
+    """
+    lower = np.array([ch.key.minima for ch in t.children], dtype=float)
+    upper = np.array([ch.key.maxima for ch in t.children], dtype=float)
+    return lower, upper
+
+
+def distribution_scores(lower, upper, order, m, M):
+    """
+    Score the split distributions of entries taken in the given order
+    -----------------------------------------------------------------
+    Parameters:
+    -----------
+    lower, upper: (n, d) matrices of entry bounds. For points both are the
+    coordinate matrix.
+    order: permutation of the entries to split
+    m, M: minimum and maximum node fill
+
+    Returns:
+    --------
+    sizes: size of the first group of each distribution
+    margins: sum of the perimeters of both groups' bounding boxes
+    overlaps: volume of the intersection of both bounding boxes
+    volumes: sum of the volumes of both bounding boxes
+    """
+    lo = lower[order]
+    hi = upper[order]
+    d = lo.shape[1]
+
+    prefix_lo = np.minimum.accumulate(lo, axis=0)
+    prefix_hi = np.maximum.accumulate(hi, axis=0)
+    suffix_lo = np.minimum.accumulate(lo[::-1], axis=0)[::-1]
+    suffix_hi = np.maximum.accumulate(hi[::-1], axis=0)[::-1]
+
+    # same distributions as the pure Python routines: first group sizes
+    # m, ..., M - m
+    sizes = np.arange(m, M - m + 1)
+    lo_1, hi_1 = prefix_lo[sizes - 1], prefix_hi[sizes - 1]
+    lo_2, hi_2 = suffix_lo[sizes], suffix_hi[sizes]
+
+    ext_1 = hi_1 - lo_1
+    ext_2 = hi_2 - lo_2
+    margins = (2**(d-1)) * (ext_1.sum(axis=1) + ext_2.sum(axis=1))
+    volumes = ext_1.prod(axis=1) + ext_2.prod(axis=1)
+
+    ext_12 = np.minimum(hi_1, hi_2) - np.maximum(lo_1, lo_2)
+    overlaps = np.where((ext_12 > 0).all(axis=1), ext_12.prod(axis=1), 0.0)
+
+    return sizes, margins, overlaps, volumes
+
+
+def choose_split_axis_leaf(coords, m, M):
+    """
+    Axis whose sorted order gives the least total margin over all
+    distributions. Ties go to the lowest axis.
+    """
+    d = coords.shape[1]
+    S = [distribution_scores(coords, coords,
+    np.argsort(coords[:, i], kind="stable"), m, M)[1].sum() for i in range(0,d)]
+    return int(np.argmin(S))
+
+
+def choose_split_index_leaf(coords, axis, m, M):
+    """
+    Size of the first group of the distribution along axis with least
+    overlap, then least volume. Ties go to the smallest size.
+    """
+    order = np.argsort(coords[:, axis], kind="stable")
+    sizes, _, overlaps, volumes = distribution_scores(coords, coords, order, m, M)
+    best = np.lexsort((sizes, volumes, overlaps))[0]
+    return int(sizes[best])
+
+
+def choose_split_axis(lower, upper, m, M):
+    """
+    Node version of choose_split_axis_leaf: both the order by lower and by
+    upper bounds count towards an axis' margin.
+    """
+    d = lower.shape[1]
+    S = []
+    for i in range(0,d):
+        by_lower = np.argsort(lower[:, i], kind="stable")
+        by_upper = np.argsort(upper[:, i], kind="stable")
+        S_i = distribution_scores(lower, upper, by_lower, m, M)[1].sum()
+        S_i += distribution_scores(lower, upper, by_upper, m, M)[1].sum()
+        S.append(S_i)
+    return int(np.argmin(S))
+
+
+def choose_split_index(lower, upper, axis, m, M):
+    """
+    Node version of choose_split_index_leaf. Returns (size, is_lower) where
+    is_lower tells whether the children are to be sorted by lower bound.
+    Ties go to the smallest size, lower bound first.
+    """
+    by_lower = np.argsort(lower[:, axis], kind="stable")
+    by_upper = np.argsort(upper[:, axis], kind="stable")
+    sizes, _, ov_lower, vol_lower = distribution_scores(lower, upper, by_lower, m, M)
+    _, _, ov_upper, vol_upper = distribution_scores(lower, upper, by_upper, m, M)
+
+    # interleave as (size m, lower), (size m, upper), (size m + 1, lower), ...
+    overlaps = np.column_stack((ov_lower, ov_upper)).ravel()
+    volumes = np.column_stack((vol_lower, vol_upper)).ravel()
+    position = np.arange(len(overlaps))
+    best = np.lexsort((position, volumes, overlaps))[0]
+    return int(sizes[best // 2]), bool(best % 2 == 0)
+
+
+def overlap_enlargements(t, candidates, entry):
+    """
+    Vector version of rtree.overlap_enlargement_required for several
+    candidate children of t at once
+    """
+    lower, upper = node_arrays(t)
+    position = {id(ch): i for i, ch in enumerate(t.children)}
+    idx = np.array([position[id(ch)] for ch in candidates])
+    rows = np.arange(len(idx))
+
+    def overlaps(cand_lo, cand_hi):
+        ext = (np.minimum(cand_hi[:, None, :], upper[None])
+        - np.maximum(cand_lo[:, None, :], lower[None]))
+        vol = np.where((ext > 0).all(axis=2), ext.prod(axis=2), 0.0)
+        # a candidate does not overlap itself
+        vol[rows, idx] = 0.0
+        return vol.sum(axis=1)
+
+    enlarged_lo = np.minimum(lower[idx], np.array(entry.minima, dtype=float))
+    enlarged_hi = np.maximum(upper[idx], np.array(entry.maxima, dtype=float))
+    return overlaps(enlarged_lo, enlarged_hi) - overlaps(lower[idx], upper[idx])
+
+
+def search_many(rt, lower, upper):
+    """
+    Batched window query
+    --------------------
+    Parameters:
+    -----------
+    rt: root of the tree to search
+    lower, upper: (q, d) matrices of window bounds, one row per query
+
+    Returns:
+    --------
+    offsets: array of q + 1 ints; the results of query i are entries
+    offsets[i]:offsets[i+1] of ids and coords
+    ids: object array of point ids
+    coords: (n, d) matrix of point coordinates
+
+    Each node is visited at most once, with the set of queries whose windows
+    reach it, and all of them are tested against its children at once.
+    """
+    q, d = lower.shape
+    hit_queries = []
+    hit_ids = []
+    hit_coords = []
+
+    if not rt.is_null and q:
+        root_lo = np.array(rt.key.minima, dtype=float)
+        root_hi = np.array(rt.key.maxima, dtype=float)
+        reach = ((lower <= root_hi) & (root_lo <= upper)).all(axis=1)
+        stack = [(rt, np.nonzero(reach)[0])]
+    else:
+        stack = []
+
+    while stack:
+        t, active = stack.pop()
+        if not len(active):
+            continue
+        lo = lower[active, None, :]
+        hi = upper[active, None, :]
+        if t.is_leaf:
+            ids, coords = leaf_arrays(t)
+            inside = ((lo <= coords[None]) & (coords[None] <= hi)).all(axis=2)
+            qi, pi = np.nonzero(inside)
+            hit_queries.append(active[qi])
+            hit_ids.append(ids[pi])
+            hit_coords.append(coords[pi])
+        else:
+            child_lo, child_hi = node_arrays(t)
+            reach = ((lo <= child_hi[None]) & (child_lo[None] <= hi)).all(axis=2)
+            for j, ch in enumerate(t.children):
+                stack.append((ch, active[reach[:, j]]))
+
+    if not hit_queries:
+        return (np.zeros(q + 1, dtype=int), np.empty(0, dtype=object),
+        np.empty((0, d)))
+
+    queries = np.concatenate(hit_queries)
+    order = np.argsort(queries, kind="stable")
+    offsets = np.zeros(q + 1, dtype=int)
+    offsets[1:] = np.cumsum(np.bincount(queries, minlength=q))
+    ids = np.concatenate(hit_ids)[order]
+    coords = np.concatenate(hit_coords)[order]
+    return offsets, ids, coords
+
+
+def nearest_many(rt, points, k):
+    """
+    Batched k-nearest-neighbor query
+    --------------------------------
+    Parameters:
+    -----------
+    rt: root of the tree to search
+    points: (q, d) matrix of query points
+    k: number of neighbors wanted per query
+
+    Returns:
+    --------
+    ids: (q, k') object array of point ids, nearest first, where k' is k or
+    the number of points in the tree if that is smaller
+    coords: (q, k', d) matrix of their coordinates
+
+    Depth-first branch and bound over the whole batch. Each query keeps its
+    k best candidates so far; a subtree is visited with the queries whose
+    MINDIST to its key is below their current k-th best distance. To start
+    with useful bounds, every query is first sent down to the leaf its
+    greedy MINDIST descent ends in.
+    """
+    q, d = points.shape
+    best = _Candidates(q, k, d)
+
+    if rt.is_null or k <= 0:
+        return best.ids[:, :0], best.coords[:, :0]
+    if not q:
+        # k' still follows from the number of points in the tree
+        found = 0
+        stack = [rt]
+        while stack and found < k:
+            t = stack.pop()
+            if t.is_leaf:
+                found += t.get_point_count()
+            else:
+                stack.extend(t.children)
+        found = min(found, k)
+        return best.ids[:, :found], best.coords[:, :found]
+
+    # seed each query's bound from one leaf, visiting each node once for all
+    # the queries whose greedy descent passes through it
+    seed_leaf = np.zeros(q, dtype=np.int64)
+    stack = [(rt, np.arange(q))]
+    while stack:
+        t, active = stack.pop()
+        if t.is_leaf:
+            best.merge_leaf(t, active, points[active])
+            seed_leaf[active] = id(t)
+        else:
+            mindist = _mindist(t, points[active])
+            choice = mindist.argmin(axis=1)
+            for j in np.unique(choice):
+                stack.append((t.children[j], active[choice == j]))
+
+    stack = [(rt, np.arange(q), np.zeros(q))]
+    while stack:
+        t, active, bound_below = stack.pop()
+
+        # bounds may have tightened since t was pushed
+        active = active[bound_below < best.dist[active, k-1]]
+        if t.is_leaf:
+            active = active[seed_leaf[active] != id(t)]
+        if not len(active):
+            continue
+        P = points[active]
+
+        if t.is_leaf:
+            best.merge_leaf(t, active, P)
+        else:
+            mindist = _mindist(t, P)
+
+            # push the most promising child last so it is visited first
+            for j in np.argsort(mindist.min(axis=0))[::-1]:
+                reach = mindist[:, j] < best.dist[active, k-1]
+                if reach.any():
+                    stack.append((t.children[j], active[reach], mindist[reach, j]))
+
+    found = int(np.isfinite(best.dist[0]).sum())
+    return best.ids[:, :found], best.coords[:, :found]
+
+
+def _mindist(t, P):
+    """
+    (a, c) matrix of squared MINDIST from each row of P to each child key of t
+    """
+    child_lo, child_hi = node_arrays(t)
+    gap = np.maximum(np.maximum(child_lo[None] - P[:, None, :],
+    P[:, None, :] - child_hi[None]), 0.0)
+    return (gap ** 2).sum(axis=2)
+
+
+class _Candidates:
+    """
+    The k best points found so far for each query of a batch, nearest first
+    """
+    def __init__(self, q, k, d):
+        self.k = k
+        self.dist = np.full((q, k), np.inf)
+        self.ids = np.empty((q, k), dtype=object)
+        self.coords = np.zeros((q, k, d))
+
+
+    def merge_leaf(self, t, active, P):
+        """
+        Merge the points of leaf t into the candidates of queries active,
+        whose coordinates are the rows of P
+        """
+        ids, coords = leaf_arrays(t)
+        a, n, d = len(active), len(ids), coords.shape[1]
+        dist = ((P[:, None, :] - coords[None]) ** 2).sum(axis=2)
+
+        cand_dist = np.concatenate((self.dist[active], dist), axis=1)
+        cand_ids = np.concatenate((self.ids[active],
+        np.broadcast_to(ids, (a, n))), axis=1)
+        cand_coords = np.concatenate((self.coords[active],
+        np.broadcast_to(coords, (a, n, d))), axis=1)
+
+        keep = np.argsort(cand_dist, axis=1, kind="stable")[:, :self.k]
+        self.dist[active] = np.take_along_axis(cand_dist, keep, axis=1)
+        self.ids[active] = np.take_along_axis(cand_ids, keep, axis=1)
+        self.coords[active] = np.take_along_axis(cand_coords, keep[:, :, None], axis=1)
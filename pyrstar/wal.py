@@ -0,0 +1,344 @@
+"""
+Write-ahead logging and crash recovery for a mutable R*-tree.
+
+A DurableIndex applies inserts, deletes and updates to an RTCursor and
+records each one in an append-only WriteAheadLog. Records are buffered and
+made durable together, one fsync per group commit: when batch_size of them
+are pending, on commit(), or on checkpoint. checkpoint() writes the tree to a
+snapshot file (see RTCursor.to_bytes) and empties the log, so that reopening
+an index loads the snapshot and replays only the records logged after it.
+
+Log record layout (little-endian): RECORD (crc32 of the rest, payload
+length, log sequence number, operation) followed by the payload, either an
+int64 point id and the point's float64 coordinates, or, for point ids that
+are not 64-bit integers, the pickled (id, point) tuple. A torn or corrupt
+record ends the log: it and everything after it are dropped on reopening.
+"""
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+from pyrstar import rtree as rtr
+
+
+# crc32, payload length, log sequence number, operation
+RECORD = struct.Struct("<IIqB")
+_CHECKED = struct.Struct("<IqB")
+
+INSERT = 1
+DELETE = 2
+UPDATE = 3
+# flags a pickled payload
+PICKLED = 0x80
+
+# Default number of records made durable together
+batch_size = 64
+
+
+class WriteAheadLog:
+    def __init__(self, path, batch_size=None, next_lsn=1):
+        """
+        Append-only log of tree operations
+        ----------------------------------
+        Parameters:
+        -----------
+        path: the log file, created if missing. A torn tail left by a crash
+        is cut off.
+        batch_size: number of appended records after which the pending ones
+        are committed. Defaults to the module-level value; 1 commits every
+        record.
+        next_lsn: sequence number of the first record if the log is empty
+
+        lsn is the sequence number of the last record appended, durable_lsn
+        that of the last record known to be on disk. syncs counts fsyncs.
+        """
+        if batch_size is None:
+            batch_size = globals()["batch_size"]
+        if batch_size < 1:
+            raise ValueError(f"need a batch size of at least 1, got {batch_size}")
+        self.batch_size = batch_size
+        self.path = path
+
+        records = list(self._scan(path))
+        self.file = open(path, "ab")
+        self.file.truncate(self._valid_length)
+        self.lsn = records[-1][0] if records else next_lsn - 1
+        self.durable_lsn = self.lsn
+        self.syncs = 0
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._syncing = False
+
+
+    def append(self, op, point_id, point=None):
+        """
+        Buffer a record, committing the pending records once batch_size of
+        them have accumulated. Returns the record's sequence number.
+        """
+        with self._lock:
+            self.lsn += 1
+            lsn = self.lsn
+            self._pending.append(encode_record(lsn, op, point_id, point))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.commit(lsn)
+        return lsn
+
+
+    def commit(self, lsn=None):
+        """
+        Group commit: return once every record up to lsn (by default, every
+        record appended so far) is on disk. Concurrent callers share fsyncs:
+        a caller finding a sync under way waits for it, and the next sync
+        takes everything appended meanwhile.
+        """
+        with self._lock:
+            if lsn is None:
+                lsn = self.lsn
+            while self.durable_lsn < lsn:
+                if self._syncing:
+                    self._synced.wait()
+                    continue
+                pending, self._pending = self._pending, []
+                target = self.lsn
+                self._syncing = True
+                self._lock.release()
+                try:
+                    self.file.write(b"".join(pending))
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                finally:
+                    self._lock.acquire()
+                    self._syncing = False
+                    self._synced.notify_all()
+                self.syncs += 1
+                self.durable_lsn = target
+
+
+    def records(self):
+        """
+        Yields (lsn, op, point id, point) for every record on disk
+        """
+        self.commit()
+        for record in self._scan(self.path):
+            yield record
+
+
+    def truncate(self):
+        """
+        Drop every record, committed or not, e.g. once a snapshot holds them.
+        Sequence numbers carry on from the last one appended.
+        """
+        with self._lock:
+            while self._syncing:
+                self._synced.wait()
+            self._pending = []
+            self.file.truncate(0)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.durable_lsn = self.lsn
+
+
+    def close(self):
+        if not self.file.closed:
+            self.commit()
+            self.file.close()
+
+
+    def _scan(self, path):
+        """
+        Yields the decoded records of the file at path, stopping at the first
+        torn or corrupt one. Sets _valid_length to the bytes before it.
+        """
+        self._valid_length = 0
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + RECORD.size <= len(data):
+            crc, length, lsn, op = RECORD.unpack_from(data, offset)
+            end = offset + RECORD.size + length
+            if end > len(data):
+                break
+            payload = data[offset + RECORD.size:end]
+            if zlib.crc32(payload, zlib.crc32(_CHECKED.pack(length, lsn, op))) != crc:
+                break
+            offset = end
+            self._valid_length = offset
+            yield (lsn, op & ~PICKLED) + decode_payload(op, payload)
+
+
+def encode_record(lsn, op, point_id, point=None):
+    """
+    Bytes of a log record, see the module docstring
+    """
+    if type(point_id) is int and -2**63 <= point_id < 2**63:
+        coords = [] if point is None else point
+        payload = struct.pack(f"<q{len(coords)}d", point_id, *coords)
+    else:
+        op |= PICKLED
+        payload = pickle.dumps((point_id, point), pickle.HIGHEST_PROTOCOL)
+    crc = zlib.crc32(payload, zlib.crc32(_CHECKED.pack(len(payload), lsn, op)))
+    return RECORD.pack(crc, len(payload), lsn, op) + payload
+
+
+def decode_payload(op, payload):
+    """
+    Returns (point id, point) from a record payload; point is None for
+    deletes
+    """
+    if op & PICKLED:
+        return pickle.loads(payload)
+    d = (len(payload) - 8) // 8
+    values = struct.unpack(f"<q{d}d", payload)
+    return values[0], (list(values[1:]) if d else None)
+
+
+class DurableIndex:
+    def __init__(self, directory, M=None, m=None, p=None, policy="rstar",
+    batch_size=None, checkpoint_every=None):
+        """
+        R*-tree whose changes survive crashes
+        -------------------------------------
+        Parameters:
+        -----------
+        directory: holds the snapshot and the log, created if missing. An
+        index left there is recovered: its snapshot is loaded and the log
+        records after it replayed.
+        M, m, p, policy: tree parameters, as for RTCursor, used when starting
+        a new index, whose empty snapshot is written straight away. A
+        recovered index keeps those of its snapshot.
+        batch_size: records per group commit, as for WriteAheadLog. A change
+        is durable once committed; commit() forces it.
+        checkpoint_every: if given, checkpoint after that many changes,
+        bounding the log replayed on recovery
+
+        cursor is the RTCursor holding the tree, for queries. Change the tree
+        through the index only, or the changes will not be logged.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, "snapshot")
+        self.log_path = os.path.join(directory, "wal")
+        self.checkpoint_every = checkpoint_every
+
+        # the snapshot starts with the sequence number of the last record it
+        # holds
+        snapshot_lsn = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f:
+                data = f.read()
+            snapshot_lsn = struct.unpack_from("<q", data)[0]
+            self.cursor = rtr.RTCursor.from_bytes(memoryview(data)[8:])
+            self.log = WriteAheadLog(self.log_path, batch_size, snapshot_lsn + 1)
+        else:
+            # the tree parameters are only recorded in snapshots
+            self.cursor = rtr.RTCursor(rtr.RStarTree(), M, m, p, policy)
+            self.log = WriteAheadLog(self.log_path, batch_size)
+            self.checkpoint()
+
+        self.replayed = 0
+        for lsn, op, point_id, point in self.log.records():
+            # records older than the snapshot survive a crash between
+            # writing it and truncating the log
+            if lsn > snapshot_lsn:
+                self._apply(op, point_id, point)
+                self.replayed += 1
+        self._changes = self.replayed
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def insert(self, point_data):
+        """
+        RTCursor.insert, logged
+        """
+        self.cursor.insert(point_data)
+        self._log(INSERT, *point_data)
+
+
+    def delete(self, point_id):
+        """
+        RTCursor.delete, logged
+        """
+        self.cursor.delete(point_id)
+        self._log(DELETE, point_id)
+
+
+    def update(self, point_id, new_point):
+        """
+        RTCursor.update, logged. Returns whether the point moved in place.
+        """
+        in_place = self.cursor.update(point_id, new_point)
+        self._log(UPDATE, point_id, new_point)
+        return in_place
+
+
+    def commit(self):
+        """
+        Make every change so far durable
+        """
+        self.log.commit()
+
+
+    def checkpoint(self):
+        """
+        Write the tree to the snapshot file, replacing it atomically, then
+        empty the log
+        """
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack("<q", self.log.lsn))
+            f.write(self.cursor.to_bytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        _fsync_directory(os.path.dirname(self.snapshot_path))
+        self.log.truncate()
+        self._changes = 0
+
+
+    def close(self):
+        self.log.close()
+
+
+    def _log(self, op, point_id, point=None):
+        self.log.append(op, point_id, point)
+        self._changes += 1
+        if self.checkpoint_every is not None and self._changes >= self.checkpoint_every:
+            self.checkpoint()
+
+
+    def _apply(self, op, point_id, point):
+        if op == INSERT:
+            self.cursor.insert((point_id, point))
+        elif op == DELETE:
+            self.cursor.delete(point_id)
+        elif op == UPDATE:
+            self.cursor.update(point_id, point)
+        else:
+            raise ValueError(f"unknown log operation {op}")
+
+
+def _fsync_directory(directory):
+    # makes a rename durable; not supported everywhere
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
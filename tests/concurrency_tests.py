@@ -0,0 +1,221 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import copy
+import pickle
+import random
+import threading
+import time
+import unittest
+
+from pyrstar import concurrency
+from pyrstar import rectangle as rct
+from pyrstar import rtree as rtr
+from tests.rtree_tests import random_points
+
+
+class TestReadWriteLock(unittest.TestCase):
+    def test_readers_share(self):
+        lock = concurrency.ReadWriteLock()
+        inside = threading.Barrier(3, timeout=5)
+
+        def read():
+            with lock.read_locked():
+                inside.wait()
+
+        threads = [threading.Thread(target=read) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertFalse(inside.broken)
+
+
+    def test_writer_excludes_readers(self):
+        lock = concurrency.ReadWriteLock()
+        events = []
+        lock.acquire_write()
+        reader = threading.Thread(target=lambda: (lock.acquire_read(),
+        events.append("read"), lock.release_read()))
+        reader.start()
+        time.sleep(0.05)
+        events.append("write")
+        lock.release_write()
+        reader.join()
+        self.assertEqual(["write", "read"], events)
+
+
+    def test_waiting_writer_goes_first(self):
+        lock = concurrency.ReadWriteLock()
+        events = []
+        lock.acquire_read()
+        writer = threading.Thread(target=lambda: (lock.acquire_write(),
+        events.append("write"), lock.release_write()))
+        writer.start()
+        time.sleep(0.05)
+        reader = threading.Thread(target=lambda: (lock.acquire_read(),
+        events.append("read"), lock.release_read()))
+        reader.start()
+        time.sleep(0.05)
+        self.assertEqual([], events)
+        lock.release_read()
+        writer.join()
+        reader.join()
+        self.assertEqual(["write", "read"], events)
+
+
+    def test_reentrancy(self):
+        lock = concurrency.ReadWriteLock()
+        with lock.write_locked():
+            with lock.write_locked():
+                with lock.read_locked():
+                    pass
+        with lock.read_locked():
+            with lock.read_locked():
+                with self.assertRaises(RuntimeError):
+                    lock.acquire_write()
+        with lock.write_locked():
+            pass
+
+
+class TestConcurrentRTCursor(unittest.TestCase):
+    def test_cursor_api(self):
+        data = random_points(300, seed=21)
+        cursor = concurrency.ConcurrentRTCursor.bulk_load(data, M=8)
+        self.assertIsInstance(cursor, concurrency.ConcurrentRTCursor)
+        cursor.insert((-1, [0, 0]))
+        cursor.update(3, [1, 1])
+        cursor.delete(4)
+        self.assertEqual(3, cursor.nearest([1, 1], 1)[0][0])
+        it = cursor.iter_nearest([1, 1])
+        next(it)
+        it.close()
+        cursor.insert((-2, [2, 2]))
+
+
+    def test_iter_nearest_holds_no_lock(self):
+        data = random_points(300, seed=23)
+        cursor = concurrency.ConcurrentRTCursor.bulk_load(data, M=8)
+        kf = lambda x: rtr.point_distance_squared([1, 1], x[1])
+        expected = sorted(data, key = kf)
+
+        # an unfinished iterator holds up no write on its own thread
+        it = cursor.iter_nearest([1, 1])
+        self.assertEqual(expected[0], next(it))
+        cursor.insert((-1, [1, 1]))
+        cursor.delete(expected[1][0])
+        self.assertEqual(expected[1:4], [next(it) for _ in range(3)])
+
+        # nor once closed on another thread
+        it = cursor.iter_nearest([1, 1])
+        next(it)
+        closer = threading.Thread(target=it.close)
+        closer.start()
+        closer.join()
+        writer = threading.Thread(target=cursor.insert, args=((-2, [2, 2]),))
+        writer.start()
+        writer.join(timeout=10)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual((-2, [2, 2]), cursor.nearest([2, 2], 1)[0])
+
+
+    def test_spatial_join(self):
+        # joins run while a writer splits and condenses the nodes of b
+        data = random_points(1000, seed=24)
+        cursor_a = rtr.RTCursor.bulk_load(data[:500], M=8)
+        cursor_b = concurrency.ConcurrentRTCursor.bulk_load(data[500:], M=8)
+        expected = sorted(rtr.spatial_join(cursor_a, cursor_b, eps=5))
+        errors = []
+        done = threading.Event()
+
+        def write():
+            try:
+                for k, pt in enumerate(random_points(2000, seed=25)):
+                    cursor_b.insert((pt[0] + 2000, [x + 500 for x in pt[1]]))
+                    if k % 2:
+                        cursor_b.delete(pt[0] + 1999)
+            finally:
+                done.set()
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            while not done.is_set():
+                pairs = sorted(rtr.spatial_join(cursor_a, cursor_b, eps=5))
+                if pairs != expected:
+                    errors.append(AssertionError("inconsistent join"))
+        finally:
+            writer.join()
+            sys.setswitchinterval(interval)
+        self.assertEqual([], errors)
+
+
+    def test_copy(self):
+        cursor = concurrency.ConcurrentRTCursor.bulk_load(random_points(300, seed=22), M=8)
+        for restored in [pickle.loads(pickle.dumps(cursor)), copy.deepcopy(cursor)]:
+            self.assertIsInstance(restored, concurrency.ConcurrentRTCursor)
+            self.assertIsNot(cursor.lock, restored.lock)
+            self.assertEqual(sorted(cursor.leaf_of), sorted(restored.leaf_of))
+            restored.insert((-1, [0, 0]))
+
+
+    def test_stress(self):
+        # one writer inserting and deleting while readers check that each
+        # query sees a consistent tree
+        data = random_points(4000, seed=22)
+        cursor = concurrency.ConcurrentRTCursor(rtr.RStarTree(), M=8)
+        everything = rct.Rectangle([-60, -60], [60, 60])
+        errors = []
+        done = threading.Event()
+
+        def write():
+            try:
+                for i, pt in enumerate(data):
+                    cursor.insert(pt)
+                    if i % 3 == 2:
+                        cursor.delete(i - 1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                done.set()
+
+        def read(seed):
+            rng = random.Random(seed)
+            try:
+                while not done.is_set():
+                    with cursor.lock.read_locked():
+                        expected = len(cursor.leaf_of)
+                        found = cursor.search(everything)
+                    if len(found) != expected or len(set(found_id for found_id, _ in found)) != expected:
+                        errors.append(AssertionError("inconsistent search"))
+                    x, y = rng.uniform(-50, 50), rng.uniform(-50, 50)
+                    w = rct.Rectangle([x - 5, y - 5], [x + 5, y + 5])
+                    if any(not w.is_element(P) for _, P in cursor.search(w)):
+                        errors.append(AssertionError("point outside window"))
+                    cursor.nearest([x, y], 3)
+            except Exception as e:
+                errors.append(e)
+
+        # switch threads often, so that unprotected traversals would meet
+        # half-done splits
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        try:
+            threads = [threading.Thread(target=write)]
+            threads += [threading.Thread(target=read, args=(k,)) for k in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        self.assertEqual([], errors)
+        self.assertEqual(len(data) - len(data) // 3, cursor.count(everything))
+
+
+if __name__ == "__main__":
+    unittest.main()
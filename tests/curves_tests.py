@@ -0,0 +1,42 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import itertools
+import unittest
+
+from pyrstar import curves
+
+
+class TestCurveFunctions(unittest.TestCase):
+    def cells(self, d, bits):
+        return [list(c) for c in itertools.product(range(2**bits), repeat=d)]
+
+
+    def test_quantize(self):
+        self.assertEqual([0, 3], curves.quantize([0, 1], [0, 0], [1, 1], 2))
+        self.assertEqual([1, 0], curves.quantize([0.5, 5], [0, 5], [1, 5], 2))
+
+
+    def test_morton_index(self):
+        self.assertEqual(0b1011, curves.morton_index([0b11, 0b01], 2))
+
+
+    def test_hilbert_index_is_bijective(self):
+        for d, bits in [(2, 3), (3, 2), (4, 1)]:
+            indices = sorted(curves.hilbert_index(c, bits) for c in self.cells(d, bits))
+            self.assertEqual(list(range(2**(d*bits))), indices)
+
+
+    def test_hilbert_index_adjacency(self):
+        # consecutive cells along the curve differ by one step along one axis
+        for d, bits in [(2, 3), (3, 2)]:
+            path = sorted(self.cells(d, bits), key = lambda c: curves.hilbert_index(c, bits))
+            for a, b in zip(path, path[1:]):
+                self.assertEqual(1, sum(abs(a[i] - b[i]) for i in range(d)))
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import pathlib
+import random
+import tempfile
+import unittest
+
+from pyrstar import pagefile
+from pyrstar import rectangle as rct
+from pyrstar import rtree as rtr
+
+
+class TestPageFile(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(17)
+        self.pts = [(i, [rng.uniform(-50, 50), rng.uniform(-50, 50)])
+        for i in range(1500)]
+        self.cursor = rtr.RTCursor(rtr.RStarTree(), M=8, policy="quadratic")
+        for pt in self.pts:
+            self.cursor.insert(pt)
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "tree.pages")
+
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+    def test_queries_match_cursor(self):
+        pagefile.write_tree(self.cursor, self.path)
+        with pagefile.PagedTree(self.path) as paged:
+            self.assertEqual(len(self.pts), len(paged))
+            self.assertEqual(self.cursor.root.key, paged.key)
+            for lo, hi in [([-10, -10], [10, 10]), ([-60, 0], [60, 1]),
+            ([-100, -100], [100, 100]), ([70, 70], [80, 80])]:
+                window = rct.Rectangle(lo, hi)
+                self.assertEqual(sorted(self.cursor.search(window)),
+                sorted(paged.search(window)))
+                self.assertEqual(self.cursor.count(window), paged.count(window))
+            for q in [[0, 0], [49.5, -49.5], [200, 3]]:
+                self.assertEqual(self.cursor.nearest(q, 7), paged.nearest(q, 7))
+
+
+    def test_path_and_count(self):
+        # the point count comes from the leaves written, not leaf_of
+        cursor = rtr.RTCursor.bulk_load(self.pts, M=8)
+        pagefile.write_tree(cursor, pathlib.Path(self.path))
+        self.assertIsNone(cursor._leaf_of)
+        with pagefile.PagedTree(self.path) as paged:
+            self.assertEqual(len(self.pts), len(paged))
+        self.assertEqual(["tree.pages"], os.listdir(self.tmpdir.name))
+
+
+    def test_load(self):
+        pagefile.write_tree(self.cursor, self.path)
+        with pagefile.PagedTree(self.path) as paged:
+            cursor = paged.load()
+        self.assertEqual((8, 3, 2, "quadratic"),
+        (cursor.M, cursor.m, cursor.p, cursor.policy))
+        self.assertEqual(self.cursor.root.height, cursor.root.height)
+        self.assertEqual(sorted(self.pts), sorted(rtr.all_points(cursor.root)))
+        self.assertIs(cursor.locate(3), cursor.leaf_of[3])
+        cursor.insert((-1, [0.25, 0.25]))
+
+
+    def test_page_layout(self):
+        pages = pagefile.write_tree(self.cursor, self.path)
+        with pagefile.PagedTree(self.path) as paged:
+            self.assertEqual(pagefile.PAGE_SIZE, paged.page_size)
+            self.assertEqual(pages, paged.page_count)
+            self.assertEqual(pages * paged.page_size, os.path.getsize(self.path))
+            root = paged.node(paged.root_page)
+            self.assertEqual(self.cursor.root.height, root.height)
+            self.assertEqual([ch.key for ch in self.cursor.root.children], root.keys)
+
+        with self.assertRaises(ValueError):
+            pagefile.write_tree(self.cursor, self.path, page_size=64)
+        pagefile.write_tree(self.cursor, self.path, page_size=512)
+        with pagefile.PagedTree(self.path) as paged:
+            self.assertEqual(len(self.pts), paged.count(rct.Rectangle([-50,-50],[50,50])))
+
+
+    def test_empty_tree(self):
+        pagefile.write_tree(rtr.RTCursor(rtr.RStarTree()), self.path)
+        with pagefile.PagedTree(self.path) as paged:
+            self.assertEqual(0, len(paged))
+            self.assertEqual([], paged.search(rct.Rectangle([0,0],[1,1])))
+            self.assertEqual([], paged.nearest([0,0], 3))
+            self.assertTrue(paged.load().root.is_null)
+
+
+    def test_invalid(self):
+        cursor = rtr.RTCursor(rtr.RStarTree())
+        cursor.insert(("a", [0, 0]))
+        with self.assertRaises(ValueError):
+            pagefile.write_tree(cursor, self.path)
+
+        with open(self.path, "wb") as f:
+            f.write(b"not a page file" * 10)
+        with self.assertRaises(ValueError):
+            pagefile.PagedTree(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import tempfile
+import unittest
+
+from pyrstar import pagefile
+from pyrstar import parallel
+from pyrstar import rectangle as rct
+from pyrstar import rtree as rtr
+from tests.rtree_tests import check_fill, check_tight_keys, check_tree, random_points
+
+
+class TestParallelBulkLoad(unittest.TestCase):
+    def check_packed(self, rt, M, m):
+        check_tree(self, rt, M=M)
+        check_fill(self, rt, m)
+        check_tight_keys(self, rt)
+
+
+    def check_cursor(self, cursor, data, M, m):
+        self.assertIsNone(cursor.root.parent)
+        self.check_packed(cursor.root, M, m)
+        self.assertEqual(sorted(k for k, _ in data), sorted(cursor.leaf_of))
+        for lo, hi in [([-10, -10], [20, 5]), ([-60, -60], [60, 60])]:
+            window = rct.Rectangle(lo, hi)
+            self.assertEqual(sorted(x for x in data if window.is_element(x[1])),
+            sorted(cursor.search(window)))
+
+
+    def test_build(self):
+        data = random_points(6000, seed=25)
+        for method in rtr.BULK_LOAD_METHODS:
+            cursor = parallel.parallel_bulk_load(data, method, M=8, max_workers=2)
+            self.check_cursor(cursor, data, 8, 3)
+            self.assertEqual(rtr.RTCursor.bulk_load(data, method, M=8).root.height,
+            cursor.root.height)
+        cursor.insert((-1, [0, 0]))
+        cursor.delete(5)
+
+
+    def test_parameters(self):
+        cursor = parallel.parallel_bulk_load(random_points(3000, d=3, seed=26),
+        M=6, m=2, p=1, policy="linear", max_workers=3)
+        self.assertEqual((6, 2, 1, "linear"), (cursor.M, cursor.m, cursor.p,
+        cursor.policy))
+        self.check_packed(cursor.root, 6, 2)
+
+
+    def test_non_integer_ids(self):
+        data = [(f"p{k}", v) for k, v in random_points(2000, seed=27)]
+        cursor = parallel.parallel_bulk_load(data, M=8, max_workers=2)
+        self.check_cursor(cursor, data, 8, 3)
+
+
+    def test_small_inputs(self):
+        data = random_points(100, seed=28)
+        self.check_cursor(parallel.parallel_bulk_load(data, M=8, max_workers=2),
+        data, 8, 3)
+        self.check_cursor(parallel.parallel_bulk_load(random_points(3000), M=8,
+        max_workers=1), random_points(3000), 8, 3)
+        self.assertTrue(parallel.parallel_bulk_load([], max_workers=2).root.is_null)
+        with self.assertRaises(ValueError):
+            parallel.parallel_bulk_load(data, "unknown")
+
+
+    def test_equal_coordinates(self):
+        # cuts fall on the same coordinates, leaving slabs empty
+        rng = random.Random(29)
+        data = [(i, [rng.choice([-1, 0, 1]), rng.choice([-1, 0, 1])])
+        for i in range(3000)]
+        axis, cuts = parallel.choose_slabs(data, 4)
+        self.assertLess(len(parallel._cut_slabs(data, axis, cuts)), 4)
+        self.check_cursor(parallel.parallel_bulk_load(data, M=8, max_workers=2),
+        data, 8, 3)
+
+
+    def test_choose_slabs(self):
+        rng = random.Random(30)
+        data = [(i, [rng.uniform(0, 10), rng.uniform(0, 100)]) for i in range(4000)]
+        axis, cuts = parallel.choose_slabs(data, 4)
+        self.assertEqual(1, axis)
+        self.assertEqual(sorted(cuts), cuts)
+        for k, cut in enumerate(cuts, 1):
+            self.assertAlmostEqual(25 * k, cut, delta=5)
+
+
+class TestParallelSearcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = random_points(5000, seed=31)
+        cls.cursor = rtr.RTCursor.bulk_load(cls.data, M=8)
+        cls.windows = [rct.Rectangle([-10, -10], [20, 5]), rct.Rectangle([-60, -60], [60, 60]),
+        rct.Rectangle([0, -60], [0.5, 60]), rct.Rectangle([70, 70], [80, 80])]
+
+
+    def brute_force(self, window):
+        return sorted(x for x in self.data if window.is_element(x[1]))
+
+
+    def test_split_queries(self):
+        with parallel.ParallelSearcher(self.cursor, max_workers=2, threshold=0) as searcher:
+            path = searcher._tmp_path
+            for window in self.windows:
+                self.assertEqual(self.brute_force(window), sorted(searcher.search(window)))
+                ids, coords = searcher.search_arrays(window)
+                self.assertEqual(2 * len(ids), len(coords))
+            self.assertEqual(6, searcher.split_queries)
+        self.assertFalse(os.path.exists(path))
+
+
+    def test_threshold(self):
+        with parallel.ParallelSearcher(self.cursor, max_workers=2) as searcher:
+            small = rct.Rectangle([0, 0], [3, 3])
+            self.assertEqual(self.brute_force(small), sorted(searcher.search(small)))
+            self.assertEqual(0, searcher.split_queries)
+            leaves, partial = searcher.plan(self.windows[2])
+            self.assertTrue(all(not covered for _, covered in leaves))
+            self.assertEqual(sum(searcher.tree.entry_count(page) for page, _ in leaves),
+            partial)
+
+
+    def test_page_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tree.pages")
+            pagefile.write_tree(self.cursor, path)
+            with parallel.ParallelSearcher(path, max_workers=2, threshold=0) as searcher:
+                window = self.windows[0]
+                self.assertEqual(self.brute_force(window), sorted(searcher.search(window)))
+
+            pagefile.write_tree(rtr.RTCursor(rtr.RStarTree()), path)
+            with parallel.ParallelSearcher(path, max_workers=2) as searcher:
+                self.assertEqual([], searcher.search(self.windows[1]))
+
+
+    def test_temporary_file_removed_on_error(self):
+        cursor = rtr.RTCursor.bulk_load([(str(k), P) for k, P in self.data[:100]])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            saved, tempfile.tempdir = tempfile.tempdir, tmpdir
+            try:
+                with self.assertRaises(ValueError):
+                    parallel.ParallelSearcher(cursor, max_workers=2)
+            finally:
+                tempfile.tempdir = saved
+            self.assertEqual([], os.listdir(tmpdir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -75,11 +75,31 @@ class TestRectangleMethods(unittest.TestCase):
         self.assertEqual(0, R1.intersection_volume(R2))
 
 
+    def test_intersects(self):
+        R1 = rct.Rectangle([0,0],[1,1])
+        R2 = rct.Rectangle([1,0],[2,1])
+        R3 = rct.Rectangle([1.5,1.5],[2,2])
+        self.assertTrue(R1.intersects(R2))
+        self.assertFalse(R1.intersects(R3))
+
+
     def test_is_element(self):
         R1 = rct.Rectangle([0,0],[1,1])
         self.assertTrue(R1.is_element([0.5,0.5]))
 
 
+    def test_is_on_boundary(self):
+        R1 = rct.Rectangle([0,0],[1,1])
+        self.assertTrue(R1.is_on_boundary([0.5,1]))
+        self.assertFalse(R1.is_on_boundary([0.5,0.5]))
+
+
+    def test_shares_boundary(self):
+        R1 = rct.Rectangle([0,0],[2,2])
+        self.assertTrue(R1.shares_boundary(rct.Rectangle([0,0.5],[1,1])))
+        self.assertFalse(R1.shares_boundary(rct.Rectangle([0.5,0.5],[1,1])))
+
+
     def test_is_proper_superset(self):
         R1 = rct.Rectangle([-1,-1],[1,1])
         R2 = rct.Rectangle([0,0],[1,1])
@@ -100,6 +120,43 @@ class TestRectangleMethods(unittest.TestCase):
         self.assertEqual(R3, R1.union_with_point(P))
 
 
+    def test_expand(self):
+        R1 = rct.Rectangle([-1,-1],[0,0]).copy()
+        R1.expand(rct.Rectangle([0,0],[1,1]))
+        self.assertEqual(rct.Rectangle([-1,-1],[1,1]), R1)
+
+
+    def test_expand_with_point(self):
+        P = [1,1]
+        R1 = rct.bounding_box_points([P])
+        self.assertTrue(R1.is_point)
+        R1.expand_with_point([2,3])
+        self.assertEqual(rct.Rectangle([1,1],[2,3]), R1)
+        self.assertFalse(R1.is_point)
+
+        # the point used to build the rectangle is left alone
+        self.assertEqual([1,1], P)
+
+
+    def test_copy(self):
+        R1 = rct.Rectangle([0,0],[1,1])
+        R2 = R1.copy()
+        R2.expand_with_point([5,5])
+        self.assertEqual([1,1], R1.maxima)
+
+
+    def test_union_volume(self):
+        R1 = rct.Rectangle([-1,-1],[0,0])
+        R2 = rct.Rectangle([0,0],[1,1])
+        self.assertEqual(4, R1.union_volume(R2))
+
+
+    def test_slots(self):
+        R1 = rct.Rectangle([0,0],[1,1])
+        with self.assertRaises(AttributeError):
+            R1.extra = 1
+
+
     def test_center(self):
         R1 = rct.Rectangle([-2,0],[2,2])
         P = [0,1]
@@ -139,6 +196,13 @@ class TestRectangleFunctions(unittest.TestCase):
         self.assertEqual(12, rct.point_to_center_distance_squared(P,R))
 
 
+    def test_point_to_rectangle_distance_squared(self):
+        R = rct.Rectangle([2,2,2],[4,4,4])
+        self.assertEqual(3, rct.point_to_rectangle_distance_squared([1,1,1],R))
+        self.assertEqual(1, rct.point_to_rectangle_distance_squared([3,5,3],R))
+        self.assertEqual(0, rct.point_to_rectangle_distance_squared([3,3,3],R))
+
+
     def test_bounding_box(self):
         R1 = rct.Rectangle([-2,-2],[0,0])
         R2 = rct.Rectangle([-1,-1],[1,1])
@@ -147,6 +211,20 @@ class TestRectangleFunctions(unittest.TestCase):
         self.assertEqual(R1, rct.bounding_box([R1]))
 
 
+    def test_bounding_box_owns_bounds(self):
+        R1 = rct.Rectangle([-2,-2],[0,0])
+        RB = rct.bounding_box([R1])
+        RB.expand_with_point([3,3])
+        self.assertEqual([0,0], R1.maxima)
+
+
+    def test_bounding_box_points_degenerate(self):
+        R = rct.bounding_box_points([[0,0],[0,1]])
+        self.assertEqual([0,0], R.minima)
+        self.assertEqual([0,1], R.maxima)
+        self.assertEqual(0, R.volume())
+
+
     def test_bounding_box_points(self):
         P1 = [1,1]
         P2 = [2,2]
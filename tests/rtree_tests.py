@@ -2,11 +2,17 @@ import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
 
+import copy
+import gc
+import pickle
+import random
+import threading
 import unittest
 import pandas as pd
 
 from pyrstar import rectangle as rct
 from pyrstar import rtree as rtr
+from pyrstar import vectorized as vct
 
 class TestRStarTreeMethods(unittest.TestCase):
     def setUp(self):
@@ -42,6 +48,23 @@ class TestRStarTreeMethods(unittest.TestCase):
         self.assertTrue(rt1 == rt2)
 
 
+    def test_parent_and_height(self):
+        rt1 = rtr.RStarTree(point_data=self.pd1)
+        rt2 = rtr.RStarTree(point_data=self.pd2)
+        rt3 = rtr.RStarTree(children=[rt1])
+        rt3.add_child(rt2)
+        rt4 = rtr.RStarTree(children=[rt3])
+
+        self.assertIs(rt3, rt1.parent)
+        self.assertIs(rt3, rt2.parent)
+        self.assertIs(rt4, rt3.parent)
+        self.assertIsNone(rt4.parent)
+        self.assertEqual([0, 1, 2], [rt1.height, rt3.height, rt4.height])
+
+        rt3.remove_child(rt2)
+        self.assertIsNone(rt2.parent)
+
+
     def test_does_point_to_leaves(self):
         rt1 = rtr.RStarTree(point_data=self.pd1)
         rt2 = rtr.RStarTree(point_data=self.pd2)
@@ -74,6 +97,24 @@ class TestRStarTreeMethods(unittest.TestCase):
         rt1.remove_point_data(2)
 
         self.assertFalse(2 in rt1.points)
+        self.assertEqual(rt1.key.maxima,[1,1])
+
+
+    def test_key_changes_reach_ancestors(self):
+        rt1 = rtr.RStarTree(point_data=self.pd1)
+        rt2 = rtr.RStarTree(point_data=self.pd2)
+        rt3 = rtr.RStarTree(children=[rt1,rt2])
+        rt4 = rtr.RStarTree(children=[rt3])
+
+        rt1.add_point_data(5,[3,3])
+        self.assertEqual(rt4.key.maxima,[3,3])
+
+        rt1.remove_point_data(5)
+        self.assertEqual(rt3.key.maxima,[1.5,1.5])
+        self.assertEqual(rt4.key.maxima,[1.5,1.5])
+
+        rt3.remove_child(rt2)
+        self.assertEqual(rt4.key.minima,[1,1])
 
 
     def test_add_child(self):
@@ -124,6 +165,12 @@ class TestRStarTreeFunctions(unittest.TestCase):
 
         self.assertEqual(rtr.overlap_enlargement_required(rtA,rt2,rt4.key), 0.125)
 
+        # overlap the candidate already has does not count
+        rt5 = rtr.RStarTree(point_data={9: [0.5,0.5], 10: [1.25,1.25]})
+        rtB = rtr.RStarTree(children=[rt1,rt5])
+        entry = rct.Rectangle([1.25,1.25],[1.25,1.25])
+        self.assertEqual(rtr.overlap_enlargement_required(rtB,rt5,entry), 0.0)
+
 
     def test_volume_enlargement_required(self):
         rt = rtr.RStarTree(point_data=self.pd3)
@@ -225,6 +272,44 @@ class TestRStarTreeFunctions(unittest.TestCase):
         self.assertEqual((rt4, 1), rtr.choose_subtree(rtA, 0, test_entry))
 
 
+    def test_choose_subtree_candidates(self):
+        # rt2 needs the least overlap enlargement, rt3 the least volume
+        # enlargement; scoring a single candidate falls back to the latter
+        rt1 = rtr.RStarTree(point_data={"a": [0.5,2.5], "b": [2.5,4.5]})
+        rt2 = rtr.RStarTree(point_data={"c": [2,2.5], "d": [3.5,3.5]})
+        rt3 = rtr.RStarTree(point_data={"e": [2.5,3], "f": [3,4]})
+        rtA = rtr.RStarTree(children=[rt1,rt2,rt3])
+        test_entry = rct.Rectangle([4,0],[4,0])
+
+        self.assertIs(rt2, rtr.choose_subtree(rtA, 0, test_entry)[0])
+        self.assertIs(rt3, rtr.choose_subtree(rtA, 0, test_entry, candidates=1)[0])
+
+
+    def test_default_candidates_prune(self):
+        # with the default parameters, nodes above the leaves hold more
+        # children than are scored for overlap enlargement
+        cursor = rtr.create_tree_from_pts(random_points(1500, seed=37))
+        self.assertEqual(rtr.overlap_candidates, cursor.overlap_candidates)
+        fanouts = [ch.get_child_count() for ch in cursor.root.children]
+        self.assertGreater(min(fanouts), cursor.overlap_candidates)
+
+        scored = []
+        was_enabled, overlap_enlargements = vct.enabled, vct.overlap_enlargements
+        def recording(rt, children, entry):
+            scored.append(len(children))
+            return overlap_enlargements(rt, children, entry)
+        vct.enabled, vct.overlap_enlargements = True, recording
+        try:
+            for pt in random_points(100, seed=38):
+                cursor.insert((pt[0] + 1500, pt[1]))
+        finally:
+            vct.enabled, vct.overlap_enlargements = was_enabled, overlap_enlargements
+        # reinsertions choose subtrees too
+        self.assertGreaterEqual(len(scored), 100)
+        self.assertEqual(cursor.overlap_candidates, max(scored))
+
+
+
     def test_choose_split_axis_leaf(self):
         # given that the node is a leaf, choose the axis along which to perform the split
 
@@ -249,6 +334,43 @@ class TestRStarTreeFunctions(unittest.TestCase):
         pass
 
 
+def random_points(n, d=2, seed=0):
+    rng = random.Random(seed)
+    return [(i, [rng.uniform(-60, 60) for _ in range(d)]) for i in range(n)]
+
+
+def check_tree(test, rt, is_root=True, M=rtr.M):
+    """
+    Checks the R*-tree invariants below rt, returning the depth of its leaves
+    """
+    if rt.is_leaf:
+        test.assertLessEqual(rt.get_point_count(), M)
+        if not is_root:
+            test.assertGreaterEqual(rt.get_point_count(), 1)
+        for v in rt.get_points():
+            test.assertTrue(rt.key.is_element(v))
+        return 0
+
+    test.assertLessEqual(rt.get_child_count(), M)
+    depths = set()
+    for ch in rt.children:
+        test.assertTrue(rt.key.is_proper_superset(ch.key))
+        test.assertIs(rt, ch.parent)
+        depths.add(check_tree(test, ch, False, M))
+    test.assertEqual(1, len(depths))
+    test.assertEqual(rt.height, depths.pop() + 1)
+    return rt.height
+
+
+def all_points(rt):
+    if rt.is_leaf:
+        return list(rt.points.items())
+    result = []
+    for ch in rt.children:
+        result.extend(all_points(ch))
+    return result
+
+
 class TestRTCursorMethods(unittest.TestCase):
     def test_oveflow_treatment_leaf(self):
         pass
@@ -267,17 +389,707 @@ class TestRTCursorMethods(unittest.TestCase):
 
 
     def test_data_insertion(self):
-        pass
+        data = random_points(600)
+        cursor = rtr.create_tree_from_pts(data)
+
+        self.assertGreaterEqual(check_tree(self, cursor.root), 1)
+        self.assertIsNone(cursor.root.parent)
+        check_leaf_index(self, cursor)
+        check_tight_keys(self, cursor.root)
+
+
+    def test_insert_duplicate_id(self):
+        data = random_points(50)
+        cursor = rtr.create_tree_from_pts(data)
+        with self.assertRaises(ValueError):
+            cursor.insert((3, [0, 0]))
+        self.assertEqual(sorted(data), sorted(all_points(cursor.root)))
+
+
+    def test_grid_data_insertion(self):
+        # points sharing coordinates give flat bounding rectangles
+        data = [(i, [i % 7, (i // 7) % 5]) for i in range(300)]
+        cursor = rtr.create_tree_from_pts(data)
+
+        check_tree(self, cursor.root)
+        w = rct.Rectangle([0,0],[3,3])
+        expected = sorted(x for x in data if w.is_element(x[1]))
+        self.assertEqual(expected, sorted(cursor.search(w)))
+
+
+class TestRTCursorSearch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = random_points(600, seed=1)
+        cls.cursor = rtr.create_tree_from_pts(cls.data)
+
+
+    def brute_force(self, window):
+        return sorted(x for x in self.data if window.is_element(x[1]))
+
+
+    def test_search(self):
+        windows = [rct.Rectangle([-10,-10],[20,5]),
+        rct.Rectangle([-60,-60],[60,60]),
+        rct.Rectangle([70,70],[80,80])]
+        for w in windows:
+            self.assertEqual(self.brute_force(w), sorted(self.cursor.search(w)))
+
+
+    def test_search_boundary(self):
+        P_id, P = self.data[17]
+        w = rct.Rectangle(P, [P[0] + 1, P[1] + 1])
+        self.assertIn((P_id, P), self.cursor.search(w))
+
+
+    def test_count(self):
+        w = rct.Rectangle([-30,0],[0,45])
+        self.assertEqual(len(self.brute_force(w)), self.cursor.count(w))
+
+
+    def test_search_empty_tree(self):
+        cursor = rtr.RTCursor(rtr.RStarTree())
+        w = rct.Rectangle([0,0],[1,1])
+        self.assertEqual([], cursor.search(w))
+        self.assertEqual(0, cursor.count(w))
+
+
+class TestRTCursorNearest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = random_points(600, seed=3)
+        cls.cursor = rtr.create_tree_from_pts(cls.data)
+
+
+    def brute_force(self, point, k):
+        kf = lambda x: rtr.point_distance_squared(point, x[1])
+        return sorted(self.data, key = kf)[0:k]
+
+
+    def test_nearest(self):
+        for point in [[0,0], [12.5,-40], [100,100]]:
+            self.assertEqual(self.brute_force(point, 10),
+            self.cursor.nearest(point, 10))
+
+
+    def test_nearest_default_k(self):
+        self.assertEqual(self.brute_force([3,3], 1), self.cursor.nearest([3,3]))
+
+
+    def test_nearest_more_than_size(self):
+        self.assertEqual(600, len(self.cursor.nearest([0,0], 1000)))
+
+
+    def test_iter_nearest(self):
+        point = [-20,7.5]
+        gen = self.cursor.iter_nearest(point)
+        self.assertEqual(self.brute_force(point, 3), [next(gen) for _ in range(3)])
+
+        # resuming continues in distance order
+        self.assertEqual(self.brute_force(point, 5)[3:], [next(gen) for _ in range(2)])
+        self.assertEqual(595, len(list(gen)))
+
+
+    def test_iter_nearest_filtered(self):
+        point = [0,0]
+        odd = next(x for x in self.cursor.iter_nearest(point) if x[0] % 2 == 1)
+        expected = next(x for x in self.brute_force(point, 600) if x[0] % 2 == 1)
+        self.assertEqual(expected, odd)
+
+
+def check_leaf_index(test, cursor):
+    count = 0
+    stack = [cursor.root]
+    while stack:
+        t = stack.pop()
+        if t.is_leaf:
+            for k in t.points:
+                test.assertIs(t, cursor.locate(k))
+                count += 1
+        else:
+            stack.extend(t.children)
+    test.assertEqual(count, len(cursor.leaf_of))
+
+
+def check_tight_keys(test, rt):
+    """
+    Checks that every key below rt is the minimum bounding rectangle of its
+    node's entries
+    """
+    stack = [rt]
+    while stack:
+        t = stack.pop()
+        if t.is_leaf:
+            test.assertEqual(rct.bounding_box_points(t.get_points()), t.key)
+        else:
+            test.assertEqual(rct.bounding_box(t.get_child_rectangles()), t.key)
+            stack.extend(t.children)
+
+
+def check_fill(test, rt, m=rtr.m):
+    stack = [(rt, True)]
+    while stack:
+        t, is_root = stack.pop()
+        count = t.get_point_count() if t.is_leaf else t.get_child_count()
+        if not is_root:
+            test.assertGreaterEqual(count, m)
+        elif not t.is_leaf:
+            test.assertGreaterEqual(count, 2)
+        if not t.is_leaf:
+            stack.extend((ch, False) for ch in t.children)
+
+
+class TestRTCursorDelete(unittest.TestCase):
+    def test_delete(self):
+        data = random_points(800, seed=6)
+        cursor = rtr.RTCursor.bulk_load(data)
+        rng = random.Random(6)
+        to_delete = rng.sample(data, 500)
+        for P_id, P in to_delete:
+            cursor.delete(P_id, P)
+
+        remaining = sorted(x for x in data if x not in to_delete)
+        check_tree(self, cursor.root)
+        check_fill(self, cursor.root)
+        check_leaf_index(self, cursor)
+        check_tight_keys(self, cursor.root)
+        self.assertEqual(remaining, sorted(all_points(cursor.root)))
+
+        w = rct.Rectangle([-30,-30],[30,30])
+        self.assertEqual(sorted(x for x in remaining if w.is_element(x[1])),
+        sorted(cursor.search(w)))
+
+
+    def test_delete_everything(self):
+        data = random_points(300, seed=7)
+        cursor = rtr.create_tree_from_pts(data)
+        for P_id, P in data:
+            cursor.delete(P_id, P)
+        self.assertTrue(cursor.root.is_null)
+
+        cursor.insert(data[0])
+        self.assertEqual([data[0]], cursor.search(rct.Rectangle([-60,-60],[60,60])))
+
+
+    def test_delete_everything_small_fill(self):
+        # m = 1, explicitly and as the default for M = 4: nodes lose their
+        # only child
+        data = random_points(300, seed=34)
+        for params in [{"M": 4}, {"M": 8, "m": 1}]:
+            cursor = rtr.create_tree_from_pts(data, **params)
+            for k, (P_id, _) in enumerate(data):
+                cursor.delete(P_id)
+                self.assertEqual(len(data) - k - 1, len(cursor.leaf_of))
+                if k % 50 == 0:
+                    check_tree(self, cursor.root, M=params["M"])
+                    check_leaf_index(self, cursor)
+            self.assertTrue(cursor.root.is_null)
+
+
+    def test_delete_by_id(self):
+        data = random_points(300, seed=9)
+        cursor = rtr.create_tree_from_pts(data)
+        for P_id, P in data[:200]:
+            cursor.delete(P_id)
+        check_leaf_index(self, cursor)
+        self.assertEqual(sorted(data[200:]), sorted(all_points(cursor.root)))
+        with self.assertRaises(KeyError):
+            cursor.locate(0)
+
+
+    def test_move(self):
+        data = random_points(400, seed=10)
+        cursor = rtr.RTCursor.bulk_load(data)
+        rng = random.Random(10)
+        moved = dict(data)
+        for P_id in rng.sample(range(400), 150):
+            P = [rng.uniform(-60, 60), rng.uniform(-60, 60)]
+            cursor.move(P_id, P)
+            moved[P_id] = P
+
+        check_tree(self, cursor.root)
+        check_leaf_index(self, cursor)
+        self.assertEqual(sorted(moved.items()), sorted(all_points(cursor.root)))
+        self.assertEqual(moved[5], cursor.locate(5).points[5])
+
+
+    def test_update(self):
+        data = random_points(500, seed=11)
+        cursor = rtr.RTCursor.bulk_load(data)
+        rng = random.Random(11)
+        current = dict(data)
+        in_place = 0
+        for _ in range(300):
+            P_id = rng.randrange(500)
+            step = 0.5 if rng.random() < 0.8 else 50
+            P = [x + rng.uniform(-step, step) for x in current[P_id]]
+            in_place += cursor.update(P_id, P)
+            current[P_id] = P
+
+        self.assertGreater(in_place, 0)
+        check_tree(self, cursor.root)
+        check_leaf_index(self, cursor)
+        self.assertEqual(sorted(current.items()), sorted(all_points(cursor.root)))
+        check_tight_keys(self, cursor.root)
+
+
+    def test_no_id_index(self):
+        data = random_points(500, seed=35)
+        cursor = rtr.RTCursor.bulk_load(data, M=8, index_ids=False)
+        rng = random.Random(35)
+        current = dict(data)
+        for P_id in rng.sample(range(500), 200):
+            P = [x + rng.uniform(-1, 1) for x in current[P_id]]
+            cursor.update(P_id, P, current[P_id])
+            current[P_id] = P
+        for P_id in rng.sample(range(500), 300):
+            self.assertIn(P_id, cursor.locate(P_id, current[P_id]).points)
+            cursor.delete(P_id, current.pop(P_id))
+
+        self.assertIsNone(cursor.leaf_of)
+        self.assertEqual(len(current), len(cursor))
+        check_tree(self, cursor.root, M=8)
+        self.assertEqual(sorted(current.items()), sorted(all_points(cursor.root)))
+        with self.assertRaises(ValueError):
+            cursor.locate(next(iter(current)))
+        with self.assertRaises(KeyError):
+            cursor.delete(1000, [0, 0])
+
+
+    def test_delete_missing(self):
+        data = random_points(100, seed=8)
+        cursor = rtr.create_tree_from_pts(data)
+        with self.assertRaises(KeyError):
+            cursor.delete(1000, [0, 0])
+        with self.assertRaises(KeyError):
+            cursor.delete(data[0][0], data[1][1])
+
+
+class TestTreeParameters(unittest.TestCase):
+    def test_defaults(self):
+        cursor = rtr.RTCursor(rtr.RStarTree())
+        self.assertEqual((rtr.M, rtr.m, rtr.p), (cursor.M, cursor.m, cursor.p))
+
+        cursor = rtr.RTCursor(rtr.RStarTree(), M=10)
+        self.assertEqual((10, 4, 3), (cursor.M, cursor.m, cursor.p))
+
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            rtr.RTCursor(rtr.RStarTree(), M=8, m=5)
+        with self.assertRaises(ValueError):
+            rtr.RTCursor(rtr.RStarTree(), M=8, p=0)
+        with self.assertRaises(ValueError):
+            rtr.RTCursor.bulk_load(random_points(10), M=8, m=0)
+
+
+    def test_small_fanout(self):
+        data = random_points(500, seed=12)
+        small = rtr.create_tree_from_pts(data, M=6, m=2, p=2)
+        large = rtr.create_tree_from_pts(data, M=64)
+
+        check_tree(self, small.root, M=6)
+        check_tree(self, large.root, M=64)
+        check_fill(self, small.root, m=2)
+        check_tight_keys(self, small.root)
+        self.assertGreater(small.root.height, large.root.height)
+
+        w = rct.Rectangle([-25,-5],[10,40])
+        self.assertEqual(sorted(small.search(w)), sorted(large.search(w)))
+
+        for P_id, P in data[:400]:
+            small.delete(P_id)
+        check_tree(self, small.root, M=6)
+        check_fill(self, small.root, m=2)
+
+
+    def test_bulk_load_fanout(self):
+        for method in rtr.BULK_LOAD_METHODS:
+            cursor = rtr.RTCursor.bulk_load(random_points(700, seed=13), method, M=9)
+            check_tree(self, cursor.root, M=9)
+            check_fill(self, cursor.root, m=cursor.m)
+
+
+class TestInsertionPolicies(unittest.TestCase):
+    def test_guttman_splits(self):
+        rng = random.Random(14)
+        rects = []
+        for _ in range(rtr.M + 1):
+            c = [rng.uniform(-10, 10), rng.uniform(-10, 10)]
+            rects.append(rct.Rectangle(c, [x + rng.uniform(0.1, 2) for x in c]))
+        for split in [rtr.quadratic_split, rtr.linear_split]:
+            group_1, group_2 = split(rects, rtr.m)
+            self.assertEqual(list(range(rtr.M + 1)), sorted(group_1 + group_2))
+            self.assertGreaterEqual(len(group_1), rtr.m)
+            self.assertGreaterEqual(len(group_2), rtr.m)
+
+
+    def test_quadratic_split_separates_clusters(self):
+        pts = [[0,0],[0.5,0.25],[0.25,0.5],[10,10],[10.5,10.25],[10.25,10.5]]
+        rects = [rct.Rectangle(P, P) for P in pts]
+        group_1, group_2 = rtr.quadratic_split(rects, 2)
+        self.assertEqual([[0,1,2],[3,4,5]], sorted([sorted(group_1), sorted(group_2)]))
+
+
+    def test_policies(self):
+        data = random_points(700, seed=15)
+        w = rct.Rectangle([-20,-35],[25,10])
+        expected = sorted(x for x in data if w.is_element(x[1]))
+        for policy in ["quadratic", "linear"]:
+            cursor = rtr.create_tree_from_pts(data, policy=policy)
+            check_tree(self, cursor.root)
+            check_fill(self, cursor.root)
+            check_tight_keys(self, cursor.root)
+            check_leaf_index(self, cursor)
+            self.assertEqual(expected, sorted(cursor.search(w)))
+
+            cursor.reorganize()
+            check_tree(self, cursor.root)
+            check_leaf_index(self, cursor)
+            self.assertEqual(expected, sorted(cursor.search(w)))
+
+
+    def test_switch_policy(self):
+        data = random_points(400, seed=16)
+        cursor = rtr.create_tree_from_pts(data[:200], policy="linear")
+        cursor.policy = "rstar"
+        for pt in data[200:]:
+            cursor.insert(pt)
+        check_tree(self, cursor.root)
+        self.assertEqual(sorted(data), sorted(all_points(cursor.root)))
+
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            rtr.RTCursor(rtr.RStarTree(), policy="cubic")
+
+
+class TestBulkLoad(unittest.TestCase):
+    def check_fill(self, rt):
+        check_fill(self, rt)
+
+
+    def test_pack_groups(self):
+        sizes = [len(g) for g in rtr.pack_groups(list(range(2 * rtr.M + 1)))]
+        self.assertEqual(2 * rtr.M + 1, sum(sizes))
+        self.assertTrue(all(rtr.m <= x <= rtr.M for x in sizes))
+        self.assertEqual([5], [len(g) for g in rtr.pack_groups(list(range(5)))])
+
+
+    def test_bulk_load(self):
+        for method in rtr.BULK_LOAD_METHODS:
+            for n in [1, rtr.M, rtr.M + 1, 1500]:
+                data = random_points(n, d=3, seed=n)
+                cursor = rtr.RTCursor.bulk_load(data, method)
+                check_tree(self, cursor.root)
+                self.check_fill(cursor.root)
+                self.assertEqual(sorted(data), sorted(all_points(cursor.root)))
+
+
+    def test_bulk_load_then_insert(self):
+        data = random_points(400, seed=4)
+        cursor = rtr.RTCursor.bulk_load(data[:300])
+        for pt in data[300:]:
+            cursor.insert(pt)
+        check_tree(self, cursor.root)
+        w = rct.Rectangle([-20,-20],[20,20])
+        expected = sorted(x for x in data if w.is_element(x[1]))
+        self.assertEqual(expected, sorted(cursor.search(w)))
+
+
+    def test_create_tree_from_pts_method(self):
+        data = random_points(500, seed=5)
+        cursor = rtr.create_tree_from_pts(data, method="hilbert")
+        check_tree(self, cursor.root)
+        self.check_fill(cursor.root)
+        self.assertEqual(self.brute_nearest(data, [1,1], 5), cursor.nearest([1,1], 5))
+
+
+    def brute_nearest(self, data, point, k):
+        kf = lambda x: rtr.point_distance_squared(point, x[1])
+        return sorted(data, key = kf)[0:k]
+
+
+    def test_bulk_load_empty(self):
+        self.assertTrue(rtr.RTCursor.bulk_load([]).root.is_null)
+
+
+    def test_bulk_load_unknown_method(self):
+        with self.assertRaises(ValueError):
+            rtr.RTCursor.bulk_load(random_points(10), "nope")
+
+
+class TestSnapshots(unittest.TestCase):
+    def assert_same_tree(self, rt1, rt2):
+        level1, level2 = [rt1], [rt2]
+        while level1:
+            self.assertEqual([(t.key, t.is_leaf, t.points) for t in level1],
+            [(t.key, t.is_leaf, t.points) for t in level2])
+            level1 = [ch for t in level1 for ch in t.children]
+            level2 = [ch for t in level2 for ch in t.children]
+        self.assertEqual([], level2)
+
+
+    def test_round_trip(self):
+        cursor = rtr.RTCursor(rtr.RStarTree(), M=8, policy="linear",
+        overlap_candidates=4)
+        for pt in random_points(700, d=3, seed=18):
+            cursor.insert(pt)
+        restored = rtr.RTCursor.from_bytes(cursor.to_bytes())
+
+        self.assert_same_tree(cursor.root, restored.root)
+        check_tree(self, restored.root, M=8)
+        self.assertEqual((8, 3, 2, "linear", 4), (restored.M, restored.m,
+        restored.p, restored.policy, restored.overlap_candidates))
+        self.assertEqual(set(cursor.leaf_of), set(restored.leaf_of))
+        restored.insert((-1, [0, 0, 0]))
+        restored.delete(5)
+
+
+    def test_bounds(self):
+        cursor = rtr.RTCursor.bulk_load(random_points(1000, d=3, seed=21), M=8)
+        flat = rtr.flatten_tree(cursor.root, bounds=True)
+        self.assertEqual(2 * 3 * len(flat[0]), len(flat[4]))
+        restored = rtr.build_tree(*flat)
+        self.assert_same_tree(cursor.root, restored)
+        check_tree(self, restored, M=8)
+
+
+    def test_non_integer_ids(self):
+        cursor = rtr.create_tree_from_pts([(f"p{k}", v)
+        for k, v in random_points(300, seed=19)])
+        restored = rtr.RTCursor.from_bytes(cursor.to_bytes())
+        self.assert_same_tree(cursor.root, restored.root)
+
+
+    def test_empty_tree(self):
+        restored = rtr.RTCursor.from_bytes(rtr.RTCursor(rtr.RStarTree()).to_bytes())
+        self.assertTrue(restored.root.is_null)
+
+
+    def test_pickle(self):
+        cursor = rtr.RTCursor.bulk_load(random_points(2000, seed=20))
+        restored = pickle.loads(pickle.dumps(cursor))
+        self.assert_same_tree(cursor.root, restored.root)
+        self.assertEqual(cursor.nearest([3, 3], 4), restored.nearest([3, 3], 4))
+
+        subtree = cursor.root.children[1]
+        copied = copy.deepcopy(subtree)
+        self.assert_same_tree(subtree, copied)
+        self.assertIsNone(copied.parent)
+
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            rtr.RTCursor.from_bytes(b"not a snapshot" * 10)
+
+
+    def test_truncated(self):
+        for ids in [range(300), [f"p{k}" for k in range(300)]]:
+            data = rtr.RTCursor.bulk_load([(k, P) for k, (_, P)
+            in zip(ids, random_points(300, seed=36))], M=8).to_bytes()
+            for end in [rtr.SNAPSHOT_HEADER.size, rtr.SNAPSHOT_HEADER.size + 5,
+            len(data) // 2, len(data) - 1]:
+                with self.assertRaises(ValueError):
+                    rtr.RTCursor.from_bytes(data[:end])
+
+        # a root child count that disagrees with the number of nodes
+        node_count = rtr.SNAPSHOT_HEADER.unpack_from(data)[-2]
+        offset = rtr.SNAPSHOT_HEADER.size + node_count
+        corrupt = bytearray(data)
+        corrupt[offset:offset + 8] = (1000).to_bytes(8, "little")
+        with self.assertRaises(ValueError):
+            rtr.RTCursor.from_bytes(bytes(corrupt))
+
+
+class TestCopyOnWrite(unittest.TestCase):
+    def setUp(self):
+        self.data = random_points(800, seed=22)
+        self.cursor = rtr.RTCursor(rtr.RStarTree(), M=8)
+        for pt in self.data:
+            self.cursor.insert(pt)
+        self.window = rct.Rectangle([-70, -70], [70, 70])
+
+
+    def check_live(self, expected):
+        check_tree(self, self.cursor.root, M=8)
+        check_leaf_index(self, self.cursor)
+        self.assertEqual(sorted(expected.items()), sorted(self.cursor.search(self.window)))
+
+
+    def test_snapshot_unchanged(self):
+        snap = self.cursor.snapshot()
+        expected = dict(self.data)
+        for pt in random_points(400, seed=23):
+            self.cursor.insert((pt[0] + 1000, pt[1]))
+            expected[pt[0] + 1000] = pt[1]
+        for i in range(0, 800, 3):
+            self.cursor.delete(i)
+            del expected[i]
+        for i in range(1, 800, 3):
+            expected[i] = [x + 2 for x in expected[i]]
+            self.cursor.update(i, expected[i])
+
+        self.check_live(expected)
+        self.assertEqual(sorted(self.data), sorted(snap.search(self.window)))
+        self.assertEqual(800, snap.count(self.window))
+        kf = lambda x: rtr.point_distance_squared([5, 5], x[1])
+        self.assertEqual(sorted(self.data, key = kf)[0:4], snap.nearest([5, 5], 4))
+
+
+    def test_untouched_subtrees_shared(self):
+        snap = self.cursor.snapshot()
+        self.cursor.insert((-1, [59, 59]))
+        self.assertIsNot(snap.root, self.cursor.root)
+        shared = [ch for ch in self.cursor.root.children
+        if any(ch is old for old in snap.root.children)]
+        self.assertEqual(len(snap.root.children) - 1, len(shared))
+        self.assertEqual(800, len(all_points(snap.root)))
+
+
+    def test_dropped_snapshot(self):
+        snap = self.cursor.snapshot()
+        self.cursor.insert((-1, [1, 1]))
+        del snap
+        gc.collect()
+        # changed in place again
+        leaf = self.cursor.locate(5)
+        self.cursor.update(5, self.data[5][1])
+        self.assertEqual(-1, self.cursor.frozen_epoch)
+        self.assertIs(leaf, self.cursor.locate(5))
+        expected = dict(self.data)
+        expected[-1] = [1, 1]
+        self.check_live(expected)
+
+
+    def test_versions(self):
+        snaps = [self.cursor.snapshot()]
+        for k in range(3):
+            for i in range(100 * k, 100 * k + 100):
+                self.cursor.delete(i)
+            snaps.append(self.cursor.snapshot())
+        for k, snap in enumerate(snaps):
+            self.assertEqual(sorted(self.data[100 * k:]), sorted(snap.search(self.window)))
+        del snaps[1:3]
+        gc.collect()
+        self.cursor.insert((-1, [0, 0]))
+        self.assertEqual(sorted(self.data), sorted(snaps[0].search(self.window)))
+        self.assertEqual(500, snaps[-1].count(self.window))
+        self.check_live(dict(self.data[300:] + [(-1, [0, 0])]))
+
+
+    def test_reader_thread(self):
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        self.addCleanup(sys.setswitchinterval, interval)
+        snap = self.cursor.snapshot()
+        expected = sorted(self.data)
+        results = []
+
+        def scan():
+            for _ in range(20):
+                results.append(sorted(snap.search(self.window)) == expected)
+
+        reader = threading.Thread(target=scan)
+        reader.start()
+        for pt in random_points(600, seed=24):
+            self.cursor.insert((pt[0] + 1000, pt[1]))
+        for i in range(0, 800, 2):
+            self.cursor.delete(i)
+        reader.join()
+        self.assertEqual([True] * 20, results)
+
+
+class TestSpatialJoin(unittest.TestCase):
+    def setUp(self):
+        self.data_a = random_points(800, seed=32)
+        self.data_b = random_points(400, seed=33)
+        # trees of different heights
+        self.cursor_a = rtr.RTCursor.bulk_load(self.data_a, M=6)
+        self.cursor_b = rtr.create_tree_from_pts(self.data_b)
+
+
+    def brute_force(self, data_a, data_b, test):
+        return sorted((a, b) for a, P in data_a for b, Q in data_b if test(P, Q))
+
+
+    def test_within(self):
+        self.assertNotEqual(self.cursor_a.root.height, self.cursor_b.root.height)
+        for eps in [0.5, 3.0, 20.0]:
+            expected = self.brute_force(self.data_a, self.data_b,
+            lambda P, Q: rtr.point_distance_squared(P, Q) <= eps * eps)
+            self.assertEqual(expected, sorted(rtr.spatial_join(self.cursor_a,
+            self.cursor_b, "within", eps)))
+            self.assertEqual(sorted((b, a) for a, b in expected),
+            sorted(rtr.spatial_join(self.cursor_b, self.cursor_a, eps=eps)))
+
+
+    def test_box(self):
+        expected = self.brute_force(self.data_a, self.data_b,
+        lambda P, Q: all(abs(x - y) <= 2.5 for x, y in zip(P, Q)))
+        self.assertEqual(expected, sorted(rtr.spatial_join(self.cursor_a,
+        self.cursor_b, "box", 2.5)))
+
+
+    def test_predicate_function(self):
+        above = lambda P, Q: P[1] > Q[1]
+        expected = self.brute_force(self.data_a, self.data_b,
+        lambda P, Q: all(abs(x - y) <= 4 for x, y in zip(P, Q)) and above(P, Q))
+        self.assertEqual(expected, sorted(rtr.spatial_join(self.cursor_a,
+        self.cursor_b, above, 4)))
+
+
+    def test_equal_points(self):
+        data_a = [(i, [float(i % 7), float(i % 5), 1.0]) for i in range(200)]
+        data_b = [(i, [float(i % 3), float(i % 4), 1.0]) for i in range(300)]
+        cursor_a = rtr.RTCursor.bulk_load(data_a, M=4)
+        cursor_b = rtr.RTCursor.bulk_load(data_b, M=4)
+        expected = self.brute_force(data_a, data_b, lambda P, Q: P == Q)
+        self.assertEqual(expected, sorted(rtr.spatial_join(cursor_a, cursor_b)))
+
+
+    def test_self_join(self):
+        snap = self.cursor_b.snapshot()
+        pairs = rtr.spatial_join(snap, snap, eps=1.0)
+        self.assertEqual(self.brute_force(self.data_b, self.data_b,
+        lambda P, Q: rtr.point_distance_squared(P, Q) <= 1.0), sorted(pairs))
+        self.assertTrue(all((k, k) in pairs for k, _ in self.data_b))
+
+
+    def test_empty_and_invalid(self):
+        empty = rtr.RTCursor(rtr.RStarTree())
+        self.assertEqual([], rtr.spatial_join(empty, self.cursor_a, eps=1.0))
+        self.assertEqual([], rtr.spatial_join(self.cursor_a, empty, eps=1.0))
+        with self.assertRaises(ValueError):
+            rtr.spatial_join(self.cursor_a, self.cursor_b, "touches")
+        with self.assertRaises(ValueError):
+            rtr.spatial_join(self.cursor_a, self.cursor_b, eps=-1)
 
 
 class TestRStarTreeConditions(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.cursor = rtr.create_tree_from_pts(random_points(600, d=3, seed=2))
+
+
     def test_bounds(self):
-        pass
+        check_tree(self, self.cursor.root)
 
 
     def test_entry_count_nodes(self):
-        pass
+        stack = [self.cursor.root]
+        while stack:
+            t = stack.pop()
+            if not t.is_leaf:
+                self.assertLessEqual(t.get_child_count(), rtr.M)
+                stack.extend(t.children)
 
 
     def test_entry_count_leaves(self):
-        pass
+        stack = [self.cursor.root]
+        while stack:
+            t = stack.pop()
+            if t.is_leaf:
+                self.assertLessEqual(t.get_point_count(), rtr.M)
+            else:
+                stack.extend(t.children)
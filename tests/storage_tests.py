@@ -0,0 +1,201 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import tempfile
+import unittest
+
+from pyrstar import pagefile
+from pyrstar import rectangle as rct
+from pyrstar import rtree as rtr
+from pyrstar import storage
+from tests.rtree_tests import random_points
+
+
+class TestBufferPool(unittest.TestCase):
+    def setUp(self):
+        self.disk = {1: "a", 2: "b", 3: "c"}
+        self.pool = storage.BufferPool(2, self.disk.__getitem__, self.disk.__setitem__)
+
+
+    def test_lru(self):
+        pool = self.pool
+        self.assertEqual("a", pool.get(1))
+        self.assertEqual("b", pool.get(2))
+        self.assertEqual("a", pool.get(1))
+        pool.get(3)
+        self.assertEqual([1, 3], list(pool.frames))
+        self.assertEqual((1, 3, 1), (pool.hits, pool.misses, pool.evictions))
+
+
+    def test_write_back(self):
+        pool = self.pool
+        pool.put(1, "A")
+        pool.get(2)
+        pool.get(3)
+        self.assertEqual("A", self.disk[1])
+        self.assertEqual(1, pool.writes)
+
+        pool.mark_dirty(2)
+        pool.flush()
+        self.assertEqual(2, pool.writes)
+        pool.discard(3)
+        self.assertEqual([2], list(pool.frames))
+
+
+    def test_invalid_capacity(self):
+        with self.assertRaises(ValueError):
+            storage.BufferPool(0, None, None)
+
+
+class TestNodeStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "tree.pages")
+        self.data = random_points(1500, seed=19)
+
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+    def brute_force(self, data, window):
+        return sorted(x for x in data if window.is_element(x[1]))
+
+
+    def check_queries(self, cursor, data):
+        for lo, hi in [([-10, -10], [20, 5]), ([-60, -60], [60, 60]), ([70, 70], [80, 80])]:
+            window = rct.Rectangle(lo, hi)
+            self.assertEqual(self.brute_force(data, window), sorted(cursor.search(window)))
+        kf = lambda x: rtr.point_distance_squared([3, 4], x[1])
+        self.assertEqual(sorted(data, key = kf)[0:5], cursor.nearest([3, 4], 5))
+
+
+    def test_insert_matches_memory_tree(self):
+        with storage.NodeStore(pool_size=8) as store:
+            cursor = store.cursor(M=8)
+            memory = rtr.RTCursor(rtr.RStarTree(), M=8)
+            for pt in self.data:
+                cursor.insert(pt)
+                memory.insert(pt)
+
+            self.assertEqual(memory.root.height, cursor.root.height)
+            self.assertEqual(memory.root.key, cursor.root.key)
+            self.check_queries(cursor, self.data)
+            self.assertLessEqual(len(store.pool.frames), 8)
+            self.assertGreater(store.pool.misses, 0)
+            self.assertGreater(store.pool.writes, 0)
+
+
+    def test_delete_and_update(self):
+        with storage.NodeStore(pool_size=4) as store:
+            cursor = store.bulk_load(self.data, M=8)
+            data = dict(self.data)
+            for i in range(0, 1500, 3):
+                cursor.delete(i, data.pop(i))
+            for i in range(1, 1500, 3):
+                new_point = [x + 0.5 for x in data[i]]
+                cursor.update(i, new_point, data[i])
+                data[i] = new_point
+            self.check_queries(cursor, sorted(data.items()))
+            self.assertEqual(len(data), len(cursor))
+            self.assertIsNone(cursor.leaf_of)
+            with self.assertRaises(ValueError):
+                cursor.delete(1)
+            with self.assertRaises(KeyError):
+                cursor.delete(1, [x + 1 for x in data[1]])
+
+            # pages of dropped nodes are reused
+            pages = store.page_count
+            for pt in random_points(500, seed=20):
+                cursor.insert((pt[0] + 2000, pt[1]))
+                data[pt[0] + 2000] = pt[1]
+            self.assertEqual(len(store.nodes) + len(store.free_pages) + 1,
+            store.page_count)
+            self.assertLess(store.page_count, pages + 150)
+
+            for i, P in data.items():
+                cursor.delete(i, P)
+            self.assertTrue(cursor.root.is_null)
+            self.assertEqual({}, store.nodes)
+
+
+    def test_flush_and_reopen(self):
+        store = storage.NodeStore(self.path, pool_size=16)
+        cursor = store.cursor(M=8, policy="quadratic")
+        for pt in self.data[:1000]:
+            cursor.insert(pt)
+        store.close()
+
+        with pagefile.PagedTree(self.path) as paged:
+            self.check_queries(paged, self.data[:1000])
+
+        with storage.NodeStore(self.path, pool_size=16) as store:
+            cursor = store.cursor()
+            self.assertEqual((8, 3, 2, "quadratic"),
+            (cursor.M, cursor.m, cursor.p, cursor.policy))
+            self.assertEqual(1000, len(cursor))
+            for pt in self.data[1000:]:
+                cursor.insert(pt)
+            self.check_queries(cursor, self.data)
+
+        with storage.NodeStore(self.path) as store:
+            self.check_queries(store.cursor(), self.data)
+            with self.assertRaises(ValueError):
+                store.bulk_load(self.data)
+
+
+    def test_reopen_reads_no_leaf(self):
+        with storage.NodeStore(self.path, pool_size=16) as store:
+            store.bulk_load(self.data, M=8)
+
+        with storage.NodeStore(self.path, pool_size=16) as store:
+            cursor = store.cursor()
+            self.assertEqual(0, store.pool.misses)
+            window = rct.Rectangle([-10, -10], [20, 5])
+            self.assertEqual(self.brute_force(self.data, window),
+            sorted(cursor.search(window)))
+            self.assertLess(store.pool.misses, len(self.data) // 8)
+
+        # nor do changes, beyond those of the leaves they touch
+        with storage.NodeStore(self.path, pool_size=16) as store:
+            cursor = store.cursor()
+            cursor.insert((-1, [0, 0]))
+            cursor.delete(0, self.data[0][1])
+            cursor.update(1, [0, 0], self.data[1][1])
+            leaves = sum(1 for t in store.nodes.values() if t.is_leaf)
+            self.assertLess(store.pool.misses, leaves // 4)
+            self.assertIsNone(cursor.leaf_of)
+        with pagefile.PagedTree(self.path) as paged:
+            self.assertEqual(len(self.data), len(paged))
+
+
+    def test_snapshot(self):
+        with storage.NodeStore(pool_size=4) as store:
+            cursor = store.bulk_load(self.data, M=8)
+            snap = cursor.snapshot()
+            data = dict(self.data)
+            for i in range(0, 1500, 2):
+                cursor.delete(i, data.pop(i))
+            for pt in random_points(300, seed=21):
+                cursor.insert((pt[0] + 2000, pt[1]))
+                data[pt[0] + 2000] = pt[1]
+            self.check_queries(cursor, sorted(data.items()))
+            self.check_queries(snap, self.data)
+
+
+    def test_integer_ids(self):
+        with storage.NodeStore() as store:
+            cursor = store.cursor()
+            cursor.insert((1, [0, 0]))
+            with self.assertRaises(ValueError):
+                cursor.insert(("a", [1, 1]))
+
+        with open(self.path, "wb") as f:
+            f.write(b"not a page file" * 10)
+        with self.assertRaises(ValueError):
+            storage.NodeStore(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import random
+import unittest
+
+from pyrstar import rectangle as rct
+from pyrstar import rtree as rtr
+from pyrstar import vectorized as vct
+
+
+@unittest.skipIf(vct.np is None, "numpy is not installed")
+class TestVectorizedSplits(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+        self.was_enabled = vct.enabled
+
+
+    def tearDown(self):
+        vct.enabled = self.was_enabled
+
+
+    def both_ways(self, f, *args):
+        vct.enabled = False
+        expected = f(*args)
+        vct.enabled = True
+        return expected, f(*args)
+
+
+    def random_leaf(self, d):
+        pts = {i: [self.rng.uniform(-10, 10) for _ in range(d)]
+        for i in range(rtr.M + 1)}
+        return rtr.RStarTree(point_data=pts)
+
+
+    def random_node(self, d):
+        children = []
+        for i in range(rtr.M + 1):
+            c = [self.rng.uniform(-10, 10) for _ in range(d)]
+            pts = {2*i: c, 2*i + 1: [x + self.rng.uniform(0.1, 3) for x in c]}
+            children.append(rtr.RStarTree(point_data=pts))
+        return rtr.RStarTree(children=children)
+
+
+    def test_leaf_split_matches_pure_python(self):
+        for d in [1, 2, 3, 5]:
+            for _ in range(10):
+                t = self.random_leaf(d)
+                expected, result = self.both_ways(rtr.choose_split_axis_leaf, t)
+                self.assertEqual(expected, result)
+                expected, result = self.both_ways(rtr.choose_split_index_leaf, t, result)
+                self.assertEqual(expected, result)
+
+
+    def test_node_split_matches_pure_python(self):
+        for d in [1, 2, 3]:
+            for _ in range(10):
+                t = self.random_node(d)
+                expected, result = self.both_ways(rtr.choose_split_axis, t)
+                self.assertEqual(expected, result)
+                expected, result = self.both_ways(rtr.choose_split_index, t, result)
+                self.assertEqual(expected, result)
+
+
+    def test_choose_subtree_matches_pure_python(self):
+        for d in [2, 3]:
+            for _ in range(10):
+                t = self.random_node(d)
+                E = rct.Rectangle(*[[self.rng.uniform(-10, 10) for _ in range(d)]] * 2)
+                for candidates in [None, 8]:
+                    expected, result = self.both_ways(rtr.choose_subtree, t, 0, E,
+                    None, candidates)
+                    self.assertIs(expected[0], result[0])
+
+
+    def test_overlap_enlargements(self):
+        t = self.random_node(2)
+        E = rct.Rectangle([0, 0], [0.5, 0.5])
+        result = vct.overlap_enlargements(t, t.children, E)
+        for i, ch in enumerate(t.children):
+            self.assertAlmostEqual(rtr.overlap_enlargement_required(t, ch, E), result[i])
+
+
+    def test_leaf_arrays(self):
+        t = rtr.RStarTree(point_data={"a": [1, 2], "b": [3, 4]})
+        ids, coords = vct.leaf_arrays(t)
+        self.assertEqual(["a", "b"], list(ids))
+        self.assertEqual((2, 2), coords.shape)
+        self.assertEqual(4.0, coords[1, 1])
+
+
+
+@unittest.skipIf(vct.np is None, "numpy is not installed")
+class TestBatchedQueries(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(1)
+        cls.data = [(i, [rng.uniform(-60, 60), rng.uniform(-60, 60)]) for i in range(800)]
+        cls.cursor = rtr.RTCursor.bulk_load(cls.data)
+        cls.rng = rng
+
+
+    def test_search_many(self):
+        windows = []
+        for _ in range(50):
+            x, y = self.rng.uniform(-70, 60), self.rng.uniform(-70, 60)
+            windows.append(rct.Rectangle([x, y], [x + 15, y + 10]))
+        offsets, ids, coords = self.cursor.search_many(windows)
+
+        self.assertEqual(len(windows) + 1, len(offsets))
+        for i, w in enumerate(windows):
+            expected = sorted(self.cursor.search(w))
+            result = sorted(zip(ids[offsets[i]:offsets[i+1]],
+            coords[offsets[i]:offsets[i+1]].tolist()))
+            self.assertEqual(expected, result)
+
+
+    def test_search_many_no_windows(self):
+        offsets, ids, coords = self.cursor.search_many([])
+        self.assertEqual([0], list(offsets))
+        self.assertEqual(0, len(ids))
+
+
+    def test_nearest_many(self):
+        points = [[self.rng.uniform(-70, 70), self.rng.uniform(-70, 70)]
+        for _ in range(50)]
+        ids, coords = self.cursor.nearest_many(points, 7)
+
+        self.assertEqual((50, 7), ids.shape)
+        for i, P in enumerate(points):
+            expected = self.cursor.nearest(P, 7)
+            self.assertEqual([x[0] for x in expected], list(ids[i]))
+            self.assertEqual([x[1] for x in expected], coords[i].tolist())
+
+
+    def test_nearest_many_small_tree(self):
+        cursor = rtr.RTCursor.bulk_load(self.data[:5])
+        ids, coords = cursor.nearest_many([[0, 0], [1, 1]], 10)
+        self.assertEqual((2, 5), ids.shape)
+
+        ids, coords = rtr.RTCursor(rtr.RStarTree()).nearest_many([[0, 0]], 3)
+        self.assertEqual((1, 0), ids.shape)
+
+
+    def test_nearest_many_no_points(self):
+        ids, coords = self.cursor.nearest_many([], 7)
+        self.assertEqual((0, 7), ids.shape)
+        self.assertEqual((0, 7, 2), coords.shape)
+
+        ids, coords = rtr.RTCursor.bulk_load(self.data[:5]).nearest_many([], 7)
+        self.assertEqual((0, 5), ids.shape)
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),'..')))
+
+import tempfile
+import threading
+import unittest
+
+from pyrstar import rectangle as rct
+from pyrstar import rtree as rtr
+from pyrstar import wal
+from tests.rtree_tests import random_points
+
+
+class TestWriteAheadLog(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "wal")
+
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+    def test_records(self):
+        log = wal.WriteAheadLog(self.path, batch_size=2)
+        log.append(wal.INSERT, 1, [0.5, 1.5])
+        self.assertEqual(0, log.durable_lsn)
+        log.append(wal.INSERT, "a", [2, 3])
+        self.assertEqual(2, log.durable_lsn)
+        log.append(wal.DELETE, 1)
+        log.append(wal.UPDATE, 2**70, [4, 5])
+        log.close()
+        self.assertEqual(2, log.syncs)
+
+        log = wal.WriteAheadLog(self.path)
+        self.assertEqual([(1, wal.INSERT, 1, [0.5, 1.5]), (2, wal.INSERT, "a", [2, 3]),
+        (3, wal.DELETE, 1, None), (4, wal.UPDATE, 2**70, [4, 5])], list(log.records()))
+        self.assertEqual(5, log.append(wal.DELETE, 2))
+        log.close()
+
+
+    def test_torn_tail(self):
+        log = wal.WriteAheadLog(self.path)
+        for i in range(3):
+            log.append(wal.INSERT, i, [i, i])
+        log.close()
+        size = os.path.getsize(self.path)
+        with open(self.path, "r+b") as f:
+            f.truncate(size - 4)
+
+        log = wal.WriteAheadLog(self.path)
+        self.assertEqual([0, 1], [r[2] for r in log.records()])
+        log.append(wal.INSERT, 7, [7, 7])
+        log.close()
+        log = wal.WriteAheadLog(self.path)
+        self.assertEqual([0, 1, 7], [r[2] for r in log.records()])
+        log.close()
+
+
+    def test_corrupt_record(self):
+        log = wal.WriteAheadLog(self.path)
+        for i in range(3):
+            log.append(wal.INSERT, i, [i, i])
+        log.close()
+        with open(self.path, "r+b") as f:
+            f.seek(os.path.getsize(self.path) - 1)
+            f.write(b"\xff")
+
+        log = wal.WriteAheadLog(self.path)
+        self.assertEqual([0, 1], [r[2] for r in log.records()])
+        log.close()
+
+
+    def test_group_commit(self):
+        log = wal.WriteAheadLog(self.path, batch_size=10**6)
+        barrier = threading.Barrier(8)
+
+        def work(k):
+            for i in range(50):
+                lsn = log.append(wal.INSERT, 1000 * k + i, [k, i])
+                if i % 10 == 0:
+                    barrier.wait()
+                log.commit(lsn)
+                self.assertLessEqual(lsn, log.durable_lsn)
+
+        threads = [threading.Thread(target=work, args=(k,)) for k in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        log.close()
+        self.assertLess(log.syncs, 400)
+        log = wal.WriteAheadLog(self.path)
+        self.assertEqual(400, len(list(log.records())))
+        log.close()
+
+
+class TestDurableIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmpdir.name, "index")
+        self.data = random_points(600, seed=20)
+
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+    def apply_changes(self, index):
+        expected = dict(self.data)
+        for pt in self.data:
+            index.insert(pt)
+        for i in range(0, 600, 4):
+            index.delete(i)
+            del expected[i]
+        for i in range(1, 600, 4):
+            expected[i] = [x + 1 for x in expected[i]]
+            index.update(i, expected[i])
+        return sorted(expected.items())
+
+
+    def contents(self, cursor):
+        return sorted(cursor.search(rct.Rectangle([-100, -100], [100, 100])))
+
+
+    def test_recovery(self):
+        index = wal.DurableIndex(self.dir, M=8, batch_size=16)
+        expected = self.apply_changes(index)
+        index.commit()
+        # crash: the log file goes away without a final commit
+        index.log.file.close()
+
+        index = wal.DurableIndex(self.dir)
+        self.assertEqual(expected, self.contents(index.cursor))
+        self.assertEqual(8, index.cursor.M)
+        self.assertEqual(900, index.replayed)
+        index.close()
+
+
+    def test_uncommitted_changes_are_lost(self):
+        index = wal.DurableIndex(self.dir, batch_size=1000)
+        for pt in self.data[:10]:
+            index.insert(pt)
+        index.log.file.close()
+        index = wal.DurableIndex(self.dir)
+        self.assertTrue(index.cursor.root.is_null)
+        index.close()
+
+
+    def test_checkpoint(self):
+        with wal.DurableIndex(self.dir, M=8) as index:
+            for pt in self.data[:300]:
+                index.insert(pt)
+            index.checkpoint()
+            self.assertEqual(0, os.path.getsize(index.log_path))
+            for pt in self.data[300:]:
+                index.insert(pt)
+
+        with wal.DurableIndex(self.dir) as index:
+            self.assertEqual(300, index.replayed)
+            self.assertEqual(sorted(self.data), self.contents(index.cursor))
+            check = rtr.RTCursor.from_bytes(index.cursor.to_bytes())
+            self.assertEqual(sorted(self.data), self.contents(check))
+
+
+    def test_checkpoint_every(self):
+        with wal.DurableIndex(self.dir, checkpoint_every=100) as index:
+            expected = self.apply_changes(index)
+        with wal.DurableIndex(self.dir) as index:
+            self.assertEqual(0, index.replayed)
+            self.assertEqual(expected, self.contents(index.cursor))
+
+
+    def test_crash_before_truncation(self):
+        index = wal.DurableIndex(self.dir)
+        for pt in self.data[:100]:
+            index.insert(pt)
+        index.commit()
+        index.log.truncate = lambda: None
+        index.checkpoint()
+        index.insert(self.data[100])
+        index.commit()
+        index.log.file.close()
+
+        with wal.DurableIndex(self.dir) as index:
+            self.assertEqual(1, index.replayed)
+            self.assertEqual(sorted(self.data[:101]), self.contents(index.cursor))
+
+
+if __name__ == "__main__":
+    unittest.main()